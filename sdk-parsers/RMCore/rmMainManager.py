@@ -54,6 +54,7 @@ class RMMainManager:
         self.__sysUpgradeFilePath = None
 
         self.__messageQueue = Queue.Queue()
+        self.__heartbeatInterval = 5 * 60 # must stay below the thread watcher timeout
         self.__alexaServer = None
 
     def setup(self):
@@ -91,10 +92,15 @@ class RMMainManager:
             if globalSettings.wizardHasRun:
                 self.__parserThread.run()
 
+            # Sleep until the next parser is due, waking up at least every heartbeat for the thread watcher
             messageLoopTimestamp = int(time.time())
+            wakeUpTimestamp = messageLoopTimestamp + self.__heartbeatInterval
+            nextParserTimestamp = self.__parserThread.getNextRunTimestamp()
+            if nextParserTimestamp is not None:
+                wakeUpTimestamp = max(messageLoopTimestamp + 1, min(wakeUpTimestamp, nextParserTimestamp))
 
             while True:
-                waitTime = 60 + messageLoopTimestamp - int(time.time())
+                waitTime = wakeUpTimestamp - int(time.time())
 
                 if waitTime <= 0:
                     break
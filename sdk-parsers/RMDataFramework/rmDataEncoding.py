@@ -0,0 +1,45 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Encoding of the python values stored in the parser database (parser params, parserData userData).
+# Values are stored as compact JSON behind a version prefix, readable from SQL with
+# json_extract(substr(column, 6), ...). Values that JSON can't represent exactly (tuples, non string
+# keys, custom objects) and the rows written by older versions use pickle.
+#
+
+import json, pickle
+from cStringIO import StringIO
+
+from RMUtilsFramework.rmJson import rmJsonParseString
+
+RMDataEncodingJsonPrefix = "RMJ1:"
+
+def rmIsJsonEncoded(encoded):
+    return encoded.startswith(RMDataEncodingJsonPrefix)
+
+def rmJsonEncodeData(data):
+    ### Returns the prefixed JSON of data or None if decoding it wouldn't give back data.
+    try:
+        text = json.dumps(data, separators = (",", ":"))
+        if rmJsonParseString(text) == data:
+            return RMDataEncodingJsonPrefix + text
+    except Exception:
+        pass
+    return None
+
+def rmJsonDecodeData(encoded):
+    return rmJsonParseString(encoded[len(RMDataEncodingJsonPrefix):])
+
+def rmPickleData(data):
+    outputStream = StringIO()
+    pickler = pickle.Pickler(outputStream)
+    pickler.dump(data)
+    return outputStream.getvalue()
+
+def rmUnpickleData(encoded):
+    inputStream = StringIO(encoded)
+    unpickler = pickle.Unpickler(inputStream)
+    return unpickler.load()
@@ -3,7 +3,7 @@
 # Authors: Nicu Pavel <npavel@mini-box.com>
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
-from RMDataFramework.rmWeatherData import RMWeatherDataType
+from RMDataFramework.rmWeatherData import RMWeatherData, RMWeatherDataType
 from RMUtilsFramework.rmLogging import log
 
 # This is for planet Earth: https://en.wikipedia.org/wiki/List_of_weather_records
@@ -41,6 +41,11 @@ class RMWeatherDataLimits:
 
         return value
 
+    def registerValidators(self):
+        ### Sanitizes every RMWeatherData.setValue() for the keys that have limits.
+        for key in self.limits:
+            RMWeatherData.setValidator(key, self.sanitize)
+
 
 if __name__ == "__main__":
     l = RMWeatherDataLimits()
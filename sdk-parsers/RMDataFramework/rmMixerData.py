@@ -4,9 +4,13 @@
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
 
-from rmWeatherData import RMWeatherData
+from rmWeatherData import RMWeatherData, rmAddCounterProperties
 
 class RMMixerData(RMWeatherData):
+    CounterNames = RMWeatherData.CounterNames + ("minTemp", "maxTemp", "minRH", "maxRH")
+
+    __slots__ = ("minTemp", "maxTemp", "minRH", "maxRH", "et0calc", "et0final")
+
     def __init__(self, timestamp = None, useCounters = False):
         RMWeatherData.__init__(self, timestamp, useCounters)
 
@@ -19,13 +23,6 @@ class RMMixerData(RMWeatherData):
         self.et0calc = None
         self.et0final = None
 
-    def activateCounters(self):
-        RMWeatherData.activateCounters(self)
-        self.minTempCounter = 0
-        self.maxTempCounter = 0
-        self.minRHCounter = 0
-        self.maxRHCounter = 0
-
     def toString(self):
         if self.useCounters:
             text = ", minTemp=" + `self.minTemp` + "/" + `self.minTempCounter` + \
@@ -41,3 +38,5 @@ class RMMixerData(RMWeatherData):
                     ", et0cal=" + `self.et0calc` + ", et0final=" + `self.et0final`
 
         return RMWeatherData.toString(self) + text
+
+rmAddCounterProperties(RMMixerData, len(RMWeatherData.CounterNames))
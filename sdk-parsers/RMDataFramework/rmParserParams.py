@@ -3,23 +3,18 @@
 # Authors: Nicu Pavel <npavel@mini-box.com>
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
-from cStringIO import StringIO
-import pickle
+from rmDataEncoding import rmIsJsonEncoded, rmJsonEncodeData, rmJsonDecodeData, rmPickleData, rmUnpickleData
 
 def RMParserParams_adaptToSQLite(params):
     if params == None:
         return None
 
-    outputStream = StringIO()
-    pickler = pickle.Pickler(outputStream)
-    pickler.dump(params)
-    return outputStream.getvalue()
+    return rmJsonEncodeData(params) or rmPickleData(params)
 
 def RMParserParams_convertFromSQLite(data):
     if data == None:
         return None
 
-    inputStream = StringIO(data)
-    unpickler = pickle.Unpickler(inputStream)
-    return unpickler.load()
-
+    if rmIsJsonEncoded(data):
+        return rmJsonDecodeData(data)
+    return rmUnpickleData(data)
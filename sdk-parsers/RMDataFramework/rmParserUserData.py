@@ -4,8 +4,10 @@
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
 
-from cStringIO import StringIO
-import pickle
+import json
+
+from RMUtilsFramework.rmJson import rmJsonConvertData
+from rmDataEncoding import RMDataEncodingJsonPrefix, rmIsJsonEncoded, rmJsonEncodeData, rmPickleData, rmUnpickleData
 
 class RMParserUserDataTypeEntry:
     def __init__(self, id = None, name = None):
@@ -19,8 +21,10 @@ class RMParserUserData(object):
     cachedIDs = {}      # id -> RMParserUserDataTypeEntry
     cachedNames = {}    # name -> RMParserUserDataTypeEntry
 
-    def __init__(self):
-        self.data = {}
+    def __init__(self, encoded = None):
+        ### encoded is the database value, it's decoded on the first access to data.
+        self.__encoded = encoded
+        self.__data = None if encoded is not None else {}
 
     def __repr__(self):
         text = ""
@@ -30,6 +34,31 @@ class RMParserUserData(object):
             text = text + `key` + "=" + `self.data[key]`
         return text
 
+    def __getstate__(self):
+        return {"data": self.data}
+
+    def __setstate__(self, state):
+        # Also used by the pickles written by older versions
+        self.__encoded = None
+        self.__data = state.get("data", {})
+
+    @property
+    def data(self):
+        if self.__data is None:
+            self.__data = RMUserData_decode(self.__encoded)
+            self.__encoded = None
+        return self.__data
+
+    @data.setter
+    def data(self, data):
+        self.__encoded = None
+        self.__data = data
+
+    @property
+    def encoded(self):
+        ### The database value if data wasn't accessed yet, None otherwise.
+        return self.__encoded
+
     def setValue(self, key,  value):
         if key in RMParserUserData.cachedNames:
             self.data[RMParserUserData.cachedNames[key].id] = value
@@ -37,25 +66,49 @@ class RMParserUserData(object):
     def getValue(self, key):
         if key in RMParserUserData.cachedNames:
             key = RMParserUserData.cachedNames[key].id
-            if key in self.data:
-                return self.data[key]
+            data = self.data
+            if key in data:
+                return data[key]
         return None
 
+#----------------------------------------------------------------------------------------
+# Stored as a JSON object keyed by the userDataType ID ({"3": 1.5}), see rmDataEncoding.
+#
+def RMUserData_decode(encoded):
+    if rmIsJsonEncoded(encoded):
+        return __RMUserData_decodeJson(encoded)
+    return rmUnpickleData(encoded).data
+
+def __RMUserData_decodeJson(encoded):
+    # Flat object of numbers and short strings, converted inline rather than through rmJsonParseString()
+    data = {}
+    for key, value in json.loads(encoded[len(RMDataEncodingJsonPrefix):]).iteritems():
+        if type(value) is unicode:
+            value = value.encode("utf_8")
+        elif type(value) is dict or type(value) is list:
+            value = rmJsonConvertData(value)
+        data[int(key)] = value
+    return data
+
 def RMUserData_adaptToSQLite(userData):
     if userData == None:
         return None
 
-    outputStream = StringIO()
-    pickler = pickle.Pickler(outputStream)
-    pickler.dump(userData)
-    return outputStream.getvalue()
+    # Values read from the database and never accessed are written back unchanged
+    if userData.encoded is not None and rmIsJsonEncoded(userData.encoded):
+        return userData.encoded
+
+    data = userData.data
+    try:
+        encoded = rmJsonEncodeData(dict((str(key), value) for key, value in data.iteritems()))
+        if encoded is not None and __RMUserData_decodeJson(encoded) == data:
+            return encoded
+    except Exception:
+        pass
+    return rmPickleData(userData)
 
 def RMUserData_convertFromSQLite(data):
     if data == None:
         return None
 
-    inputStream = StringIO(data)
-    unpickler = pickle.Unpickler(inputStream)
-    return unpickler.load()
-
-
+    return RMParserUserData(data)
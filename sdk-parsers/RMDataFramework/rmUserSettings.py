@@ -11,6 +11,7 @@ import copy
 from RMUtilsFramework import rmTimeUtils
 from RMUtilsFramework.rmLogging import log
 from RMUtilsFramework.rmTimeUtils import *
+from RMUtilsFramework.rmAstronomy import rmGetAstronomyTable
 import RMUtilsFramework.rmUtils as rmUtils
 from RMDatabaseFramework.rmUserSettingsTable import RMUserSettingsTable
 from RMCore.version import __version__
@@ -104,6 +105,7 @@ class RMUserSettings:
         self.__defaultSettings = None
 
         self.databasePath = None
+        self.databaseStorageProfile = "flash" # "flash" (WAL) or "compatible" (rollback journal), see RMDatabaseStorageProfiles
         self.parserDataSizeInDays = 6
         self.parserHistorySize = 365
         self.mixerHistorySize = 365
@@ -218,6 +220,9 @@ class RMUserSettings:
         if location:
             if self.validateLocationSettings(location):
                 self.location.__dict__.update(location)
+                if self.location.latitude is not None:
+                    # Astronomy table of the new location, shared by the ET formulas and sunrise/sunset
+                    rmGetAstronomyTable(self.location.latitude, self.location.longitude, self.location.elevation).build(rmCurrentTimestamp())
                 self.wizardHasRun = not self.location.timezone is None # Don't check location since sprinkler might be running in AP/no internet mode
                                     #and \
                                     #not self.location.latitude is None and \
@@ -0,0 +1,138 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+from itertools import izip
+
+from RMUtilsFramework.rmLogging import log
+from rmWeatherData import RMWeatherData, rmWeatherDataSetters, rmWeatherDataValidators
+
+#----------------------------------------------------------------------------------------
+# Column oriented parser result: one list of hour timestamps and one aligned list of values
+# per RMWeatherData attribute. Whole time series are bucketed and converted in one pass and
+# RMParserDataTable.addRecords() reads its rows straight from the columns, no RMWeatherData
+# is created on the way.
+#
+class RMWeatherDataFrame(object):
+    ValueNames = RMWeatherData.CounterNames + ("userData", )
+
+    def __init__(self):
+        self.timestamps = []
+        self.columns = {} # attribute name -> values aligned with timestamps
+        self.__rows = {} # timestamp -> row index
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        return iter(self.toWeatherData())
+
+    def __repr__(self):
+        return "(frame rows=" + `len(self.timestamps)` + ", columns=" + `sorted(self.columns.keys())` + ")"
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def addColumn(self, key, timestamps, values, minTimestamp = None):
+        ### Sets the RMWeatherDataType key from aligned timestamps and values. Timestamps are truncated to
+        ### the hour, the ones not after minTimestamp are skipped. Returns the number of values stored.
+        return self.addColumns(timestamps, {key: values}, minTimestamp)
+
+    def addColumns(self, timestamps, columns, minTimestamp = None):
+        ### Same as addColumn() for a {RMWeatherDataType key: values} dict sharing the same timestamps.
+        if None in timestamps:
+            log.error("*** Weather data frame: ignoring values with None timestamps")
+            keep = [index for index, timestamp in enumerate(timestamps) if timestamp is not None]
+            timestamps = [timestamps[index] for index in keep]
+            columns = dict((key, [values[index] for index in keep]) for key, values in columns.items())
+
+        hours = [timestamp - (timestamp % 3600) for timestamp in timestamps]
+        rowIndexes = [self.__getRow(hour) if minTimestamp is None or minTimestamp < hour else None for hour in hours]
+
+        count = 0
+        for key, values in columns.items():
+            entry = rmWeatherDataSetters.get(key, None)
+            if entry is None or entry[0] == "timestamp":
+                log.debug("*** Weather data frame: ignoring unknown column %s" % key)
+                continue
+
+            if len(values) != len(hours):
+                log.error("*** Weather data frame: column %s has %d values for %d timestamps" % (key, len(values), len(hours)))
+                continue
+
+            name, convert = entry
+            column = self.columns.get(name, None)
+            if column is None:
+                column = self.columns[name] = [None] * len(self.timestamps)
+
+            for row, value in izip(rowIndexes, self.__convert(key, convert, values)):
+                if row is not None:
+                    column[row] = value
+                    count += 1
+
+        return count
+
+    def addRecord(self, weatherData):
+        ### Merges the values set in a RMWeatherData, they replace the frame values for that hour.
+        row = self.__getRow(weatherData.timestamp)
+        for name in RMWeatherDataFrame.ValueNames:
+            value = getattr(weatherData, name)
+            if value is not None:
+                column = self.columns.get(name, None)
+                if column is None:
+                    column = self.columns[name] = [None] * len(self.timestamps)
+                column[row] = value
+
+    def rows(self, names):
+        ### Returns [(timestamp, value of names[0], value of names[1], ...), ...] ordered by timestamp.
+        empty = [None] * len(self.timestamps)
+        rows = zip(self.timestamps, *[self.columns.get(name, empty) for name in names])
+        rows.sort()
+        return rows
+
+    def toWeatherData(self):
+        records = []
+        for row in self.rows(RMWeatherDataFrame.ValueNames):
+            weatherData = RMWeatherData(row[0])
+            for name, value in izip(RMWeatherDataFrame.ValueNames, row[1:]):
+                setattr(weatherData, name, value)
+            records.append(weatherData)
+        return records
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def __getRow(self, timestamp):
+        row = self.__rows.get(timestamp, None)
+        if row is None:
+            row = self.__rows[timestamp] = len(self.timestamps)
+            self.timestamps.append(timestamp)
+            for column in self.columns.values():
+                column.append(None)
+        return row
+
+    def __convert(self, key, convert, values):
+        if convert is not None:
+            try:
+                values = [convert(value) if value is not None else None for value in values]
+            except Exception, e:
+                values = [self.__convertValue(key, convert, value) for value in values]
+
+        validator = rmWeatherDataValidators.get(key, None)
+        if validator is not None:
+            values = [validator(key, value) if value is not None else None for value in values]
+
+        return values
+
+    def __convertValue(self, key, convert, value):
+        if value is None:
+            return None
+        try:
+            return convert(value)
+        except Exception, e:
+            log.debug("Can't convert value '%s' to proper category type(%s) because %s" % (value, key, e))
+        return None
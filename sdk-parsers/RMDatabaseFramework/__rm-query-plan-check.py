@@ -0,0 +1,37 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Query plan regression check for the parserData hot queries. Exits with 1 if any of them
+# falls back to a full scan of parserData.
+#
+# python __rm-query-plan-check.py [database file]
+#
+
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import RMDatabaseFramework.rmDatabase
+RMDatabaseFramework.rmDatabase.USE_COMMAND_THREAD__ = False
+
+from RMDatabaseFramework.rmDatabase import RMParsersDatabase
+from RMDatabaseFramework.rmForecastInfoTable import RMForecastTable
+from RMDatabaseFramework.rmParserDataTable import RMParserTable, RMParserDataTable
+
+db = RMParsersDatabase(sys.argv[1] if len(sys.argv) > 1 else ":memory:")
+db.open()
+
+parserTable = RMParserTable(db)
+forecastTable = RMForecastTable(db)
+parserDataTable = RMParserDataTable(db)
+
+failed = parserDataTable.checkQueryPlans()
+for name, details in failed:
+    print "FULL SCAN %s: %s" % (name, " | ".join(details))
+
+if failed:
+    sys.exit(1)
+
+print "All parserData queries use an index"
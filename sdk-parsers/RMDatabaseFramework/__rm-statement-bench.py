@@ -0,0 +1,90 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Per call cost of statement parsing: water log history reads prepared on every call vs reused from
+# the statement cache, and forecast IN lists formatted into the statement vs bound.
+#
+# python __rm-statement-bench.py [iterations]
+#
+
+import sys, os, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import RMDatabaseFramework.rmDatabase
+RMDatabaseFramework.rmDatabase.USE_COMMAND_THREAD__ = False
+
+from RMDatabaseFramework.rmDatabase import RMMainDatabase, RMParsersDatabase
+from RMDatabaseFramework.rmMainDataTable import RMWaterLogTable
+from RMDatabaseFramework.rmForecastInfoTable import RMForecastTable
+
+iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+dayTimestamp = 1500000000 - 1500000000 % 86400
+
+def measure(name, function):
+    startTime = time.time()
+    for i in xrange(iterations):
+        function(i)
+    print "%-48s %8.1f us/call" % (name, (time.time() - startTime) * 1000000.0 / iterations)
+
+#-----------------------------------------------------------------------------------------------------
+# Water log reads through the cached named statements vs the same statement prepared again on every
+# call (sqlite3 keeps at least 5 statements cached, a unique comment makes each text a miss)
+#
+db = RMMainDatabase(":memory:")
+db.open()
+
+waterLogTable = RMWaterLogTable(db)
+for day in xrange(30):
+    for zone in xrange(1, 9):
+        timestamp = dayTimestamp + day * 86400 + zone * 600
+        db.execute(waterLogTable._statements["insert"], (timestamp, 1, zone, 600, 600, 590, 0, "token", dayTimestamp + day * 86400))
+db.commit()
+
+for name in ("recordsBetween", "zoneWatering"):
+    sql = waterLogTable._statements[name]
+    if name == "recordsBetween":
+        params = lambda i: (dayTimestamp + (i % 30) * 86400, dayTimestamp + (i % 30 + 1) * 86400, 100)
+    else:
+        params = lambda i: (i % 8 + 1, dayTimestamp, dayTimestamp + 30 * 86400)
+
+    measure(name + " prepared each call", lambda i: db.execute(sql + " /* %d */" % i, params(i)).fetchall())
+    measure(name + " cached", lambda i: db.execute(sql, params(i)).fetchall())
+
+db.close()
+
+#-----------------------------------------------------------------------------------------------------
+# IN lists of varying length, formatted into the statement text vs bound with inList()
+#
+db = RMParsersDatabase(":memory:")
+db.open()
+db.setStatementStats(True)
+
+forecastTable = RMForecastTable(db)
+for i in xrange(500):
+    forecastTable.addRecord(dayTimestamp + i)
+
+idLists = [random.sample(xrange(1, 501), random.randint(1, 40)) for i in xrange(iterations)]
+
+def formattedIn(i):
+    db.execute("UPDATE forecast SET processed=1 WHERE ID IN(%s)" % ",".join(str(id) for id in idLists[i]))
+
+def boundIn(i):
+    values, params = db.inList(idLists[i])
+    db.execute("UPDATE forecast SET processed=1 WHERE ID IN(%s)" % values, params)
+
+for name, function in (("formatted IN", formattedIn), ("bound IN (json_each=%s)" % db.hasJson, boundIn)):
+    db.setStatementStats(True)
+    measure(name, function)
+    stats = db.getStatementStats()
+    print "    %d executions, %d prepared" % (stats["executions"], stats["misses"])
+
+db.hasJson = False
+db.setStatementStats(True)
+measure("bound IN (padded placeholders)", boundIn)
+stats = db.getStatementStats()
+print "    %d executions, %d prepared" % (stats["executions"], stats["misses"])
+
+db.close()
@@ -0,0 +1,29 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Version 17: secondary indexes on parserData for the parserID/timestamp queries.
+#
+
+from RMUtilsFramework.rmLogging import log
+from RMDatabaseFramework.rmDatabaseManager import globalDbManager
+from RMDatabaseFramework.rmParserDataTable import RMParserDataTable
+
+def performUpdate():
+    database = globalDbManager.parserDatabase
+    if not database or not database.isOpen():
+        return False
+
+    # Creating the table object runs CREATE TABLE/INDEX IF NOT EXISTS
+    parserDataTable = RMParserDataTable(database)
+    database.commit()
+
+    try:
+        for name, details in parserDataTable.checkQueryPlans():
+            log.warning("... parserData query %s still does a full scan: %s" % (name, details))
+    except Exception, e:
+        log.warning("... cannot check parserData query plans: %s" % e)
+
+    return True
@@ -0,0 +1,51 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Version 18: parser params and parserData userData re-encoded from pickle to JSON.
+#
+
+from RMUtilsFramework.rmLogging import log
+from RMDatabaseFramework.rmDatabaseManager import globalDbManager
+from RMDataFramework.rmDataEncoding import RMDataEncodingJsonPrefix
+
+ChunkSize = 1000
+
+def __reencode(database, table, column):
+    ### Reads the pickled values through the column converter and writes them back through the adapter.
+    count = 0
+    lastRowID = 0
+
+    if not database.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table, )).fetchall():
+        return count
+
+    while True:
+        rows = database.execute("SELECT rowid, %s FROM %s WHERE rowid>? AND %s IS NOT NULL AND substr(%s, 1, %d)!=? ORDER BY rowid LIMIT %d" % \
+                                (column, table, column, column, len(RMDataEncodingJsonPrefix), ChunkSize),
+                                (lastRowID, RMDataEncodingJsonPrefix)).fetchall()
+        if not rows:
+            break
+        lastRowID = rows[-1][0]
+        database.executeMany("UPDATE %s SET %s=? WHERE rowid=?" % (table, column), [(row[1], row[0]) for row in rows])
+        count += len(rows)
+    return count
+
+def performUpdate():
+    database = globalDbManager.parserDatabase
+    if not database or not database.isOpen():
+        return False
+
+    try:
+        params = __reencode(database, "parser", "params")
+        userData = __reencode(database, "parserData", "userData")
+        database.commit()
+        log.info("... re-encoded %d parser params and %d parser data user values" % (params, userData))
+    except Exception, e:
+        log.error("... cannot re-encode parser data: %s" % e)
+        return False
+
+    database.vacuum()
+
+    return True
@@ -4,11 +4,14 @@
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
 
-import sqlite3, os
+import sqlite3, os, time, json
+from collections import OrderedDict
+from threading import Condition, local
 
 from RMDataFramework.rmParserUserData import *
 from RMDataFramework.rmParserParams import RMParserParams_adaptToSQLite, RMParserParams_convertFromSQLite
 from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmTimeUtils import rmGetStartOfDay
 from RMUtilsFramework.rmCommandThread import RMCommand, RMCommandThread
 
 USE_COMMAND_THREAD__ = True
@@ -18,8 +21,18 @@ USE_COMMAND_THREAD__ = True
 ##
 ##
 class RMTable(object):
+    # Query methods that may run on a read-only connection from the calling thread, see RMDatabase.executeRead()
+    ReadOnlyMethods = ()
+
+    # Named SQL statements of the table. "%(name)s" is replaced with the table attribute name when the table
+    # is created so each statement has a single constant text, parsed once and reused from the statement cache.
+    Statements = {}
+
     def __init__(self, database):
         self.database = database
+        self._statements = {}
+        for name, sql in type(self).Statements.items():
+            self._statements[name] = sql % self.__dict__ if "%(" in sql else sql
         if(self.database):
             self.initialize()
 
@@ -39,6 +52,10 @@ class RMTable(object):
         elif callable(attr):
             if RMCommandThread.instance.runsOnThisThread():
                 return attr
+            elif name in type(self).ReadOnlyMethods and self.database.usesReadConnections():
+                def wrappedRead(*args, **kwargs):
+                    return self.database.executeRead(attr, *args, **kwargs)
+                return wrappedRead
             else:
                 def wrapped(*args, **kwargs):
                     cmd = RMCommand(name, True)
@@ -56,7 +73,7 @@ class RMTable(object):
 ##
 class RMVersionTable(RMTable):
 
-    CurrentVersion = 16
+    CurrentVersion = 18
 
     def initialize(self):
         if self.database.isOpen():
@@ -84,10 +101,150 @@ class RMVersionTable(RMTable):
             self.database.execute("INSERT INTO version VALUES(?)", (RMVersionTable.CurrentVersion, ))
             self.database.commit()
 
+##-----------------------------------------------------------------------------------------------------
+## SQLite settings applied when a database is opened.
+##
+class RMDatabaseStorageProfile:
+    def __init__(self, name, journalMode, synchronous, cacheSize, mmapSize, tempStore, walAutoCheckpoint = 1000, autoVacuum = "NONE"):
+        self.name = name
+        self.autoVacuum = autoVacuum
+        self.journalMode = journalMode
+        self.synchronous = synchronous
+        self.cacheSize = cacheSize # pages if positive, KiB if negative
+        self.mmapSize = mmapSize # bytes, 0 disables memory mapped I/O
+        self.tempStore = tempStore
+        self.walAutoCheckpoint = walAutoCheckpoint # pages
+
+    def __repr__(self):
+        return "(" + \
+                "name=" + `self.name` + \
+                ", journalMode=" + `self.journalMode` + \
+                ", synchronous=" + `self.synchronous` + \
+                ", cacheSize=" + `self.cacheSize` + \
+                ", mmapSize=" + `self.mmapSize` + \
+                ", tempStore=" + `self.tempStore` + \
+                ", autoVacuum=" + `self.autoVacuum` + \
+                ")"
+
+    @property
+    def usesWAL(self):
+        return self.journalMode.upper() == "WAL"
+
+    def apply(self, cursor):
+        ### Returns the journal mode actually in use, SQLite falls back silently when WAL isn't available.
+        # auto_vacuum only takes effect on an empty database, existing ones are converted by the next full VACUUM
+        cursor.execute("PRAGMA auto_vacuum=%s" % self.autoVacuum)
+        journalMode = cursor.execute("PRAGMA journal_mode=%s" % self.journalMode).fetchone()[0]
+        cursor.execute("PRAGMA synchronous=%s" % self.synchronous)
+        cursor.execute("PRAGMA cache_size=%d" % self.cacheSize)
+        cursor.execute("PRAGMA temp_store=%s" % self.tempStore)
+        if self.mmapSize is not None:
+            cursor.execute("PRAGMA mmap_size=%d" % self.mmapSize)
+        if journalMode.upper() == "WAL":
+            cursor.execute("PRAGMA wal_autocheckpoint=%d" % self.walAutoCheckpoint)
+        return journalMode
+
+RMDatabaseStorageProfiles = {
+    # SQLite defaults: rollback journal and a full fsync on every commit
+    "compatible": RMDatabaseStorageProfile("compatible", "DELETE", "FULL", -2000, None, "DEFAULT"),
+
+    # Write ahead log, fsync only on checkpoints. Readers don't block the writer and a commit
+    # is a sequential append which is much cheaper on flash storage.
+    "flash": RMDatabaseStorageProfile("flash", "WAL", "NORMAL", -2048, 8 * 1024 * 1024, "MEMORY", autoVacuum = "INCREMENTAL"),
+}
+
+##-----------------------------------------------------------------------------------------------------
+## Read-only connections to a WAL database, opened on demand up to size and shared by the threads
+## calling RMTable.ReadOnlyMethods. WAL readers see the last commit and never block the writer.
+##
+class RMDatabaseReadPool:
+    def __init__(self, database, size):
+        self.database = database
+        self.size = size
+        self.closed = False
+
+        self.__condition = Condition()
+        self.__idle = []
+        self.__count = 0
+
+    def acquire(self):
+        with self.__condition:
+            while not self.__idle and self.__count >= self.size:
+                self.__condition.wait()
+            if self.__idle:
+                return self.__idle.pop()
+            self.__count += 1
+
+        try:
+            return self.database.openReadConnection()
+        except:
+            with self.__condition:
+                self.__count -= 1
+                self.__condition.notify()
+            raise
+
+    def release(self, connection):
+        with self.__condition:
+            if self.closed:
+                self.__count -= 1
+                connection.close()
+            else:
+                self.__idle.append(connection)
+            self.__condition.notify()
+
+    def close(self):
+        ### Connections in use are closed when they are released.
+        with self.__condition:
+            self.closed = True
+            for connection in self.__idle:
+                connection.close()
+            self.__count -= len(self.__idle)
+            self.__idle = []
+
+##-----------------------------------------------------------------------------------------------------
+## Replays the executed SQL texts through an LRU of the statement cache size. sqlite3 keeps its prepared
+## statements the same way so a miss is a statement that had to be parsed and prepared again.
+##
+class RMDatabaseStatementStats:
+    def __init__(self, size):
+        self.size = size
+        self.executions = 0
+        self.misses = 0
+        self.startTimestamp = time.time()
+
+        self.__statements = OrderedDict() # sql -> executions
+
+    def record(self, sql):
+        self.executions += 1
+        count = self.__statements.pop(sql, None)
+        if count is None:
+            self.misses += 1
+            count = 0
+            if self.size <= 0:
+                return
+            if len(self.__statements) >= self.size:
+                self.__statements.popitem(False)
+        self.__statements[sql] = count + 1
+
+    def asDict(self):
+        return {
+            "cacheSize": self.size,
+            "executions": self.executions,
+            "misses": self.misses,
+            "hitRatio": 1.0 - float(self.misses) / max(1, self.executions),
+            "cachedStatements": len(self.__statements),
+            "duration": time.time() - self.startTimestamp,
+            "top": sorted(self.__statements.items(), key = lambda item: -item[1])[:10]
+        }
+
 ##-----------------------------------------------------------------------------------------------------
 ##
 ##
 class RMDatabase:
+
+    DefaultStorageProfile = "flash"
+    MaxInListParams = 256 # bound values per inList(), padding included
+
     def __init__(self, fileName):
         self.createIfNotExists = True
         self.fileName = fileName
@@ -96,6 +253,30 @@ class RMDatabase:
 
         self.versionTable = None
 
+        self.storageProfile = RMDatabaseStorageProfiles[RMDatabase.DefaultStorageProfile]
+        self.journalMode = None
+
+        self.incrementalVacuumMinPages = 64 # don't bother below this many free pages
+        self.incrementalVacuumStep = 256 # pages released per incremental_vacuum statement
+        self.incrementalVacuumTimeBudget = 0.5 # seconds per vacuum() call
+        self.fullVacuumFreeRatio = 0.25 # full VACUUM when this fraction of the file is free and incremental vacuum is unavailable
+        self.lastVacuum = None
+
+        self.readConnections = 2 # read-only connections for RMTable.ReadOnlyMethods, 0 runs them on the command thread
+        self.__readPool = None
+        self.__readLocal = local() # cursor of the read connection used by the current thread
+        self.__functions = {} # name -> (paramCount, callable), also registered on the read connections
+
+        self.cachedStatements = 128 # prepared statements kept per connection
+        self.hasJson = False # JSON1 functions available, see inList()
+        self.__statementStats = None
+
+        self.__batchDepth = 0
+
+    def __deepcopy__(self, memo):
+        # Copies of objects holding a table (settings) share the database, its connections and locks can't be copied
+        return self
+
     def open(self):
         global USE_COMMAND_THREAD__
         if USE_COMMAND_THREAD__ and not RMCommandThread.instance.runsOnThisThread():
@@ -108,7 +289,7 @@ class RMDatabase:
         if not self.createIfNotExists and not os.path.exists(self.fileName):
             return False
 
-        self.connection = sqlite3.connect(self.fileName, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.connection = sqlite3.connect(self.fileName, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=self.cachedStatements)
         if(self.connection):
             self.connection.row_factory = sqlite3.Row
             self.connection.text_factory = str
@@ -116,6 +297,23 @@ class RMDatabase:
             self.cursor = self.connection.cursor()
             self.cursor.execute("PRAGMA foreign_keys=1")
 
+            try:
+                self.journalMode = self.storageProfile.apply(self.cursor)
+                if self.storageProfile.usesWAL and self.journalMode.upper() != "WAL":
+                    log.warning("Database %s: WAL journal not available, using %s" % (self.fileName, self.journalMode))
+            except Exception, e:
+                log.error("Database %s: cannot apply storage profile %s" % (self.fileName, self.storageProfile.name))
+                log.exception(e)
+
+            try:
+                self.cursor.execute("SELECT json_valid('[]')")
+                self.hasJson = True
+            except sqlite3.OperationalError:
+                self.hasJson = False
+
+            if self.readConnections > 0 and self.journalMode and self.journalMode.upper() == "WAL" and self.fileName != ":memory:":
+                self.__readPool = RMDatabaseReadPool(self, self.readConnections)
+
             self.versionTable = RMVersionTable(self)
 
             return True
@@ -133,6 +331,10 @@ class RMDatabase:
         return self.__close()
 
     def __close(self):
+        if self.__readPool:
+            self.__readPool.close()
+            self.__readPool = None
+
         if(self.connection):
             self.cursor.close()
             self.cursor = None
@@ -140,34 +342,129 @@ class RMDatabase:
             self.connection = None
 
     def vacuum(self):
+        ### Releases free pages when it's worth it: incrementally if auto_vacuum=INCREMENTAL, otherwise
+        ### with a full VACUUM once the free pages exceed fullVacuumFreeRatio of the file.
         if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
-            self.__vacuum()
+            return self.__vacuum(False)
         else:
             cmd = RMCommand("rmDatabaseVacuum", True)
             cmd.command = self.__vacuum
+            cmd.args = (False, )
             return RMCommandThread.instance.executeCommand(cmd)
 
-    def __vacuum(self):
-        if(self.cursor):
+    def fullVacuum(self):
+        if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
+            return self.__vacuum(True)
+        else:
+            cmd = RMCommand("rmDatabaseFullVacuum", True)
+            cmd.command = self.__vacuum
+            cmd.args = (True, )
+            return RMCommandThread.instance.executeCommand(cmd)
+
+    def getStorageStats(self):
+        if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
+            return self.__getStorageStats()
+        else:
+            cmd = RMCommand("rmDatabaseStorageStats", True)
+            cmd.command = self.__getStorageStats
+            return RMCommandThread.instance.executeCommand(cmd)
+
+    def __getStorageStats(self):
+        if not self.cursor:
+            return None
+
+        stats = {
+            "pageSize": self.cursor.execute("PRAGMA page_size").fetchone()[0],
+            "pageCount": self.cursor.execute("PRAGMA page_count").fetchone()[0],
+            "freePages": self.cursor.execute("PRAGMA freelist_count").fetchone()[0],
+            "autoVacuum": ("NONE", "FULL", "INCREMENTAL")[self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0]],
+            "journalMode": self.journalMode,
+            "lastVacuum": self.lastVacuum
+        }
+        stats["size"] = stats["pageSize"] * stats["pageCount"]
+        stats["freeRatio"] = float(stats["freePages"]) / max(1, stats["pageCount"])
+        return stats
+
+    def __vacuum(self, full):
+        if not self.cursor:
+            return None
+
+        stats = self.__getStorageStats()
+        startTimestamp = time.time()
+        freedPages = 0
+
+        # A database created before auto_vacuum was enabled needs one full VACUUM to switch modes
+        if stats["autoVacuum"] != self.storageProfile.autoVacuum.upper():
+            full = True
+
+        if full or (stats["autoVacuum"] != "INCREMENTAL" and stats["freeRatio"] >= self.fullVacuumFreeRatio):
+            self.__commit()
             self.cursor.execute("VACUUM")
+            mode = "full"
+            freedPages = stats["freePages"]
+        elif stats["autoVacuum"] == "INCREMENTAL" and stats["freePages"] >= self.incrementalVacuumMinPages:
+            mode = "incremental"
+            freePages = stats["freePages"]
+            while freePages > 0 and time.time() - startTimestamp < self.incrementalVacuumTimeBudget:
+                self.cursor.execute("PRAGMA incremental_vacuum(%d)" % self.incrementalVacuumStep).fetchall()
+                remaining = self.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                freedPages += freePages - remaining
+                if remaining >= freePages:
+                    break
+                freePages = remaining
+            self.__commit()
+        else:
+            return None
+
+        self.lastVacuum = {
+            "timestamp": int(startTimestamp),
+            "mode": mode,
+            "freedPages": freedPages,
+            "duration": time.time() - startTimestamp
+        }
+        log.debug("Database %s: %s vacuum released %d of %d free pages in %.3f seconds" % \
+                  (os.path.basename(self.fileName), mode, freedPages, stats["freePages"], self.lastVacuum["duration"]))
+
+        self.__checkpoint()
+        return self.lastVacuum
+
+    def checkpoint(self):
+        if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
+            return self.__checkpoint()
+        else:
+            cmd = RMCommand("rmDatabaseCheckpoint", True)
+            cmd.command = self.__checkpoint
+            return RMCommandThread.instance.executeCommand(cmd)
+
+    def __checkpoint(self):
+        ### Moves the WAL content into the database file and truncates the log.
+        if self.cursor and self.journalMode and self.journalMode.upper() == "WAL":
+            return self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return None
 
     def execute(self, *args):
+        cursor = getattr(self.__readLocal, "cursor", None) or self.cursor
         paramCount = len(args)
-        if(self.cursor and paramCount > 0):
+        if(cursor and paramCount > 0):
+            if self.__statementStats and cursor is self.cursor:
+                self.__statementStats.record(args[0])
             if(paramCount == 1):
-                self.cursor.execute(args[0])
+                cursor.execute(args[0])
             elif(paramCount == 2):
-                self.cursor.execute(args[0], args[1])
-            return self.cursor
+                cursor.execute(args[0], args[1])
+            return cursor
         return None
 
     def executeMany(self, *args):
+        cursor = getattr(self.__readLocal, "cursor", None) or self.cursor
         paramCount = len(args)
-        if(self.cursor and paramCount > 0):
+        if(cursor and paramCount > 0):
+            if self.__statementStats and cursor is self.cursor:
+                self.__statementStats.record(args[0])
             if(paramCount == 1):
-                self.cursor.executemany(args[0])
+                cursor.executemany(args[0])
             elif(paramCount == 2):
-                self.cursor.executemany(args[0], args[1])
+                cursor.executemany(args[0], args[1])
 
     def commit(self):
         if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
@@ -178,9 +475,68 @@ class RMDatabase:
             return RMCommandThread.instance.executeCommand(cmd)
 
     def __commit(self):
+        if self.__batchDepth > 0:
+            return # Deferred to the end of the batch
         if(self.connection):
             self.connection.commit()
 
+    def executeBatch(self, function, *args, **kwargs):
+        ### Runs function(*args, **kwargs) as a single unit of work on the command thread. Table methods
+        ### called from it run directly and all their commits are merged into one at the end. If it raises
+        ### the whole batch is rolled back and the exception is raised to the caller.
+        if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
+            result, error = self.__executeBatch(function, args, kwargs)
+        else:
+            cmd = RMCommand("rmDatabaseBatch", True)
+            cmd.command = self.__executeBatch
+            cmd.args = (function, args, kwargs)
+            result, error = RMCommandThread.instance.executeCommand(cmd) or (None, None)
+
+        if error is not None:
+            raise error
+        return result
+
+    def __executeBatch(self, function, args, kwargs):
+        self.__batchDepth += 1
+        try:
+            result = function(*args, **kwargs)
+        except Exception, e:
+            self.__batchDepth -= 1
+            if self.__batchDepth == 0 and self.connection:
+                self.connection.rollback()
+            return None, e
+
+        self.__batchDepth -= 1
+        self.__commit()
+        return result, None
+
+    def inList(self, values):
+        ### Returns (sql, params) for "column IN (sql)" binding values instead of formatting them into the
+        ### statement, a new statement text for every list would be parsed again and evict the cached ones.
+        values = list(values)
+        if self.hasJson:
+            return "SELECT value FROM json_each(?)", [json.dumps(values)]
+
+        # SQLite allows 999 variables per statement and a statement can hold more than one list: longer
+        # lists (only integer IDs are passed) are formatted into the statement.
+        if len(values) > RMDatabase.MaxInListParams:
+            return ",".join(str(int(value)) for value in values), []
+
+        # Placeholders padded with NULLs to a power of two, NULL never matches so only a few texts are cached
+        size = 1
+        while size < len(values):
+            size *= 2
+        return ",".join("?" * size), values + [None] * (size - len(values))
+
+    def setStatementStats(self, enabled):
+        ### Starts (or stops) counting the statements executed on the main connection, see getStatementStats().
+        self.__statementStats = RMDatabaseStatementStats(self.cachedStatements) if enabled else None
+
+    def getStatementStats(self):
+        if self.__statementStats:
+            return self.__statementStats.asDict()
+        return None
+
     def lastRowId(self):
         if(self.cursor):
             return self.cursor.lastrowid
@@ -192,6 +548,63 @@ class RMDatabase:
     def registerConverter(self, typename, callable):
         sqlite3.register_converter(typename, callable)
 
+    def registerFunction(self, name, paramCount, callable):
+        self.__functions[name] = (paramCount, callable)
+        if not USE_COMMAND_THREAD__ or RMCommandThread.instance.runsOnThisThread():
+            self.__registerFunction(name, paramCount, callable)
+        else:
+            cmd = RMCommand("rmDatabaseRegisterFunction", True)
+            cmd.command = self.__registerFunction
+            cmd.args = (name, paramCount, callable)
+            RMCommandThread.instance.executeCommand(cmd)
+
+    def __registerFunction(self, name, paramCount, callable):
+        if(self.connection):
+            self.connection.create_function(name, paramCount, callable)
+
+    #-----------------------------------------------------------------------------------------------------
+    # Read-only connections. Without them every query waits behind the parser and mixer writes queued on
+    # the command thread, with them history queries run on the calling thread next to the writer.
+    #
+    def usesReadConnections(self):
+        return self.__readPool is not None and self.readConnections > 0
+
+    def executeRead(self, function, *args, **kwargs):
+        ### Runs function(*args, **kwargs) on the calling thread with execute() using a read-only connection.
+        if getattr(self.__readLocal, "cursor", None) is not None:
+            return function(*args, **kwargs) # nested read method
+
+        readPool = self.__readPool
+
+        connection = readPool.acquire()
+        self.__readLocal.cursor = connection.cursor()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.__readLocal.cursor.close()
+            self.__readLocal.cursor = None
+            readPool.release(connection)
+
+    def openReadConnection(self):
+        connection = sqlite3.connect(self.fileName, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     cached_statements=self.cachedStatements)
+        connection.row_factory = sqlite3.Row
+        connection.text_factory = str
+
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA query_only=1")
+        cursor.execute("PRAGMA cache_size=%d" % self.storageProfile.cacheSize)
+        cursor.execute("PRAGMA temp_store=%s" % self.storageProfile.tempStore)
+        if self.storageProfile.mmapSize is not None:
+            cursor.execute("PRAGMA mmap_size=%d" % self.storageProfile.mmapSize)
+        cursor.close()
+
+        for name, (paramCount, callable) in self.__functions.items():
+            connection.create_function(name, paramCount, callable)
+
+        log.debug("Database %s: opened read-only connection" % self.fileName)
+        return connection
+
 ##-----------------------------------------------------------------------------------------------------
 ##
 ##
@@ -206,6 +619,8 @@ class RMParsersDatabase(RMDatabase):
 
             self.registerAdapter(dict, RMParserParams_adaptToSQLite)
             self.registerConverter("RMParaserParams", RMParserParams_convertFromSQLite)
+
+            self.registerFunction("rmStartOfDay", 1, rmGetStartOfDay)
             return True
         return False
 
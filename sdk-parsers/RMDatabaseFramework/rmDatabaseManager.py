@@ -34,7 +34,13 @@ class RMDatabaseManager:
     #
     #
     #
-    def initialize(self, databasePath):
+    def initialize(self, databasePath, storageProfile = None):
+        if storageProfile is not None:
+            if storageProfile in RMDatabaseStorageProfiles:
+                RMDatabase.DefaultStorageProfile = storageProfile
+            else:
+                log.error("Unknown database storage profile %s, using %s" % (storageProfile, RMDatabase.DefaultStorageProfile))
+
         self.mainDatabasePath = os.path.join(databasePath, 'rainmachine-main.sqlite')
         self.parserDatabasePath = os.path.join(databasePath, 'rainmachine-parser.sqlite')
         self.mixerDatabasePath = os.path.join(databasePath, 'rainmachine-mixer.sqlite')
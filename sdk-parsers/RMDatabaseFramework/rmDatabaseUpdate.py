@@ -87,4 +87,10 @@ class RMDatabaseUpdate:
                 log.error(e)
                 return False
 
+            if not success:
+                log.error("... database upgrade %s failed" % scriptName)
+                return False
+
+            globalDbManager.mainDatabase.versionTable.setVersion(version)
+
         return True
@@ -35,8 +35,8 @@ class RMForecastTable(RMTable):
 
     def markRecordsAsProcessed(self, ids):
         if(self.database.isOpen()):
-            ids = ",".join([str(id) for id in ids])
-            self.database.execute("UPDATE forecast SET processed=1 WHERE ID IN(%s)" % ids)
+            values, params = self.database.inList(ids)
+            self.database.execute("UPDATE forecast SET processed=1 WHERE ID IN(%s)" % values, params)
             self.database.commit()
 
     def markAllRecordsAsNotProcessed(self):
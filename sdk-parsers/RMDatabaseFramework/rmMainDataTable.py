@@ -8,7 +8,7 @@ import uuid
 from collections import OrderedDict
 from rmDatabase import RMTable, RMDatabase
 from RMUtilsFramework.rmLogging import log
-from RMUtilsFramework.rmTimeUtils import rmCurrentTimestamp, rmGetStartOfDay, rmTimestampToDateAsString
+from RMUtilsFramework.rmTimeUtils import rmCurrentTimestamp, rmGetStartOfDay, rmGetStartOfDays, rmTimestampToDateAsString
 from RMDataFramework.rmMainDataRecords import RMPastValues, RMAvailableWaterValues
 
 from RMUtilsFramework.rmTimeUtils import rmCurrentDayTimestamp
@@ -444,6 +444,37 @@ class RMStatusTable(RMTable):
 ##
 
 class RMWaterLogTable(RMTable):
+    ReadOnlyMethods = ("getRecords", "getRecordsChunk", "getRecordsEx", "getZoneRealWateringTime", "getLastWatering")
+
+    # The records/totals statements have a variant for each combination of optional timestamp bounds
+    Statements = {
+        "insert": "INSERT OR REPLACE INTO %(_tableName)s VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "update": "UPDATE %(_tableName)s SET real_sec=?, flag=? WHERE ts_started=?",
+        "deleteBefore": "DELETE FROM %(_tableName)s WHERE tokenTimestamp < ?",
+
+        "records": "SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %(_tableName)s "\
+                   "ORDER BY tokenTimestamp, usersch_id, zid LIMIT ?",
+        "recordsFrom": "SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %(_tableName)s "\
+                       "WHERE ?<=tokenTimestamp ORDER BY tokenTimestamp, usersch_id, zid LIMIT ?",
+        "recordsBefore": "SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %(_tableName)s "\
+                         "WHERE tokenTimestamp<? ORDER BY tokenTimestamp, usersch_id, zid LIMIT ?",
+        "recordsBetween": "SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %(_tableName)s "\
+                          "WHERE ?<=tokenTimestamp AND tokenTimestamp<? ORDER BY tokenTimestamp, usersch_id, zid LIMIT ?",
+
+        "totals": "SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %(_tableName)s "\
+                  "GROUP BY tokenTimestamp ORDER BY tokenTimestamp, usersch_id, zid",
+        "totalsFrom": "SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %(_tableName)s "\
+                      "WHERE ?<=tokenTimestamp GROUP BY tokenTimestamp ORDER BY tokenTimestamp",
+        "totalsBefore": "SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %(_tableName)s "\
+                        "WHERE tokenTimestamp<? GROUP BY tokenTimestamp ORDER BY tokenTimestamp",
+        "totalsBetween": "SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %(_tableName)s "\
+                         "WHERE ?<=tokenTimestamp AND tokenTimestamp<? GROUP BY tokenTimestamp ORDER BY tokenTimestamp",
+
+        "zoneWatering": "SELECT SUM(real_sec) FROM %(_tableName)s WHERE zid=? AND ?<=ts_started AND ts_started<?",
+        "programZoneWatering": "SELECT SUM(real_sec) FROM %(_tableName)s WHERE usersch_id=? AND zid=? AND ?<=ts_started AND ts_started<?",
+        "lastWatering": "SELECT * FROM %(_tableName)s ORDER BY ts_started DESC LIMIT 1",
+    }
+
     def __init__(self, database, fake = False):
         self._tableName = "water_log_fake" if fake else "water_log"
         RMTable.__init__(self, database)
@@ -469,7 +500,7 @@ class RMWaterLogTable(RMTable):
 
             self.deleteRecordsByHistory(False)
 
-            self.database.execute("INSERT OR REPLACE INTO %s VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)" % self._tableName,
+            self.database.execute(self._statements["insert"],
                                 (startTime, pid, zid, userDuration, machineDuration, realDuration, flag, token, tokenTimestamp))
             self.database.commit()
             return True
@@ -477,7 +508,7 @@ class RMWaterLogTable(RMTable):
 
     def updateRecord(self, startTime, realDuration, flag):
         if(self.database.isOpen()):
-            self.database.execute("UPDATE %s SET real_sec=?, flag=? WHERE ts_started=?" % self._tableName,
+            self.database.execute(self._statements["update"],
                                 (realDuration, flag, startTime))
             self.database.commit()
             return True
@@ -486,104 +517,139 @@ class RMWaterLogTable(RMTable):
     def deleteRecordsByHistory(self, commit = True):
         if(self.database.isOpen()):
             threshold = rmCurrentDayTimestamp() - globalSettings.waterLogHistorySize * 86400
-            self.database.execute("DELETE FROM %s WHERE tokenTimestamp < ?" % self._tableName, (threshold, ))
+            self.database.execute(self._statements["deleteBefore"], (threshold, ))
             if commit:
                 self.database.commit()
 
     def getRecords(self, minTimestamp, maxTimestamp):
         if(self.database.isOpen()):
-            if minTimestamp and maxTimestamp:
-                records = self.database.execute("SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %s "\
-                                                 "WHERE ?<=tokenTimestamp AND tokenTimestamp<? "\
-                                                 "ORDER BY tokenTimestamp, usersch_id, zid" % self._tableName, (minTimestamp, maxTimestamp)
-                                                )
-            elif minTimestamp:
-                records = self.database.execute("SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %s "\
-                                                 "WHERE ?<=tokenTimestamp "\
-                                                 "ORDER BY tokenTimestamp, usersch_id, zid" % self._tableName, (minTimestamp, )
-                                                )
-            elif maxTimestamp:
-                records = self.database.execute("SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %s "\
-                                                 "WHERE tokenTimestamp<? "\
-                                                 "ORDER BY tokenTimestamp, usersch_id, zid" % self._tableName, (maxTimestamp, )
-                                                )
-            else:
-                records = self.database.execute("SELECT ts_started, usersch_id, zid, user_sec, machine_sec, real_sec, flag, token, tokenTimestamp FROM %s "\
-                                                 "ORDER BY tokenTimestamp, usersch_id, zid" % self._tableName
-                                            )
-
-            tempResults = OrderedDict()
-
-            for row in records:
-                token = row[7]
-                dayTimestamp = rmGetStartOfDay(int(row[8]))
-
-                dayGroup = tempResults.get(dayTimestamp, None)
-                if dayGroup is None:
-                   dayGroup = OrderedDict()
-                   tempResults[dayTimestamp] = dayGroup
-
-                programGroup = dayGroup.get(token, None)
-                if programGroup is None:
-                   programGroup = OrderedDict()
-                   dayGroup[token] = programGroup
-
-                zones = programGroup.get(row[1], None)
-                if zones is None:
-                   zones = OrderedDict()
-                   programGroup[row[1]] = zones
-
-                zone = zones.get(row[2], None)
-                if zone is None:
-                   zone = OrderedDict()
-                   zone["uid"] = row[2]
-                   zone["flag"] = row[6]
-                   zone["cycles"] = []
-                   zones[row[2]] = zone
-
-                cycles = zone["cycles"]
-
-                info = OrderedDict()
-
-                info["id"] = len(cycles) + 1
-                info["startTime"] = rmTimestampToDateAsString(row[0])
-                info["startTimestamp"] = row[0]
-                info["userDuration"] = row[3]
-                info["machineDuration"] = row[4]
-                info["realDuration"] = row[5]
-
-                cycles.append(info)
+            name, params = self.__selectStatement("records", minTimestamp, maxTimestamp)
+            records = self.database.execute(self._statements[name], params + [-1]) # negative LIMIT, all rows
 
-            results = {"days": []}
-
-            for dayTimestamp in tempResults:
-                programs = []
-                day = {
-                    "date": rmTimestampToDateAsString(dayTimestamp, "%Y-%m-%d"),
-                    "dateTimestamp": dayTimestamp,
-                    "programs": programs
-                }
-                results["days"].append(day)
-
-                dayGroup = tempResults[dayTimestamp]
-                for token in dayGroup:
-
-                    tempPrograms = dayGroup[token]
-                    for programId in tempPrograms:
-                        zones = []
-                        program = OrderedDict()
-                        program["id"] = programId
-                        program["zones"] = zones
-                        programs.append(program)
-
-                        tempZones = tempPrograms[programId]
-                        for zoneId in tempZones:
-                            zones.append(tempZones[zoneId])
-
-            return results
+            return {"days": self.__groupDays(records)}
 
         return None
 
+    def iterRecords(self, minTimestamp, maxTimestamp, chunkSize = 500):
+        ### Generator version of getRecords(), yields the items of its "days" list reading about chunkSize
+        ### rows per database command.
+        return self.__iterRecords(minTimestamp, maxTimestamp, chunkSize)
+
+    def __iterRecords(self, minTimestamp, maxTimestamp, chunkSize):
+        # Runs on the caller thread, only getRecordsChunk() touches the database
+        limit = chunkSize
+        while True:
+            records = self.getRecordsChunk(minTimestamp, maxTimestamp, limit)
+            if len(records) < limit:
+                for day in self.__groupDays(records):
+                    yield day
+                return
+
+            # The last day may continue in the next chunk, it's read again from its first row
+            lastDayTimestamp = rmGetStartOfDay(int(records[-1][8]))
+            completeCount = 0
+            while rmGetStartOfDay(int(records[completeCount][8])) != lastDayTimestamp:
+                completeCount += 1
+
+            if completeCount == 0:
+                limit *= 2 # a single day doesn't fit in the chunk
+                continue
+
+            for day in self.__groupDays(records[:completeCount]):
+                yield day
+
+            minTimestamp = records[completeCount][8]
+            limit = chunkSize
+
+    def getRecordsChunk(self, minTimestamp, maxTimestamp, limit):
+        ### The first limit rows of getRecords() in [minTimestamp, maxTimestamp).
+        if(self.database.isOpen()):
+            name, params = self.__selectStatement("records", minTimestamp, maxTimestamp)
+            return self.database.execute(self._statements[name], params + [limit]).fetchall()
+        return []
+
+    def __selectStatement(self, prefix, minTimestamp, maxTimestamp):
+        ### Returns the name of the prefix statement variant for the given bounds and its parameters.
+        if minTimestamp and maxTimestamp:
+            return prefix + "Between", [minTimestamp, maxTimestamp]
+        elif minTimestamp:
+            return prefix + "From", [minTimestamp]
+        elif maxTimestamp:
+            return prefix + "Before", [maxTimestamp]
+        return prefix, []
+
+    def __groupDays(self, records):
+        ### Groups water log rows ordered by tokenTimestamp into days -> programs -> zones -> cycles.
+        tempResults = OrderedDict()
+        dayTimestamps = rmGetStartOfDays([int(row[8]) for row in records])
+
+        for row, dayTimestamp in zip(records, dayTimestamps):
+            token = row[7]
+
+            dayGroup = tempResults.get(dayTimestamp, None)
+            if dayGroup is None:
+               dayGroup = OrderedDict()
+               tempResults[dayTimestamp] = dayGroup
+
+            programGroup = dayGroup.get(token, None)
+            if programGroup is None:
+               programGroup = OrderedDict()
+               dayGroup[token] = programGroup
+
+            zones = programGroup.get(row[1], None)
+            if zones is None:
+               zones = OrderedDict()
+               programGroup[row[1]] = zones
+
+            zone = zones.get(row[2], None)
+            if zone is None:
+               zone = OrderedDict()
+               zone["uid"] = row[2]
+               zone["flag"] = row[6]
+               zone["cycles"] = []
+               zones[row[2]] = zone
+
+            cycles = zone["cycles"]
+
+            info = OrderedDict()
+
+            info["id"] = len(cycles) + 1
+            info["startTime"] = rmTimestampToDateAsString(row[0])
+            info["startTimestamp"] = row[0]
+            info["userDuration"] = row[3]
+            info["machineDuration"] = row[4]
+            info["realDuration"] = row[5]
+
+            cycles.append(info)
+
+        days = []
+
+        for dayTimestamp in tempResults:
+            programs = []
+            day = {
+                "date": rmTimestampToDateAsString(dayTimestamp, "%Y-%m-%d"),
+                "dateTimestamp": dayTimestamp,
+                "programs": programs
+            }
+            days.append(day)
+
+            dayGroup = tempResults[dayTimestamp]
+            for token in dayGroup:
+
+                tempPrograms = dayGroup[token]
+                for programId in tempPrograms:
+                    zones = []
+                    program = OrderedDict()
+                    program["id"] = programId
+                    program["zones"] = zones
+                    programs.append(program)
+
+                    tempZones = tempPrograms[programId]
+                    for zoneId in tempZones:
+                        zones.append(tempZones[zoneId])
+
+        return days
+
     def getRecordsEx(self, minTimestamp, maxTimestamp, withManualPrograms = False):
         if(self.database.isOpen()):
 
@@ -594,25 +660,8 @@ class RMWaterLogTable(RMTable):
             #    sqlCondition = ""
             #    sqlConditionForced = ""
 
-            if minTimestamp and maxTimestamp:
-                records = self.database.execute("SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %s "\
-                                                 "WHERE ?<=tokenTimestamp AND tokenTimestamp<? GROUP BY tokenTimestamp "\
-                                                 "ORDER BY tokenTimestamp" % self._tableName, (minTimestamp, maxTimestamp)
-                                                )
-            elif minTimestamp:
-                records = self.database.execute("SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %s "\
-                                                 "WHERE ?<=tokenTimestamp GROUP BY tokenTimestamp "\
-                                                 "ORDER BY tokenTimestamp" % self._tableName, (minTimestamp, )
-                                                )
-            elif maxTimestamp:
-                records = self.database.execute("SELECT tokenTimestamp, SUM(real_sec), SUM(user_sec) userDuration duration, usersch_id FROM %s "\
-                                                 "WHERE tokenTimestamp<? GROUP BY tokenTimestamp "\
-                                                 "ORDER BY tokenTimestamp" % self._tableName, (maxTimestamp, )
-                                                )
-            else:
-                records = self.database.execute("SELECT tokenTimestamp, SUM(real_sec) realDuration, SUM(user_sec) userDuration, usersch_id FROM %s "\
-                                                 "GROUP BY tokenTimestamp ORDER BY tokenTimestamp, usersch_id, zid" % self._tableName
-                                            )
+            name, params = self.__selectStatement("totals", minTimestamp, maxTimestamp)
+            records = self.database.execute(self._statements[name], params)
 
             tempResults = OrderedDict()
 
@@ -652,10 +701,10 @@ class RMWaterLogTable(RMTable):
     def getZoneRealWateringTime(self, programID, zoneID, minTimestamp, maxTimestamp):
         if(self.database.isOpen()):
             if programID is None:
-                row = self.database.execute("SELECT SUM(real_sec) FROM %s WHERE zid=? AND ?<=ts_started AND ts_started<?" % self._tableName,
+                row = self.database.execute(self._statements["zoneWatering"],
                                                 (zoneID, minTimestamp, maxTimestamp)).fetchone()
             else:
-                row = self.database.execute("SELECT SUM(real_sec) FROM %s WHERE usersch_id=? AND zid=? AND ?<=ts_started AND ts_started<?" % self._tableName,
+                row = self.database.execute(self._statements["programZoneWatering"],
                                                 (programID, zoneID, minTimestamp, maxTimestamp)).fetchone()
 
             if row:
@@ -666,7 +715,7 @@ class RMWaterLogTable(RMTable):
 
     def getLastWatering(self, withManualPrograms = False):
         if (self.database.isOpen()):
-            record = self.database.execute("SELECT * FROM %s ORDER BY ts_started DESC LIMIT 1" % self._tableName).fetchone()
+            record = self.database.execute(self._statements["lastWatering"]).fetchone()
 
             if record:
                 return {
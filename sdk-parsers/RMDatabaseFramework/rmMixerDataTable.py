@@ -16,6 +16,9 @@ from RMUtilsFramework.rmLogging import log
 ##
 ##
 class RMMixerDataTable(RMTable):
+    ReadOnlyMethods = ("getRecordsByThreshold", "getRecordsChunkByThreshold", "getLastRecordsByThreshold",
+                       "getRecordsByForecast", "getRecordsForLastForecast")
+
     def initialize(self):
         self.database.execute("CREATE TABLE IF NOT EXISTS mixerData ("\
                                             "forecastID INTEGER NOT NULL, "\
@@ -69,7 +72,8 @@ class RMMixerDataTable(RMTable):
                                value.et0final
                                 ) for value in values]
 
-            self.database.executeMany("INSERT INTO mixerData(forecastID, forecastTimestamp, timestamp, "\
+            # A forecast mixed again replaces its values for the same days
+            self.database.executeMany("INSERT OR REPLACE INTO mixerData(forecastID, forecastTimestamp, timestamp, "\
                                       "temperature, rh, wind, solarRad, skyCover, rain, et0, pop, qpf, "\
                                       "condition, pressure, dewPoint, "\
                                       "minTemp, maxTemp, minRH, maxRH, et0calc, et0final) "\
@@ -83,6 +87,13 @@ class RMMixerDataTable(RMTable):
                                   "WHERE timestamp=? ", timestampsToDelete)
             self.database.commit()
 
+    def deleteRecordsByDays(self, dayTimestamps, commit = True):
+        ### Removes the values of these days from every forecast.
+        if(self.database.isOpen()):
+            self.database.executeMany("DELETE FROM mixerData WHERE timestamp=?", [(dayTimestamp, ) for dayTimestamp in dayTimestamps])
+            if commit:
+                self.database.commit()
+
     def getRecordsByThreshold(self, minTimestamp = None, maxTimestamp = None, orderAsc = True, asDict = False):
         result = []
         if(self.database.isOpen()):
@@ -125,6 +136,77 @@ class RMMixerDataTable(RMTable):
 
         return result
 
+    def iterRecordsByThreshold(self, minTimestamp = None, maxTimestamp = None, orderAsc = True, chunkSize = 500):
+        ### Generator version of getRecordsByThreshold(), yields RMMixerData reading chunkSize rows per database command.
+        ### Rows are resumed after the (timestamp, forecastID) of the last one so each chunk is a separate query.
+        return self.__iterRecordsByThreshold(minTimestamp, maxTimestamp, orderAsc, chunkSize)
+
+    def __iterRecordsByThreshold(self, minTimestamp, maxTimestamp, orderAsc, chunkSize):
+        # Runs on the caller thread, only getRecordsChunkByThreshold() touches the database
+        after = None
+        while True:
+            records = self.getRecordsChunkByThreshold(minTimestamp, maxTimestamp, orderAsc, after, chunkSize)
+            for forecastID, mixerData in records:
+                yield mixerData
+
+            if len(records) < chunkSize:
+                return
+            after = (records[-1][1].timestamp, records[-1][0])
+
+    def getRecordsChunkByThreshold(self, minTimestamp, maxTimestamp, orderAsc, after, limit):
+        ### Returns [(forecastID, RMMixerData), ...], the first limit records after the (timestamp, forecastID) after.
+        result = []
+        if(self.database.isOpen()):
+            conditions = []
+            params = []
+            if maxTimestamp is not None:
+                conditions.append("?<=timestamp AND timestamp<?")
+                params.extend([minTimestamp, maxTimestamp])
+            elif minTimestamp is not None:
+                conditions.append("timestamp=?")
+                params.append(minTimestamp)
+
+            order = "ASC"
+            compare = ">"
+            if not orderAsc:
+                order = "DESC"
+                compare = "<"
+
+            if after is not None:
+                conditions.append("(timestamp%s? OR (timestamp=? AND forecastID%s?))" % (compare, compare))
+                params.extend([after[0], after[0], after[1]])
+
+            where = ""
+            if conditions:
+                where = "WHERE " + " AND ".join(conditions) + " "
+            params.append(limit)
+
+            cursor = self.database.execute("SELECT * FROM mixerData " + where + "ORDER BY timestamp " + order + ", forecastID " + order + " LIMIT ?", params)
+            for row in cursor.fetchall():
+                mixerData = RMMixerData(row[2])
+                mixerData.temperature = row[3]
+                mixerData.rh = row[4]
+                mixerData.wind = row[5]
+                mixerData.solarRad = row[6]
+                mixerData.skyCover = row[7]
+                mixerData.rain = row[8]
+                mixerData.et0 = row[9]
+                mixerData.pop = row[10]
+                mixerData.qpf = row[11]
+                mixerData.condition = row[12]
+                mixerData.pressure = row[13]
+                mixerData.dewPoint = row[14]
+                mixerData.minTemp = row[15]
+                mixerData.maxTemp = row[16]
+                mixerData.minRH = row[17]
+                mixerData.maxRH = row[18]
+                mixerData.et0calc = row[19]
+                mixerData.et0final = row[20]
+
+                result.append((row[0], mixerData))
+
+        return result
+
     def getLastRecordsByThreshold(self, minTimestamp = None, maxTimestamp = None, orderAsc = True, asDict = False, noOfRecords = None):
         if asDict:
             result = OrderedDict()
@@ -138,19 +220,19 @@ class RMMixerDataTable(RMTable):
             if not orderAsc:
                 order = "DESC"
 
-            limit = ""
-            if noOfRecords:
-                limit = " LIMIT %d" % noOfRecords
+            # Bound so the statement text doesn't change with the record count, a negative LIMIT returns all rows
+            limit = " LIMIT ?"
+            noOfRecords = noOfRecords or -1
 
             if minTimestamp is None and maxTimestamp is None:
-                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData GROUP BY timestamp ORDER BY timestamp " + order + limit)
+                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData GROUP BY timestamp ORDER BY timestamp " + order + limit, (noOfRecords, ))
             elif minTimestamp is None:
-                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData WHERE timestamp<=? GROUP BY timestamp ORDER BY timestamp " + order + limit, (maxTimestamp, ))
+                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData WHERE timestamp<=? GROUP BY timestamp ORDER BY timestamp " + order + limit, (maxTimestamp, noOfRecords))
             elif maxTimestamp is None:
-                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData WHERE ?<=timestamp GROUP BY timestamp ORDER BY timestamp " + order + limit, (minTimestamp, ))
+                cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData WHERE ?<=timestamp GROUP BY timestamp ORDER BY timestamp " + order + limit, (minTimestamp, noOfRecords))
             else:
                 cursor = self.database.execute("SELECT MAX(forecastID), * FROM mixerData WHERE ?<=timestamp AND timestamp<=? GROUP BY timestamp ORDER BY timestamp " + order + limit,
-                                    (minTimestamp, maxTimestamp, ))
+                                    (minTimestamp, maxTimestamp, noOfRecords))
 
             for row in cursor:
                 mixerData = RMMixerData(row[3])
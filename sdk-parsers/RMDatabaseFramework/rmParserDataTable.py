@@ -5,12 +5,14 @@
 
 
 from collections import OrderedDict
+from bisect import bisect_right
 
 from RMDataFramework.rmForecastInfo import RMForecastInfo
 from RMDataFramework.rmWeatherData import RMWeatherData
+from RMDataFramework.rmWeatherDataFrame import RMWeatherDataFrame
 from RMDataFramework.rmParserConfig import RMParserConfig
 from RMDataFramework.rmUserSettings import globalSettings
-from RMUtilsFramework.rmTimeUtils import rmTimestampToDateAsString, rmGetStartOfDay, rmCurrentDayTimestamp, rmNormalizeTimestamp
+from RMUtilsFramework.rmTimeUtils import rmTimestampToDateAsString, rmGetStartOfDay, rmGetStartOfDays, rmCurrentDayTimestamp, rmNormalizeTimestamp
 from rmDatabase import RMTable
 from RMUtilsFramework.rmLogging import log
 
@@ -90,6 +92,15 @@ class RMParserTable(RMTable):
                 return RMParserConfig(row[0], filename, name, row[1])
         return None
 
+    def getParserConfigsWithParams(self):
+        ### Returns {(fileName, name): (RMParserConfig, params)} for all registered parsers.
+        results = {}
+        if(self.database.isOpen()):
+            rows = self.database.execute("SELECT ID, fileName, name, enabled, params FROM parser")
+            for row in rows:
+                results[(row[1], row[2])] = (RMParserConfig(row[0], row[1], row[2], row[3]), row[4])
+        return results
+
     def getAllParsers(self):
         if(self.database.isOpen()):
             results = []
@@ -146,7 +157,13 @@ class RMParserUserDataTable(RMTable):
 ##
 ##
 class RMParserDataTable(RMTable):
+    ReadOnlyMethods = ("getLastForecastByParser", "getLatestRecordsKeys", "getRecordsForKey",
+                       "getRecordsByParserName", "getRecordsByParserID",
+                       "getParserIDsByName", "getForecastsByParserIDs", "getRecordsByForecastIDs")
+
     def initialize(self):
+        self.__archiveWatermarks = {} # parserID -> timestamp of the oldest not archived row, see deleteRecordsHistoryByDayThreshold()
+
         self.database.execute("CREATE TABLE IF NOT EXISTS parserData ("\
                                             "forecastID INTEGER NOT NULL, "\
                                             "parserID INTEGER NOT NULL, "\
@@ -173,50 +190,61 @@ class RMParserDataTable(RMTable):
                                             "FOREIGN KEY(parserID) REFERENCES parser(ID), "\
                                             "PRIMARY KEY(forecastID, parserID, timestamp)"\
                                             ")")
+        self.createIndexes()
+        self.__createArchiveTables()
         self.database.commit()
 
+    def __createArchiveTables(self):
+        # Work tables of __archiveHistory(), created here once per connection: sqlite3 commits the open
+        # transaction before a CREATE statement, that would break the batch clearHistory() runs in.
+        self.database.execute("CREATE TEMP TABLE IF NOT EXISTS parserDataArchive ("\
+                                "rowID INTEGER PRIMARY KEY, forecastID INTEGER, day INTEGER, forecastDay INTEGER, timestamp NUMERIC, archived INTEGER)")
+        self.database.execute("CREATE INDEX IF NOT EXISTS temp.parserDataArchive_day ON parserDataArchive(day, timestamp, forecastID)")
+        self.database.execute("CREATE TEMP TABLE IF NOT EXISTS parserDataArchiveDays ("\
+                                "day INTEGER PRIMARY KEY, rowID INTEGER, forecastID INTEGER, forecastDay INTEGER, archived INTEGER)")
+
+    def createIndexes(self):
+        ### Secondary indexes for the parserID/timestamp access paths, the primary key only serves forecastID lookups.
+        ### forecastID is part of the first one so the join with forecast and the per forecast ordering don't need the row.
+        if self.database.isOpen():
+            self.database.execute("CREATE INDEX IF NOT EXISTS parserData_parserID_timestamp ON parserData(parserID, timestamp, forecastID)")
+            self.database.execute("CREATE INDEX IF NOT EXISTS parserData_timestamp ON parserData(timestamp)")
+
+    # Parser values in the parserData INSERT column order, see __getRecordRows()
+    RecordFields = ("temperature", "minTemperature", "maxTemperature", "rh", "minRh", "maxRh",
+                    "wind", "solarRad", "skyCover", "rain", "et0", "pop", "qpf",
+                    "condition", "pressure", "dewPoint", "userData")
+
     def addRecords(self, forecastID, parserID, values):
+        ### values is a list of RMWeatherData or a RMWeatherDataFrame.
         if(self.database.isOpen()):
+            rows = self.__getRecordRows(values)
 
-            minMaxMap = {}
-            for value in values:
-                dayTimestamp = rmGetStartOfDay(value.timestamp)
-                minMax = minMaxMap.get(dayTimestamp)
+            timestamps = [row[0] for row in rows]
+            dayTimestamps = dict(zip(timestamps, rmGetStartOfDays(timestamps)))
 
-                if minMax is None:
-                    minMax = self.getMinMax(parserID, dayTimestamp)
-                    minMaxMap[dayTimestamp] = minMax
+            minMaxMap = self.getMinMaxForDays(parserID, dayTimestamps.values())
+            for row in rows:
+                minMax = minMaxMap[dayTimestamps[row[0]]]
 
-                minMax["minTemperature"] = self.__min(self.__min(value.minTemperature, value.temperature), minMax["minTemperature"])
-                minMax["maxTemperature"] = self.__max(self.__max(value.maxTemperature, value.temperature), minMax["maxTemperature"])
+                minMax["minTemperature"] = self.__min(self.__min(row[2], row[1]), minMax["minTemperature"])
+                minMax["maxTemperature"] = self.__max(self.__max(row[3], row[1]), minMax["maxTemperature"])
 
-                minMax["minRH"] = self.__min(self.__min(value.minRh, value.rh), minMax["minRH"])
-                minMax["maxRH"] = self.__max(self.__min(value.maxRh, value.rh), minMax["maxRH"])
+                minMax["minRH"] = self.__min(self.__min(row[5], row[4]), minMax["minRH"])
+                minMax["maxRH"] = self.__max(self.__min(row[6], row[4]), minMax["maxRH"])
 
             valuesToInsert = []
-            for value in values:
-                dayTimestamp = rmGetStartOfDay(value.timestamp)
-                minMax = minMaxMap[dayTimestamp]
+            for row in rows:
+                minMax = minMaxMap[dayTimestamps[row[0]]]
 
                 valuesToInsert.append((forecastID, parserID,
-                                   value.timestamp,
-                                   value.temperature,
+                                   row[0],
+                                   row[1],
                                    minMax["minTemperature"],
                                    minMax["maxTemperature"],
-                                   value.rh,
+                                   row[4],
                                    minMax["minRH"],
-                                   minMax["maxRH"],
-                                   value.wind,
-                                   value.solarRad,
-                                   value.skyCover,
-                                   value.rain,
-                                   value.et0,
-                                   value.pop,
-                                   value.qpf,
-                                   value.condition,
-                                   value.pressure,
-                                   value.dewPoint,
-                                   value.userData))
+                                   minMax["maxRH"]) + row[7:])
 
             self.clearHistory(parserID, False)
 
@@ -225,20 +253,31 @@ class RMParserDataTable(RMTable):
                                             "wind, solarRad, skyCover, rain, et0, pop, qpf, "\
                                             "condition, pressure, dewPoint, userData) "\
                                             "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", valuesToInsert)
+            if rows:
+                self.__lowerArchiveWatermark(parserID, min(row[0] for row in rows))
             self.database.commit()
 
     def removeEntriesWithParserIdAndTimestamp(self, parserID, values):
         if(self.database.isOpen()):
-            timestamps = []
-            for value in values:
-                timestamps.append((value.timestamp))
+            if isinstance(values, RMWeatherDataFrame):
+                timestamps = values.timestamps
+            else:
+                timestamps = [value.timestamp for value in values]
 
             minTS = int(min(timestamps))
 
             self.database.execute("DELETE FROM parserData WHERE parserID=? AND timestamp>=?", (parserID, minTS))
             self.database.commit()
 
+    def __getRecordRows(self, values):
+        ### Returns [(timestamp, temperature, ..., userData), ...] with the values in RecordFields order.
+        if isinstance(values, RMWeatherDataFrame):
+            return values.rows(RMParserDataTable.RecordFields)
 
+        return [(value.timestamp, value.temperature, value.minTemperature, value.maxTemperature,
+                 value.rh, value.minRh, value.maxRh, value.wind, value.solarRad, value.skyCover,
+                 value.rain, value.et0, value.pop, value.qpf, value.condition, value.pressure,
+                 value.dewPoint, value.userData) for value in values]
 
     def clearHistory(self, parserID, commit):
         if self.database.isOpen():
@@ -258,111 +297,90 @@ class RMParserDataTable(RMTable):
                 self.database.commit()
 
     def deleteRecordsHistoryByDayThreshold(self, parserID, minDayTimestampThresold, maxDayTimestampThresold, commit = True):
+        ### Keeps only the last forecast for each day and compacts it to one archived row once the forecast
+        ### is older than maxDayTimestampThresold. Only the days from the parser archive watermark on are
+        ### looked at, everything before it is already archived.
         if(self.database.isOpen()):
             # Delete very old data
-            rows = self.database.execute("DELETE FROM parserData WHERE timestamp<?", (minDayTimestampThresold, ))
-#SELECT f.ID, f.timestamp, p.rowid, p.timestamp, p.temperature, p.rh, p.wind, p.solarRad, p.skyCover, p.rain, p.et0, p.pop, p.qpf, p.condition, p.pressure, p.dewPoint, p.archived FROM parserData p, forecast f WHERE f.ID=p.forecastID ORDER BY p.timestamp DESC, p.forecastID DESC
-            # Compute new data
-            query = "SELECT f.ID, f.timestamp, p.rowid, p.timestamp, p.temperature, p.rh, p.wind, p.solarRad, p.skyCover, p.rain, p.et0, p.pop, p.qpf, p.condition, p.pressure, p.dewPoint, p.archived "\
-                    "FROM parserData p, forecast f WHERE f.ID=p.forecastID AND p.parserID=? ORDER BY p.timestamp DESC, p.forecastID DESC"
-            rows = self.database.execute(query, (parserID, ))
-
-            tempData = OrderedDict()
-            rowIdsToDelete = []
-            rowIdsToKeep = []
-            newData = []
+            self.database.execute("DELETE FROM parserData WHERE timestamp<?", (minDayTimestampThresold, ))
 
-            lastDayTimestamp = None
-            lastForecastID = None
-
-            for row in rows:
-                forecastID = row[0]
-                forecastDayTimestamp = rmGetStartOfDay(row[1])
-                dayTimestamp = rmGetStartOfDay(row[3])
-
-                if lastDayTimestamp != dayTimestamp: # Enter a new day
-                    lastDayTimestamp = dayTimestamp
-                    lastForecastID = forecastID
-
-                if maxDayTimestampThresold <= forecastDayTimestamp:
-                    continue
-
-                if lastForecastID != forecastID: # We want only the last forecast for this day
-                    rowIdsToDelete.append(str(row[2]))
-                    continue
-
-                timestamp = rmNormalizeTimestamp(row[3])
-                #timestampOffset = timestamp - dayTimestamp
-
-                dayData = tempData.get(dayTimestamp, None)
-                if dayData is None:
-                    tempData[dayTimestamp] = dayData = {}
-                    dayData["count"] = 0
-                    dayData["data"] = {
-                        "rowid": row[2],
-                        "forecastID": forecastID,
-                        "condition": None,
-                        "archived": row[16]
-                    }
-                    rowIdsToKeep.append(str(row[2]))
-                else:
-                    rowIdsToDelete.append(str(row[2]))
-
-                dayData["count"] += 1
-                dayData = dayData["data"]
-
-                dayData["temperature"] = self.__sum(dayData.get("temperature", None), row[4])
-                dayData["rh"] = self.__sum(dayData.get("rh", None), row[5])
-                dayData["wind"] = self.__sum(dayData.get("wind", None), row[6])
-                dayData["solarRad"] = self.__sum(dayData.get("solarRad", None), row[7])
-                dayData["skyCover"] = self.__sum(dayData.get("skyCover", None), row[8])
-                dayData["rain"] = self.__sum(dayData.get("rain", None), row[9])
-                dayData["et0"] = row[10]
-                dayData["pop"] = self.__sum(dayData.get("pop", None), row[11])
-                dayData["qpf"] = self.__sum(dayData.get("qpf", None), row[12])
-                dayData["pressure"] = self.__sum(dayData.get("pressure", None), row[14])
-                dayData["dewPoint"] = self.__sum(dayData.get("dewPoint", None), row[15])
-
-                if row[13]: # and 43200 <= timestampOffset <= 50400: # between 12-14.
-                    dayData["condition"] = row[13]
-
-
-            for dayTimestamp in tempData:
-                dayData = tempData[dayTimestamp]
-
-                count = dayData["count"]
-                dayData = dayData["data"]
-
-                if not dayData["archived"]:
-                    if count > 1:
-                        dayData["temperature"] = self.__avg(dayData.get("temperature", None), count)
-                        dayData["rh"] = self.__avg(dayData.get("rh", None), count)
-                        dayData["wind"] = self.__avg(dayData.get("wind", None), count)
-                        dayData["solarRad"] = self.__avg(dayData.get("solarRad", None), count)
-                        dayData["skyCover"] = self.__avg(dayData.get("skyCover", None), count)
-                        dayData["rain"] = self.__avg(dayData.get("rain", None), count)
-                        dayData["pop"] = self.__avg(dayData.get("pop", None), count)
-                        dayData["pressure"] = self.__avg(dayData.get("pressure", None), count)
-                        dayData["dewPoint"] = self.__avg(dayData.get("dewPoint", None), count)
-
-                    newData.append((dayTimestamp, dayData["temperature"], dayData["rh"], dayData["wind"], dayData["solarRad"],
-                                    dayData["skyCover"], dayData["rain"], dayData["et0"], dayData["pop"], dayData["qpf"],
-                                    dayData["condition"], dayData["pressure"], dayData["dewPoint"], dayData["rowid"]))
-
-            # Delete unnecessary data
-            if rowIdsToDelete:
-                self.database.execute("DELETE FROM parserData WHERE rowid IN(%s)" % ",".join(rowIdsToDelete))
-
-            # Update computed data
-            if newData:
-                query = "UPDATE parserData SET timestamp=?, temperature=?, rh=?, wind=?, solarRad=?, skyCover=?, rain=?, et0=?, pop=?, qpf=?, condition=?, pressure=?, dewPoint=?, archived=1 WHERE rowid=?"
-                self.database.executeMany(query, newData)
+            watermark = self.__getArchiveWatermark(parserID)
+            if watermark is not None:
+                self.__archiveHistory(parserID, max(rmGetStartOfDay(watermark), minDayTimestampThresold), maxDayTimestampThresold)
 
             self.database.execute("DELETE FROM forecast WHERE processed <> 0 AND ID NOT IN (SELECT DISTINCT forecastID FROM parserData)")
 
             if commit:
                 self.database.commit()
 
+    def __archiveHistory(self, parserID, minTimestamp, maxDayTimestampThresold):
+        # Rows to look at with their day and forecast day. The first row of each day (latest timestamp, then
+        # latest forecast) selects the forecast that is kept for that day and is the row that holds its summary.
+        # The work tables are created by initialize(), no DDL here.
+        self.database.execute("DELETE FROM parserDataArchive")
+        self.database.execute("DELETE FROM parserDataArchiveDays")
+
+        self.database.execute("INSERT INTO parserDataArchive "\
+                                "SELECT pd.rowid, pd.forecastID, rmStartOfDay(pd.timestamp), rmStartOfDay(f.timestamp), pd.timestamp, pd.archived "\
+                                "FROM parserData pd, forecast f WHERE f.ID=pd.forecastID AND pd.parserID=? AND pd.timestamp>=?", (parserID, minTimestamp))
+        self.database.execute("INSERT INTO parserDataArchiveDays "\
+                                "SELECT a.day, a.rowID, a.forecastID, a.forecastDay, a.archived FROM parserDataArchive a "\
+                                "WHERE a.rowID=(SELECT b.rowID FROM parserDataArchive b WHERE b.day=a.day ORDER BY b.timestamp DESC, b.forecastID DESC LIMIT 1)")
+
+        # Compute new data for the days whose kept forecast is in the past
+        rows = self.database.execute("SELECT d.day, d.rowID, d.archived, COUNT(*), "\
+                                        "SUM(pd.temperature), SUM(pd.rh), SUM(pd.wind), SUM(pd.solarRad), SUM(pd.skyCover), SUM(pd.rain), "\
+                                        "SUM(pd.pop), SUM(pd.qpf), SUM(pd.pressure), SUM(pd.dewPoint), "\
+                                        "(SELECT e.et0 FROM parserDataArchive b, parserData e WHERE b.day=d.day AND b.forecastID=d.forecastID AND e.rowid=b.rowID "\
+                                            "ORDER BY b.timestamp LIMIT 1), "\
+                                        "(SELECT c.condition FROM parserDataArchive b, parserData c WHERE b.day=d.day AND b.forecastID=d.forecastID AND c.rowid=b.rowID AND c.condition "\
+                                            "ORDER BY b.timestamp LIMIT 1) "\
+                                     "FROM parserDataArchiveDays d, parserDataArchive a, parserData pd "\
+                                     "WHERE d.forecastDay<? AND a.day=d.day AND a.forecastID=d.forecastID AND pd.rowid=a.rowID "\
+                                     "GROUP BY d.day", (maxDayTimestampThresold, )).fetchall()
+
+        newData = []
+        for row in rows:
+            if row[2]: # already archived
+                continue
+
+            count = row[3]
+            values = [row[index] for index in range(4, 14)]
+            if count > 1:
+                # qpf (index 7) is a daily total, everything else a daily average
+                values = [value if index == 7 else self.__avg(value, count) for index, value in enumerate(values)]
+
+            temperature, rh, wind, solarRad, skyCover, rain, pop, qpf, pressure, dewPoint = values
+            newData.append((row[0], temperature, rh, wind, solarRad, skyCover, rain, row[14], pop, qpf, row[15], pressure, dewPoint, row[1]))
+
+        # Delete unnecessary data: other forecasts for the day and the rows summarized in the kept one
+        self.database.execute("DELETE FROM parserData WHERE rowid IN ("\
+                                "SELECT a.rowID FROM parserDataArchive a WHERE a.forecastDay<? AND a.rowID NOT IN (SELECT rowID FROM parserDataArchiveDays))",
+                              (maxDayTimestampThresold, ))
+
+        # Update computed data
+        if newData:
+            query = "UPDATE parserData SET timestamp=?, temperature=?, rh=?, wind=?, solarRad=?, skyCover=?, rain=?, et0=?, pop=?, qpf=?, condition=?, pressure=?, dewPoint=?, archived=1 WHERE rowid=?"
+            self.database.executeMany(query, newData)
+
+        self.database.execute("DELETE FROM parserDataArchive")
+        self.database.execute("DELETE FROM parserDataArchiveDays")
+
+        # Rows of current forecasts are left for a later run
+        row = self.database.execute("SELECT MIN(timestamp) FROM parserData WHERE parserID=? AND timestamp>=? AND archived=0", (parserID, minTimestamp)).fetchone()
+        self.__archiveWatermarks[parserID] = row[0]
+
+    def __getArchiveWatermark(self, parserID):
+        ### Returns the timestamp of the oldest not archived row of the parser, None if there is none.
+        if parserID not in self.__archiveWatermarks:
+            row = self.database.execute("SELECT MIN(timestamp) FROM parserData WHERE parserID=? AND archived=0", (parserID, )).fetchone()
+            self.__archiveWatermarks[parserID] = row[0]
+        return self.__archiveWatermarks[parserID]
+
+    def __lowerArchiveWatermark(self, parserID, timestamp):
+        if parserID in self.__archiveWatermarks:
+            watermark = self.__archiveWatermarks[parserID]
+            self.__archiveWatermarks[parserID] = timestamp if watermark is None else min(watermark, timestamp)
 
     def getLastForecastByParser(self):
 
@@ -558,48 +576,171 @@ class RMParserDataTable(RMTable):
 
         return results
 
-    def getMinMax(self, parserID, dayTimestamp):
-        ### Min and Max are computed only from the last forecast for that day.
+    #-----------------------------------------------------------------------------------------------------
+    # Streaming variants of getRecordsByParserID()/getRecordsByParserName(). They yield the same day groups
+    # as (forecast, dayTimestamp, values) tuples in the same order, reading a few forecasts per database
+    # command so the whole history is never held in memory. Every chunk is a separate query: nothing stays
+    # open on the shared cursor between two chunks.
+    #
+    def iterRecordsByParserID(self, parserID, minDayTimestamp = None, maxDayTimestamp = None, forecastsPerChunk = 8):
+        return self.__iterRecords(lambda: [parserID], minDayTimestamp, maxDayTimestamp, forecastsPerChunk, False)
 
-        results = {
-            "minTemperature": None,
-            "maxTemperature": None,
-            "minRH": None,
-            "maxRH": None
-        }
+    def iterRecordsByParserName(self, parserName, forecastsPerChunk = 8):
+        return self.__iterRecords(lambda: self.getParserIDsByName(parserName), None, None, forecastsPerChunk, True)
 
+    def __iterRecords(self, getParserIDs, minDayTimestamp, maxDayTimestamp, forecastsPerChunk, wrapValues):
+        # Runs on the caller thread, only the public methods below touch the database
+        parserIDs = getParserIDs()
+        if not parserIDs:
+            return
+
+        forecasts = self.getForecastsByParserIDs(parserIDs, minDayTimestamp, maxDayTimestamp)
+        for index in xrange(0, len(forecasts), forecastsPerChunk):
+            chunk = forecasts[index:index + forecastsPerChunk]
+            forecastsByID = dict((forecast.id, forecast) for forecast in chunk)
+
+            group = None
+            for forecastID, weatherData in self.getRecordsByForecastIDs(parserIDs, forecastsByID.keys(), minDayTimestamp, maxDayTimestamp):
+                dayTimestamp = rmGetStartOfDay(weatherData.timestamp)
+                if group is None or group[0].id != forecastID or group[1] != dayTimestamp:
+                    if group is not None:
+                        yield group
+                    group = (forecastsByID[forecastID], dayTimestamp, [])
+
+                if wrapValues:
+                    group[2].append([weatherData, ])
+                else:
+                    group[2].append(weatherData)
+
+            if group is not None:
+                yield group
+
+    def getParserIDsByName(self, parserName):
+        if self.database.isOpen():
+            return [row[0] for row in self.database.execute("SELECT ID FROM parser WHERE name=?", (parserName, )).fetchall()]
+        return []
+
+    def getForecastsByParserIDs(self, parserIDs, minDayTimestamp = None, maxDayTimestamp = None):
+        ### Forecasts having data for any of parserIDs in [minDayTimestamp, maxDayTimestamp), newest first.
+        forecasts = []
         if self.database.isOpen():
-            minForecastTimestamp = None
-            maxForecastTimestamp = None
-            maxDayTimestamp = dayTimestamp + 86400
+            condition, params = self.__getRangeCondition(parserIDs, minDayTimestamp, maxDayTimestamp)
+            records = self.database.execute("SELECT f.id, f.timestamp, f.processed FROM forecast f WHERE f.id IN "\
+                                            "(SELECT DISTINCT pd.forecastID FROM parserData pd WHERE " + condition + ") "\
+                                            "ORDER BY f.id DESC", params).fetchall()
+            for row in records:
+                forecasts.append(RMForecastInfo(row[0], row[1], row[2]))
+        return forecasts
+
+    def getRecordsByForecastIDs(self, parserIDs, forecastIDs, minDayTimestamp = None, maxDayTimestamp = None):
+        ### Returns [(forecastID, RMWeatherData), ...] ordered by forecastID DESC, timestamp ASC.
+        results = []
+        if self.database.isOpen() and forecastIDs:
+            values, params = self.database.inList(forecastIDs)
+            condition, rangeParams = self.__getRangeCondition(parserIDs, minDayTimestamp, maxDayTimestamp)
+            records = self.database.execute("SELECT pd.forecastID, pd.timestamp, pd.temperature, pd.minTemperature, pd.maxTemperature, "\
+                                            "pd.rh, pd.minRh, pd.maxRh, pd.wind, pd.solarRad, pd.skyCover, pd.rain, pd.et0, pd.pop, pd.qpf, "\
+                                            "pd.condition, pd.pressure, pd.dewPoint, pd.userData FROM parserData pd "\
+                                            "WHERE pd.forecastID IN (" + values + ") AND " + condition + " "\
+                                            "ORDER BY pd.forecastID DESC, pd.timestamp ASC", params + rangeParams).fetchall()
+            for row in records:
+                weatherData = RMWeatherData(row[1])
+                weatherData.temperature = row[2]
+                weatherData.minTemperature = row[3]
+                weatherData.maxTemperature = row[4]
+                weatherData.rh = row[5]
+                weatherData.minRh = row[6]
+                weatherData.maxRh = row[7]
+                weatherData.wind = row[8]
+                weatherData.solarRad = row[9]
+                weatherData.skyCover = row[10]
+                weatherData.rain = row[11]
+                weatherData.et0 = row[12]
+                weatherData.pop = row[13]
+                weatherData.qpf = row[14]
+                weatherData.condition = row[15]
+                weatherData.pressure = row[16]
+                weatherData.dewPoint = row[17]
+                weatherData.userData = row[18]
+
+                results.append((row[0], weatherData))
+        return results
+
+    def __getRangeCondition(self, parserIDs, minDayTimestamp, maxDayTimestamp):
+        values, params = self.database.inList(parserIDs)
+        condition = "pd.parserID IN (" + values + ")"
+        if minDayTimestamp is not None:
+            condition += " AND ?<=pd.timestamp"
+            params.append(minDayTimestamp)
+        if maxDayTimestamp is not None:
+            condition += " AND pd.timestamp<?"
+            params.append(maxDayTimestamp)
+        return condition, params
+
+    def getMinMax(self, parserID, dayTimestamp):
+        ### Min and Max are computed only from the last forecast for that day.
+        return self.getMinMaxForDays(parserID, [dayTimestamp])[dayTimestamp]
+
+    def getMinMaxForDays(self, parserID, dayTimestamps):
+        ### Same as getMinMax for several days with a single range query, returns {dayTimestamp: results}.
+
+        allResults = {}
+        for dayTimestamp in dayTimestamps:
+            allResults[dayTimestamp] = {
+                "minTemperature": None,
+                "maxTemperature": None,
+                "minRH": None,
+                "maxRH": None
+            }
+
+        if allResults and self.database.isOpen():
+            sortedDays = sorted(allResults)
+            dayMatches = {} # row day -> requested days whose [day, day + 86400) interval contains it (two around DST changes)
+            forecastWindows = {} # dayTimestamp -> (minForecastTimestamp, maxForecastTimestamp) of the last forecast for that day
+            startOfDay = {}
 
             rows = self.database.execute("SELECT f.timestamp, pd.timestamp, pd.temperature, pd.minTemperature, pd.maxTemperature, pd.rh, pd.minRh, pd.maxRh "\
                                          "FROM forecast f, parserData pd "\
                                          "WHERE pd.parserID=? AND ?<=pd.timestamp AND pd.timestamp<=? AND pd.forecastID=f.ID ORDER BY pd.forecastID DESC",
-                                         (parserID, dayTimestamp - 2 * 86400, dayTimestamp + 2 * 86400))
+                                         (parserID, min(allResults) - 2 * 86400, max(allResults) + 2 * 86400))
             for row in rows:
-                timestamp = rmGetStartOfDay(row[1])
+                timestamp = startOfDay.get(row[1], None)
+                if timestamp is None:
+                    timestamp = startOfDay[row[1]] = rmGetStartOfDay(row[1])
 
-                if dayTimestamp <= timestamp < maxDayTimestamp:
-                    forecastTimestamp = rmGetStartOfDay(row[0])
-                    if maxForecastTimestamp is None:
-                        minForecastTimestamp = forecastTimestamp
-                        maxForecastTimestamp = forecastTimestamp + 86400
+                matches = dayMatches.get(timestamp, None)
+                if matches is None:
+                    matches = dayMatches[timestamp] = sortedDays[bisect_right(sortedDays, timestamp - 86400):bisect_right(sortedDays, timestamp)]
 
-                    if minForecastTimestamp <= forecastTimestamp < maxForecastTimestamp:
-                        minTemp = self.__val(row[3], row[2])
-                        maxTemp = self.__val(row[4], row[2])
+                if not matches:
+                    continue
 
-                        minRH = self.__val(row[6], row[5])
-                        maxRH = self.__val(row[7], row[5])
+                forecastTimestamp = startOfDay.get(row[0], None)
+                if forecastTimestamp is None:
+                    forecastTimestamp = startOfDay[row[0]] = rmGetStartOfDay(row[0])
 
-                        results["minTemperature"] = self.__min(results["minTemperature"], minTemp)
-                        results["maxTemperature"] = self.__max(results["maxTemperature"], maxTemp)
+                for dayTimestamp in matches:
+                    forecastWindow = forecastWindows.get(dayTimestamp, None)
+                    if forecastWindow is None:
+                        forecastWindow = forecastWindows[dayTimestamp] = (forecastTimestamp, forecastTimestamp + 86400)
 
-                        results["minRH"] = self.__min(results["minRH"], minRH)
-                        results["maxRH"] = self.__max(results["maxRH"], maxRH)
+                    if not forecastWindow[0] <= forecastTimestamp < forecastWindow[1]:
+                        continue
 
-        return results
+                    results = allResults[dayTimestamp]
+                    minTemp = self.__val(row[3], row[2])
+                    maxTemp = self.__val(row[4], row[2])
+
+                    minRH = self.__val(row[6], row[5])
+                    maxRH = self.__val(row[7], row[5])
+
+                    results["minTemperature"] = self.__min(results["minTemperature"], minTemp)
+                    results["maxTemperature"] = self.__max(results["maxTemperature"], maxTemp)
+
+                    results["minRH"] = self.__min(results["minRH"], minRH)
+                    results["maxRH"] = self.__max(results["maxRH"], maxRH)
+
+        return allResults
 
     def deleteRecordsByTimestampThreshold(self, parserID, minTimestamp, maxTimestamp = None):
         if(self.database.isOpen()):
@@ -630,6 +771,43 @@ class RMParserDataTable(RMTable):
                 log.debug("(", rmTimestampToDateAsString(row[0]), ", ", row[1], ")")
                 pass
 
+    def checkQueryPlans(self):
+        ### Returns the hot queries that don't use an index on parserData as [(name, [plan details]), ...].
+        ### Keep these statements in sync with the queries of the methods they are named after.
+        values, params = self.database.inList([1, 2])
+        queries = [
+            ("getMinMax", "SELECT f.timestamp, pd.timestamp, pd.temperature, pd.minTemperature, pd.maxTemperature, pd.rh, pd.minRh, pd.maxRh "\
+                          "FROM forecast f, parserData pd "\
+                          "WHERE pd.parserID=? AND ?<=pd.timestamp AND pd.timestamp<=? AND pd.forecastID=f.ID ORDER BY pd.forecastID DESC", (1, 0, 0)),
+            ("removeEntriesWithParserIdAndTimestamp", "DELETE FROM parserData WHERE parserID=? AND timestamp>=?", (1, 0)),
+            ("deleteRecordsByDayThreshold", "DELETE FROM parserData WHERE timestamp<?", (0, )),
+            ("deleteRecordsHistoryByDayThreshold", "SELECT pd.rowid, pd.forecastID, pd.timestamp, pd.archived "\
+                                                   "FROM parserData pd, forecast f WHERE f.ID=pd.forecastID AND pd.parserID=? AND pd.timestamp>=?", (1, 0)),
+            ("deleteRecordsHistoryByDayThreshold watermark", "SELECT MIN(timestamp) FROM parserData WHERE parserID=? AND timestamp>=? AND archived=0", (1, 0)),
+            ("getRecordsByParserID", "SELECT f.timestamp, f.processed, pd.* FROM forecast f, parserData pd "\
+                                     "WHERE pd.parserID==? AND f.id == pd.forecastID AND ?<=pd.timestamp AND pd.timestamp<? "\
+                                     "ORDER BY f.id DESC, pd.timestamp ASC", (1, 0, 0)),
+            ("getForecastsByParserIDs", "SELECT f.id, f.timestamp, f.processed FROM forecast f WHERE f.id IN "\
+                                        "(SELECT DISTINCT pd.forecastID FROM parserData pd WHERE pd.parserID IN (" + values + ") AND ?<=pd.timestamp AND pd.timestamp<?) "\
+                                        "ORDER BY f.id DESC", params + [0, 0]),
+            ("getRecordsByForecastIDs", "SELECT pd.forecastID, pd.timestamp, pd.userData FROM parserData pd "\
+                                        "WHERE pd.forecastID IN (" + values + ") AND pd.parserID IN (" + values + ") "\
+                                        "ORDER BY pd.forecastID DESC, pd.timestamp ASC", params + params),
+            ("deleteRecordsByTimestampThreshold", "DELETE FROM parserData WHERE parserID=? AND timestamp<?", (1, 0)),
+            ("deleteRecordsByParser", "DELETE FROM parserData WHERE parserID=?", (1, )),
+        ]
+
+        failed = []
+        if self.database.isOpen():
+            for name, query, params in queries:
+                details = [row[-1] for row in self.database.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()]
+                # "SCAN pd" (sqlite >= 3.36) or "SCAN TABLE parserData AS pd", also a full scan of an index
+                scans = [detail for detail in details if detail.startswith("SCAN") and \
+                            (" parserData" in detail or detail.split(" ")[1] in ("p", "pd", "parserData"))]
+                if scans:
+                    failed.append((name, details))
+        return failed
+
     def __sum(self, initial, toAdd):
         if initial == None and toAdd == None:
             return None
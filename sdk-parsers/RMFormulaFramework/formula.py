@@ -6,6 +6,20 @@
 #
 
 import math
+
+try:
+    from RMUtilsFramework.rmAstronomy import rmGetAstronomyTable
+    from RMFormulaFramework.rmRadiation import rmComputeRadiation
+except ImportError:
+    # standalone run (test code below), radiation is computed for every call
+    from rmRadiation import rmComputeRadiation
+    rmGetAstronomyTable = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # Unused parameters should be passed as None
 ##########################asceDaily#######################################################
 #parameters
@@ -27,6 +41,10 @@ import math
 #   fTDewpointC = 5.0 [degC] - dew point temperature - used for Ea estimation
 
 def asceDaily(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC):
+    return asceDailyEx(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC)[0]
+
+# Same as asceDaily, returns (ETos, ETrs)
+def asceDailyEx(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC):
     #//////////day of year////////////
     fJ = day - 32 + math.floor(275 * month / 9.0) + 2 * math.floor(3.0 / (month + 1)) + math.floor(month / 100.0 - (year % 4) / 4.0 + 0.975) # Eq.25
     #print("->Day of year:", fJ)
@@ -69,34 +87,10 @@ def asceDaily(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fR
         fU2 = 2.0
 
     #print("->Wind at 2m:", fU2)
-    #////////dr//////////////////////
-    fDr = 1.0 + 0.033 * math.cos(2 * math.pi / 365 * fJ)  # Eq.23
-    #print("->Dr:", fDr)
-    #////////declin//////////////////////
-    fDeclin = 0.409 * math.sin(2 * math.pi / 365 * fJ - 1.39)  # Eq.24
-    #print("->Declin:", fDeclin)
-    #///////omegas///////////////////////
-    fLatRadian = math.pi / 180.0 * fLat
-    #print "->Lat Radian:", fLatRadian
-    fOmegaPreprocess = -math.tan(fLatRadian) * math.tan(fDeclin)
-    #print "->OmegaPreprocess:", fOmegaPreprocess
-    if fOmegaPreprocess > 1.0:
-        fOmegaPreprocess = 1.0
-    else:
-        if fOmegaPreprocess < -1.0:
-            fOmegaPreprocess = -1.0
-    fOmegaS = math.acos(fOmegaPreprocess)  # Eq.27
-
-    #print("->OmegaS:", fOmegaS)
     #////////radiation stuff ////////////
-    fRa = 24.0 / math.pi * 4.92 * fDr * (fOmegaS * math.sin(fLatRadian) * math.sin(fDeclin) +
-                                         math.cos(fLatRadian) * math.cos(fDeclin) * math.sin(fOmegaS))  # Eq.21
-    fRSo = 0.0
-
-    if fElevation is not None:
-        fRSo = (0.75 + 2.0 * fElevation / 100000.0) * fRa  # Eq.19
-    else:
-        fRSo = 0.75 * fRa  # dumb approximation
+    # Dr, declination, omegas, Ra and Rso only depend on the day of year and location (Eq.19, 21, 23, 24, 27)
+    fDr, fDeclin, fOmegaS, fRa, fRSo = _getRadiation(fJ, fLat, fElevation)
+    #print("->Ra:", fRa, "Rso:", fRSo)
 
     #if fRs is not valid, calculate it from temperatures
     if fKrs is None:
@@ -158,9 +152,130 @@ def asceDaily(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fR
 
     #print("->ETos:", fETos, "ETrs:", fETrs)
 
-    return fETos
+    return fETos, fETrs
+
+def _getRadiation(fJ, fLat, fElevation):
+    if rmGetAstronomyTable is None:
+        return rmComputeRadiation(fJ, fLat, fElevation)
+    return rmGetAstronomyTable(fLat, None, fElevation).getRadiation(fJ)
 
 ##########################end of asceDaily#######################################################
+
+##########################asceDailyBatch##################################################
+# asceDaily for many days (or locations) at once. Every parameter is either a single value used for
+# all the days or a sequence with one value per day. A missing value (None or NaN) is estimated like
+# asceDaily does for None, a day that can't be computed (no temperatures, fTMaxC < fTMinC without fRs)
+# is NaN.
+# Returns (ETos, ETrs): numpy arrays computed with broadcasting if numpy is available, otherwise lists
+# computed with asceDailyEx for every day.
+
+def asceDailyBatch(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC):
+    params = (year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC)
+    if numpy is None:
+        return _asceDailyBatchLoop(params)
+
+    with numpy.errstate(invalid = "ignore", divide = "ignore", over = "ignore"):
+        return _asceDailyBatchArrays(*[_asceBatchArray(param) for param in params])
+
+def _asceBatchArray(values):
+    # float array (or scalar) with NaN for the missing values
+    if values is None:
+        return numpy.nan
+    array = numpy.asarray(values)
+    if array.dtype == object:
+        array = numpy.array([numpy.nan if value is None else value for value in array.flat], dtype = float).reshape(array.shape)
+    return array.astype(float)
+
+def _asceDailyBatchArrays(year, month, day, fTMinC, fTMaxC, fU2z, fU2m, fLat, fElevation, fRs, fEa, fRHMin, fRHMax, fPressure, fKrs, fTDewpointC):
+    isnan = numpy.isnan
+    where = numpy.where
+
+    fJ = day - 32 + numpy.floor(275 * month / 9.0) + 2 * numpy.floor(3.0 / (month + 1)) + numpy.floor(month / 100.0 - (year % 4) / 4.0 + 0.975) # Eq.25
+
+    fTMeanC = (fTMinC + fTMaxC) / 2
+    fTMinK = 273.16 + fTMinC
+    fTMaxK = 273.16 + fTMaxC
+
+    fDelta = 2503.0 * numpy.exp(17.27 * fTMeanC / (fTMeanC + 237.3)) / (fTMeanC + 237.3) ** 2 # Eq.5
+    fETMax = 0.6108 * numpy.exp(17.27 * fTMaxC / (fTMaxC + 237.3)) # Eq.7
+    fETMin = 0.6108 * numpy.exp(17.27 * fTMinC / (fTMinC + 237.3)) # Eq.7
+    fEs = (fETMax + fETMin) / 2 # Eq.6
+
+    fEaRH = where(isnan(fRHMin), fETMin * fRHMax / 100, (fETMax * fRHMin / 100 + fETMin * fRHMax / 100) / 2) # Eq.18, Eq.11
+    fTDew = where(isnan(fTDewpointC), fTMinC, fTDewpointC)
+    fEaDew = 0.6108 * numpy.exp(17.27 * fTDew / (fTDew + 237.3)) # Eq.8
+    fEa = where(isnan(fEa), where(isnan(fRHMax), fEaDew, fEaRH), fEa)
+
+    fU2m = where(isnan(fU2m), 10, fU2m)
+    fU2 = where(isnan(fU2z), 2.0, fU2z * 4.87 / numpy.log(67.8 * fU2m - 5.42)) # Eq.33
+    fU2 = where(fU2 < 2.0, 2.0, fU2)
+
+    # Ra and Rso with the scalar formulas (and tables) of asceDailyEx, one call per distinct day and location
+    fRa, fRSo = _getRadiationArrays(fJ, fLat, fElevation)
+
+    fKrs = where(isnan(fKrs), 0.17, fKrs)
+    fRsEstimated = fKrs * numpy.sqrt(fTMaxC - fTMinC) * fRa
+    fRsEstimated = where(fRsEstimated < 0, 0, fRsEstimated)
+    fRsEstimated = where(fRsEstimated > fRSo, fRSo, fRsEstimated)
+    fRs = where(isnan(fRs), fRsEstimated, fRs)
+
+    fFcd = where(fRSo != 0, 1.35 * fRs / fRSo - 0.35, 0)
+    fFcd = where(fFcd < 0.05, 0.05, fFcd)
+    fFcd = where(fFcd > 1, 1.0, fFcd)
+
+    SIGMA_DAY = 0.000000004901
+    fRnl = SIGMA_DAY * ((fTMinK ** 4 + fTMaxK ** 4) / 2) * fFcd * (0.34 - 0.14 * numpy.sqrt(fEa)) # Eq.17
+    fRn = 0.77 * fRs - fRnl # Eq.16, Eq.15
+
+    fPressure = where(isnan(fPressure), 101.3 * ((293 - 0.0065 * fElevation) / 293) ** 5.25, fPressure) # Eq.3
+    fPsyCon = 0.000665 * fPressure # Eq.4
+
+    fETos = (0.408 * fDelta * fRn + fPsyCon * 900.0 / (fTMeanC + 273) * fU2 * (fEs - fEa)) / (fDelta + fPsyCon * (1 + 0.34 * fU2))
+    fETrs = (0.408 * fDelta * fRn + fPsyCon * 1600 / (fTMeanC + 273) * fU2 * (fEs - fEa)) / (fDelta + fPsyCon * (1 + 0.38 * fU2))
+    fETos = where(fETos < 0.0, 0.0, fETos)
+
+    return numpy.atleast_1d(fETos), numpy.atleast_1d(fETrs)
+
+def _getRadiationArrays(fJ, fLat, fElevation):
+    fJ, fLat, fElevation = numpy.broadcast_arrays(fJ, fLat, fElevation)
+    radiation = {}
+    fRa = numpy.empty(fJ.shape)
+    fRSo = numpy.empty(fJ.shape)
+    for index, key in enumerate(zip(fJ.flat, fLat.flat, fElevation.flat)):
+        entry = radiation.get(key, None)
+        if entry is None:
+            j, lat, elevation = [float(value) for value in key]
+            if math.isnan(j) or math.isnan(lat):
+                entry = (numpy.nan, numpy.nan)
+            else:
+                entry = _getRadiation(j, lat, None if math.isnan(elevation) else elevation)[3:]
+            radiation[key] = entry
+        fRa.flat[index], fRSo.flat[index] = entry
+    return fRa, fRSo
+
+def _asceDailyBatchLoop(params):
+    count = max([len(param) for param in params if _isSequence(param)] or [1])
+    fETos = []
+    fETrs = []
+    for index in range(count):
+        dayParams = []
+        for param in params:
+            value = param[index] if _isSequence(param) else param
+            if value is not None and value != value: # NaN
+                value = None
+            dayParams.append(value)
+        try:
+            et0, etr = asceDailyEx(*dayParams)
+        except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+            et0, etr = float("nan"), float("nan")
+        fETos.append(et0)
+        fETrs.append(etr)
+    return fETos, fETrs
+
+def _isSequence(value):
+    return hasattr(value, "__len__") and not isinstance(value, basestring)
+
+##########################end of asceDailyBatch##################################################
 # Test code
 if __name__ == '__main__':
     #               year  ,month,day  ,minT ,maxT ,wind ,windalt,lat deg,elev(m),solar rad  , Ea(hum), RhMin ,RhMax  ,pressure   ,Krs  , TDew
@@ -174,4 +289,39 @@ if __name__ == '__main__':
     print("Humidity from TDew \t\tET0=%f" % et0)
     et0 = asceDaily(2012.0, 10.0, 15.0, 10.7, 27.3, None, None, 36.82, 98.5, None, None, None, None, None, None, None)
     print("Everything from temp \t\tET0=%f" % et0)
+    et0, etr = asceDailyBatch(2012.0, 10.0, 15.0, 10.7, 27.3, [2.3, 2.3, 2.3, 2.3, None], [2, 2, 2, 2, None], 36.82, 98.5,
+                              [16.502, None, 16.502, 16.502, None], [1.4, 1.4, None, None, None], [None, None, 36.0, None, None],
+                              [None, None, 91.0, None, None], None, [0.17, 0.17, 0.17, 0.17, None], [None, None, None, 11.7, None])
+    print("Batch of the above \t\tET0=%s" % ", ".join("%f" % value for value in et0))
+
+    # asceDailyBatch (numpy arrays when available) against asceDailyEx day by day, with missing wind, solar radiation,
+    # humidity, elevation and pressure. The last case can't be computed (no elevation nor pressure) and must be NaN in both.
+    #         wind , solar rad, RhMin, RhMax, TDew, elev(m), pressure
+    cases = [(2.3  , 16.502   , 36.0 , 91.0 , None, 98.5   , None),
+             (None , 16.502   , 36.0 , 91.0 , None, 98.5   , None),
+             (2.3  , None     , 36.0 , 91.0 , None, 98.5   , None),
+             (2.3  , 16.502   , None , None , None, 98.5   , None),
+             (2.3  , None     , None , 91.0 , 11.7, 1500.0 , None),
+             (None , None     , None , None , 11.7, None   , 101.3),
+             (None , None     , None , None , None, None   , None)]
+    days = []
+    for month in range(1, 13):
+        for lat in (-45.0, 0.0, 36.82, 68.0):
+            for fU2z, fRs, fRHMin, fRHMax, fTDew, fElevation, fPressure in cases:
+                fTMinC = -5.0 + 2 * month
+                days.append((2012.0, float(month), 15.0, fTMinC, fTMinC + 12.0, fU2z, 10, lat, fElevation, fRs, None, fRHMin, fRHMax, fPressure, None, fTDew))
 
+    batch = asceDailyBatch(*[[day[index] for day in days] for index in range(16)])
+    maxDifference = 0.0
+    for index, day in enumerate(days):
+        try:
+            expected = asceDailyEx(*day)
+        except (TypeError, ValueError, ZeroDivisionError, OverflowError):
+            expected = (float("nan"), float("nan"))
+        for value, expectedValue in zip((batch[0][index], batch[1][index]), expected):
+            if (value != value) != (expectedValue != expectedValue):
+                maxDifference = float("inf")
+            elif value == value:
+                maxDifference = max(maxDifference, abs(value - expectedValue))
+    print("Batch vs asceDailyEx (%s, %d days) \tmax difference=%g %s" % \
+          ("numpy" if numpy is not None else "no numpy", len(days), maxDifference, "OK" if maxDifference < 1e-9 else "MISMATCH"))
@@ -0,0 +1,36 @@
+# Copyright (c) 2015 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Csenteri Barna <brown@mini-box.com>
+#          Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+#
+
+import math
+
+#----------------------------------------------------------------------------------------
+# Dr, declination, sunset hour angle, extraterrestrial (Ra) and clear-sky (Rso) radiation
+# for a day of year, ASCE standardized reference ET equations. Only uses math so it can be
+# imported by formula.py when it runs standalone, rmAstronomy keeps tables of these values.
+#
+def rmComputeRadiation(fJ, fLat, fElevation):
+    fDr = 1.0 + 0.033 * math.cos(2 * math.pi / 365 * fJ)  # Eq.23
+    fDeclin = 0.409 * math.sin(2 * math.pi / 365 * fJ - 1.39)  # Eq.24
+
+    fLatRadian = math.pi / 180.0 * fLat
+    fOmegaPreprocess = -math.tan(fLatRadian) * math.tan(fDeclin)
+    if fOmegaPreprocess > 1.0:
+        fOmegaPreprocess = 1.0
+    else:
+        if fOmegaPreprocess < -1.0:
+            fOmegaPreprocess = -1.0
+    fOmegaS = math.acos(fOmegaPreprocess)  # Eq.27
+
+    fRa = 24.0 / math.pi * 4.92 * fDr * (fOmegaS * math.sin(fLatRadian) * math.sin(fDeclin) +
+                                         math.cos(fLatRadian) * math.cos(fDeclin) * math.sin(fOmegaS))  # Eq.21
+
+    if fElevation is not None:
+        fRSo = (0.75 + 2.0 * fElevation / 100000.0) * fRa  # Eq.19
+    else:
+        fRSo = 0.75 * fRa  # dumb approximation
+
+    return fDr, fDeclin, fOmegaS, fRa, fRSo
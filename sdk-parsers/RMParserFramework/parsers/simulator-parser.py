@@ -8,9 +8,9 @@
 from RMParserFramework.rmParser import RMParser
 from RMUtilsFramework.rmLogging import log
 from RMParserFramework.rmParserManager import RMParserManager
-from RMUtilsFramework.rmTimeUtils import rmGetStartOfDayUtc
+from RMUtilsFramework.rmTimeUtils import rmGetStartOfDayUtc, rmGetStartOfDay
 
-import datetime, time, random, math
+import time, random, math
 
 
 class SimulatorParser(RMParser):
@@ -71,17 +71,18 @@ class SimulatorParser(RMParser):
         #-----------------------------------------------------------------------------------------------
         #
         # Get hourly data.
-        self.addValues(RMParser.dataType.TEMPERATURE, self._generatePeriodicalData(arrTimestamps, self.tempMin
-            , self.tempMax, 6, -2.5))
-
-        self.addValues(RMParser.dataType.MINTEMP, self._generateCumulativeData(arrTimestamps, self.tempMin/2, self.tempMin*2))
-        self.addValues(RMParser.dataType.MAXTEMP, self._generateCumulativeData(arrTimestamps, self.tempMax/2, self.tempMax*2))
-
-        self.addValues(RMParser.dataType.DEWPOINT, self._generateCumulativeData(arrTimestamps, self.dewMin, self.dewMax))
-        self.addValues(RMParser.dataType.WIND, self._generateCumulativeData(arrTimestamps, self.windMin, self.windMax))
-        self.addValues(RMParser.dataType.POP, self._generateCumulativeData(arrTimestamps, self.popMin, self.popMax))
-        self.addValues(RMParser.dataType.RH, self._generatePeriodicalData(arrTimestamps, 2*math.fabs(self.tempMin)
-            , 2*math.fabs(self.tempMax), 6, 0))
+        hourly = {
+            RMParser.dataType.TEMPERATURE: self._generatePeriodicalData(arrTimestamps, self.tempMin
+                , self.tempMax, 6, -2.5),
+            RMParser.dataType.MINTEMP: self._generateCumulativeData(arrTimestamps, self.tempMin/2, self.tempMin*2),
+            RMParser.dataType.MAXTEMP: self._generateCumulativeData(arrTimestamps, self.tempMax/2, self.tempMax*2),
+            RMParser.dataType.DEWPOINT: self._generateCumulativeData(arrTimestamps, self.dewMin, self.dewMax),
+            RMParser.dataType.WIND: self._generateCumulativeData(arrTimestamps, self.windMin, self.windMax),
+            RMParser.dataType.POP: self._generateCumulativeData(arrTimestamps, self.popMin, self.popMax),
+            RMParser.dataType.RH: self._generatePeriodicalData(arrTimestamps, 2*math.fabs(self.tempMin)
+                , 2*math.fabs(self.tempMax), 6, 0)
+        }
+        self.addFrame(arrTimestamps, dict((key, [value for timestamp, value in data]) for key, data in hourly.items()))
 
         #-----------------------------------------------------------------------------------------------
         #
@@ -101,7 +102,7 @@ class SimulatorParser(RMParser):
         self.addValue(RMParser.dataType.MAXRH, startDayTimestamp, self.humidityMax*random.random())
 
         if self.parserDebug:
-            log.debug(self.result)
+            self.dump()
 
     def _generateQpfRainModelData(self):
         noOfDays = 7
@@ -217,8 +218,7 @@ class SimulatorParser(RMParser):
         return self._getStartOfDay(int(time.time()))
 
     def _getStartOfDay(self, timestamp):
-        tuple = datetime.datetime.fromtimestamp(timestamp).timetuple()
-        return int(datetime.datetime(tuple.tm_year, tuple.tm_mon, tuple.tm_mday).strftime("%s"))
+        return rmGetStartOfDay(timestamp)
 
     def frange(sefl, start, end=None, inc=None):
         if end == None:
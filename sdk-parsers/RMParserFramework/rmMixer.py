@@ -0,0 +1,258 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+from RMDataFramework.rmMixerData import RMMixerData
+from RMDataFramework.rmForecastInfo import RMForecastInfo
+from RMDataFramework.rmUserSettings import globalSettings
+from RMDatabaseFramework.rmDatabaseManager import globalDbManager
+from RMDatabaseFramework.rmMixerDataTable import RMMixerDataTable
+from RMFormulaFramework.formula import asceDailyBatch
+from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmTimeUtils import rmGetStartOfDay, rmCurrentDayTimestamp, rmTimestampToYearMonthDay, rmTimestampToDateAsString
+
+#----------------------------------------------------------------------------------------
+# Blends the latest forecast of every parser into one RMMixerData per day. The daily summary
+# of each parser is kept in memory so a run only reads the forecasts it hasn't seen yet and
+# only recomputes the days these forecasts (or a disabled parser) changed.
+#
+class RMMixer:
+    # Daily aggregation of the hourly parser values, same as the parser data archive: solarRad, rain and et0
+    # are daily values (et0 is taken from the first row of the day that has it), only qpf is a daily total
+    MeanFields = ("temperature", "rh", "wind", "solarRad", "skyCover", "rain", "pop", "pressure", "dewPoint")
+    SumFields = ("qpf", )
+    FirstFields = ("et0", )
+
+    # Fields blended as a weighted average of the parser daily summaries
+    BlendFields = MeanFields + SumFields + FirstFields + ("minTemp", "maxTemp", "minRH", "maxRH")
+
+    def __init__(self, parserManager):
+        self.parserManager = parserManager
+        self.parserDataTable = parserManager.parserDataTable
+        self.forecastTable = parserManager.forecastTable
+        self.mixerDataTable = RMMixerDataTable(globalDbManager.mixerDatabase)
+
+        self.forecastDecay = 0.1 # weight lost for every day a value is ahead of its forecast
+        self.observedQuality = 1.0 # quality of past days from historical parsers
+        self.forecastedQuality = 0.5 # quality of past days from forecast only parsers
+        self.maxDaysInPast = 7 # parser days older than this are dropped from the mixer state
+
+        self.__parserDays = {} # parserID -> {dayTimestamp: (RMForecastInfo, RMMixerData)}
+        self.__loadedKeys = set() # (forecastID, parserID) already summarized in __parserDays
+
+    def resetToDefault(self):
+        self.mixerDataTable.clear(True)
+        self.__parserDays = {}
+        self.__loadedKeys = set()
+
+    def run(self, forecast = None, forceAll = False):
+        ### Mixes the days changed by the unprocessed parser forecasts, all known days if forceAll. The values are
+        ### stored under forecast (the newest parser forecast if None). Returns the mixed RMMixerData ordered by
+        ### timestamp or None if no day changed.
+        unprocessedForecasts = dict((info.id, info) for info in (self.forecastTable.getUnprocessedRecords() or []))
+        forecastsByID = dict((info.id, info) for info in (self.parserDataTable.getLastForecastByParser() or {}).values())
+        forecastsByID.update(unprocessedForecasts)
+
+        changedDays = set()
+        minDayTimestamp = rmCurrentDayTimestamp() - self.maxDaysInPast * 86400
+
+        # Parsers that were disabled (or deleted) since the last run take their days with them
+        for parserID in self.__parserDays.keys():
+            if not self.__isParserEnabled(parserID):
+                changedDays.update(self.__parserDays.pop(parserID).keys())
+                self.__loadedKeys = set(key for key in self.__loadedKeys if key[1] != parserID)
+
+        # Older forecasts first so the days of a newer forecast of the same parser replace them
+        keys = sorted(self.parserDataTable.getLatestRecordsKeys() or [])
+        for key in keys:
+            forecastID, parserID = key
+            if key in self.__loadedKeys or forecastID not in forecastsByID or not self.__isParserEnabled(parserID):
+                continue
+
+            forecastInfo = forecastsByID[forecastID]
+            days = self.__summarizeDays(self.parserDataTable.getRecordsForKey(key) or [])
+            parserDays = self.__parserDays.setdefault(parserID, {})
+            for dayTimestamp, summary in days.iteritems():
+                if dayTimestamp >= minDayTimestamp:
+                    parserDays[dayTimestamp] = (forecastInfo, summary)
+                    if forecastID in unprocessedForecasts:
+                        changedDays.add(dayTimestamp)
+
+            self.__loadedKeys.add(key)
+
+        for parserDays in self.__parserDays.values():
+            for dayTimestamp in [dayTimestamp for dayTimestamp in parserDays if dayTimestamp < minDayTimestamp]:
+                del parserDays[dayTimestamp]
+
+        if forceAll:
+            for parserDays in self.__parserDays.values():
+                changedDays.update(parserDays.keys())
+
+        changedDays = sorted(dayTimestamp for dayTimestamp in changedDays if dayTimestamp >= minDayTimestamp)
+        if not changedDays:
+            if unprocessedForecasts:
+                self.forecastTable.markRecordsAsProcessed(unprocessedForecasts.keys())
+            log.debug("  * Mixer: no day changed")
+            return None
+
+        if forecast is None or forecast.id is None:
+            forecast = forecastsByID[max(forecastsByID)] if forecastsByID else RMForecastInfo(None)
+
+        log.debug("  * Mixer: mixing %d days (%s - %s) from %d parsers for forecast %s" % \
+                  (len(changedDays), rmTimestampToDateAsString(changedDays[0], "%Y-%m-%d"),
+                   rmTimestampToDateAsString(changedDays[-1], "%Y-%m-%d"), len(self.__parserDays), `forecast.id`))
+
+        values = []
+        emptyDays = [] # no enabled parser has values for these days anymore
+        for dayTimestamp in changedDays:
+            mixerData = self.__mixDay(dayTimestamp)
+            if mixerData is not None:
+                values.append(mixerData)
+            else:
+                emptyDays.append(dayTimestamp)
+        self.__computeEt0(values)
+
+        if (forecast.id is not None and values) or emptyDays:
+            globalDbManager.mixerDatabase.executeBatch(self.__storeValues, forecast, values, emptyDays)
+        if unprocessedForecasts:
+            self.forecastTable.markRecordsAsProcessed(unprocessedForecasts.keys())
+
+        return values
+
+    def __storeValues(self, forecast, values, emptyDays):
+        ### Runs on the DB thread inside a batch. The mixed values of the empty days (from parsers that were
+        ### disabled since) are removed.
+        if emptyDays:
+            self.mixerDataTable.deleteRecordsByDays(emptyDays)
+        if forecast.id is not None and values:
+            self.mixerDataTable.addRecords(forecast.id, forecast.timestamp, values)
+
+    def __isParserEnabled(self, parserID):
+        parserConfig = self.parserManager.findParserConfig(parserID)
+        return parserConfig is not None and parserConfig.enabled
+
+    def __getParserPriority(self, parserID):
+        parserConfig = self.parserManager.findParserConfig(parserID)
+        parser = self.parserManager.parsers.get(parserConfig, None)
+        if parser is None:
+            return 0.0
+        return max(0.0, float(parser.parserPriority))
+
+    def __getQuality(self, parserID, forecastInfo, dayTimestamp):
+        ### How much a parser day can be trusted: past days are observations (or estimates from forecast only
+        ### parsers), future days lose forecastDecay for every day they are ahead of the forecast.
+        forecastDayTimestamp = rmGetStartOfDay(forecastInfo.timestamp)
+        if dayTimestamp < forecastDayTimestamp:
+            parserConfig = self.parserManager.findParserConfig(parserID)
+            parser = self.parserManager.parsers.get(parserConfig, None)
+            if parser is not None and parser.parserHistorical:
+                return self.observedQuality
+            return self.forecastedQuality
+
+        leadDays = (dayTimestamp - forecastDayTimestamp) / 86400
+        return 1.0 / (1.0 + self.forecastDecay * leadDays)
+
+    def __summarizeDays(self, values):
+        ### Aggregates hourly RMWeatherData into {dayTimestamp: RMMixerData}.
+        sums = {}
+        for value in sorted(values, key = lambda value: value.timestamp):
+            dayTimestamp = rmGetStartOfDay(value.timestamp)
+            day = sums.get(dayTimestamp, None)
+            if day is None:
+                day = sums[dayTimestamp] = {}
+
+            for name in RMMixer.MeanFields + RMMixer.SumFields + RMMixer.FirstFields:
+                fieldValue = getattr(value, name)
+                if fieldValue is not None:
+                    day.setdefault(name, []).append(fieldValue)
+
+            for name, fields in (("minTemp", ("minTemperature", "temperature")), ("maxTemp", ("maxTemperature", "temperature")),
+                                 ("minRH", ("minRh", "rh")), ("maxRH", ("maxRh", "rh"))):
+                for field in fields:
+                    fieldValue = getattr(value, field)
+                    if fieldValue is not None:
+                        day.setdefault(name, []).append(fieldValue)
+                        break
+
+            if value.condition is not None:
+                day["condition"] = value.condition
+
+        days = {}
+        for dayTimestamp, day in sums.iteritems():
+            summary = RMMixerData(dayTimestamp)
+            for name, fieldValues in day.iteritems():
+                if name in RMMixer.MeanFields:
+                    setattr(summary, name, sum(fieldValues) / float(len(fieldValues)))
+                elif name in RMMixer.SumFields:
+                    setattr(summary, name, sum(fieldValues))
+                elif name in RMMixer.FirstFields:
+                    setattr(summary, name, fieldValues[0])
+                elif name in ("maxTemp", "maxRH"):
+                    setattr(summary, name, max(fieldValues))
+                elif name in ("minTemp", "minRH"):
+                    setattr(summary, name, min(fieldValues))
+                elif name == "condition":
+                    summary.condition = fieldValues # the last one of the day
+            days[dayTimestamp] = summary
+        return days
+
+    def __mixDay(self, dayTimestamp):
+        entries = []
+        for parserID, parserDays in self.__parserDays.iteritems():
+            entry = parserDays.get(dayTimestamp, None)
+            if entry is not None:
+                forecastInfo, summary = entry
+                weight = self.__getParserPriority(parserID) * self.__getQuality(parserID, forecastInfo, dayTimestamp)
+                if weight > 0:
+                    entries.append((weight, summary))
+
+        if not entries:
+            return None
+
+        mixerData = RMMixerData(dayTimestamp)
+        for name in RMMixer.BlendFields:
+            total = 0.0
+            totalWeight = 0.0
+            for weight, summary in entries:
+                value = getattr(summary, name)
+                if value is not None:
+                    total += weight * value
+                    totalWeight += weight
+            if totalWeight > 0:
+                setattr(mixerData, name, round(total / totalWeight, 2))
+
+        conditions = [(weight, summary.condition) for weight, summary in entries if summary.condition is not None]
+        if conditions:
+            mixerData.condition = max(conditions)[1]
+
+        return mixerData
+
+    def __computeEt0(self, values):
+        ### Sets et0calc and et0final of the mixed days, et0final prefers the ET0 reported by parsers.
+        location = globalSettings.location
+        days = [mixerData for mixerData in values if mixerData.minTemp is not None and mixerData.maxTemp is not None]
+        if days and location.latitude is not None:
+            dates = [rmTimestampToYearMonthDay(mixerData.timestamp) for mixerData in days]
+            try:
+                et0s, etrs = asceDailyBatch([date[0] for date in dates], [date[1] for date in dates], [date[2] for date in dates],
+                                            [mixerData.minTemp for mixerData in days], [max(mixerData.minTemp, mixerData.maxTemp) for mixerData in days],
+                                            [mixerData.wind for mixerData in days], None, location.latitude, location.elevation,
+                                            [mixerData.solarRad for mixerData in days], None,
+                                            [mixerData.minRH for mixerData in days], [mixerData.maxRH for mixerData in days],
+                                            [mixerData.pressure for mixerData in days], location.krs, [mixerData.dewPoint for mixerData in days])
+                for mixerData, et0 in zip(days, et0s):
+                    if et0 == et0: # NaN when the day can't be computed
+                        mixerData.et0calc = round(float(et0), 2)
+            except Exception, e:
+                log.error("  * Mixer: cannot compute ET0 for %d days" % len(days))
+                log.exception(e)
+
+        for mixerData in values:
+            if mixerData.et0 is not None:
+                mixerData.et0final = mixerData.et0
+            elif mixerData.et0calc is not None:
+                mixerData.et0final = mixerData.et0calc
+            else:
+                mixerData.et0final = location.et0Average
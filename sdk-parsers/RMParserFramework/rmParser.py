@@ -7,25 +7,90 @@
 from functools import wraps
 import errno
 import os
-import signal
+import socket
+import time
 import urllib, urllib2, ssl
 import sys
 import datetime
+import threading
 
 from RMDataFramework.rmWeatherData import *
+from RMDataFramework.rmWeatherDataFrame import RMWeatherDataFrame
 from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmHttpConnectionPool import globalHttpConnectionPool
+from RMUtilsFramework.rmHttpCache import globalHttpCache
 from RMUtilsFramework.rmTimeUtils import rmCurrentDayTimestamp, rmGetStartOfDayUtc
 from RMFormulaFramework.formula import asceDaily
-USE_THREADING__ = False
 ALLOW_HISTORIC_PARSERS = True
 
 class RMTimeoutError(Exception):
     pass
 
-def _handle_timeout(signum, frame):
-    error_message = os.strerror(errno.ETIME)
-    log.error("*** Timeout occurred while running a parser: %s" % error_message)
-    raise RMTimeoutError(error_message)
+#----------------------------------------------------------------------------------------
+# Deadline of a single perform() call. Works from any thread: when it expires the
+# parser is flagged and the sockets of its in-flight responses are shut down so that
+# blocking reads return immediately.
+#
+class RMParserDeadline:
+    def __init__(self, parser, seconds):
+        self.parser = parser
+        self.seconds = seconds
+        self.startTimestamp = time.time()
+        self.expired = False
+
+        self.__lock = threading.Lock()
+        self.__responses = []
+        self.__timer = threading.Timer(seconds, self.expire)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def remaining(self):
+        return max(0, self.seconds - (time.time() - self.startTimestamp))
+
+    def check(self):
+        if self.expired:
+            raise RMTimeoutError(os.strerror(errno.ETIME))
+
+    def track(self, response):
+        with self.__lock:
+            if self.expired:
+                self.__shutdownResponse(response)
+            else:
+                self.__responses.append(response)
+
+    def expire(self):
+        with self.__lock:
+            self.expired = True
+            responses = self.__responses
+            self.__responses = []
+
+        log.error("*** Timeout occurred while running parser %s after %d seconds" % (self.parser.parserName, self.seconds))
+        for response in responses:
+            self.__shutdownResponse(response)
+
+    def cancel(self):
+        self.__timer.cancel()
+        with self.__lock:
+            self.__responses = []
+
+    def __shutdownResponse(self, response):
+        # Walk down the urllib2/httplib file object wrappers until the socket is found.
+        obj = response
+        for i in range(6):
+            if obj is None:
+                break
+            if isinstance(obj, socket.socket) or hasattr(obj, "shutdown"):
+                try:
+                    obj.shutdown(socket.SHUT_RDWR)
+                except Exception, e:
+                    pass
+                break
+            obj = getattr(obj, "fp", None) or getattr(obj, "_sock", None)
+
+        try:
+            response.close()
+        except Exception, e:
+            pass
 
 class RMParserType(type):
     def __init__(cls, name, bases, attrs):
@@ -38,21 +103,26 @@ class RMParserType(type):
             # Add timeout to perform function
             if hasattr(cls, "perform"):
                 def timedPerform(self):
-                    global USE_THREADING__
-                    if not USE_THREADING__:
-                        seconds = 10 * 60
-                        _old_handler = signal.signal(signal.SIGALRM, _handle_timeout)
-                        signal.alarm(seconds)
+                    self.runtimeDeadline = RMParserDeadline(self, self.parserTimeout)
                     try:
                         result = attrs["perform"](self)
-                    except RMTimeoutError, e:
-                        log.error("*** Timeout occurred while running parser %s" % self.parserName)
-                        log.exception(e)
-                        return None
+                    except Exception, e:
+                        if not self.runtimeDeadline.expired:
+                            raise
+                        log.debug("*** Parser %s interrupted by timeout: %s" % (self.parserName, e))
+                        result = None
                     finally:
-                        if not USE_THREADING__:
-                            signal.alarm(0)
-                            signal.signal(signal.SIGALRM, _old_handler)
+                        self.runtimeDeadline.cancel()
+                        self.lastRunElapsed = time.time() - self.runtimeDeadline.startTimestamp
+                        self.totalRunElapsed += self.lastRunElapsed
+                        self.runCount += 1
+
+                    if self.runtimeDeadline.expired:
+                        # Values collected before the deadline are most likely incomplete
+                        self.timeoutCount += 1
+                        self.lastKnownError = "Error: Timeout while running"
+                        self.clearValues()
+                        return None
 
                     return result
 
@@ -82,6 +152,8 @@ class RMParser(object):
     parserForecast = False
     parserHistorical = False
     parserInterval = 60 * 60 * 3
+    parserTimeout = 10 * 60 # maximum running time of a single perform() call in seconds
+    parserPriority = 1.0 # weight of the parser values when the mixer blends several parsers, 0 ignores them
     parserEnabled = False
     parserDebug = False
     params = {}
@@ -92,8 +164,16 @@ class RMParser(object):
     lastKnownError = ''
     isRunning = False
 
+    runtimeDeadline = None
+    runCount = 0
+    timeoutCount = 0
+    lastRunElapsed = 0
+    totalRunElapsed = 0
+    resultFrame = None # RMWeatherDataFrame filled by addColumn()/addFrame()
+
     def __init__(self):
         self.result = {}
+        self.resultFrame = None
         self.settings = {} #set from parserManager
         self.runtime = {RMParser.RuntimeDayTimestamp: 0}
 
@@ -114,15 +194,25 @@ class RMParser(object):
 
         log.debug("Parser '%s': downloading from %s" % (self.parserName, url))
 
+        timeout = 60
+        if self.runtimeDeadline is not None:
+            self.runtimeDeadline.check()
+            timeout = max(1, min(timeout, self.runtimeDeadline.remaining()))
+
         try:
             req = urllib2.Request(url=url, headers=headers)
-            res = urllib2.urlopen(url=req, timeout=60)
+            res = globalHttpCache.open(req, lambda req: self.__trackResponse(globalHttpConnectionPool.open(req, timeout=timeout)))
+            self.__trackResponse(res)
             return res
         except Exception, e:
-            if hasattr(ssl, '_create_unverified_context'): #for mac os only in order to ignore invalid certificates
+            # Only a failed https handshake is worth retrying, HTTP errors and timeouts would fail the same way again
+            retryUnverified = url.startswith("https") and not isinstance(e, (urllib2.HTTPError, socket.timeout)) and \
+                              not (isinstance(e, urllib2.URLError) and isinstance(e.reason, socket.timeout))
+            if retryUnverified and hasattr(ssl, '_create_unverified_context'): #for mac os only in order to ignore invalid certificates
                 try:
                     context = ssl._create_unverified_context()
-                    res = urllib2.urlopen(url=req, timeout=60, context=context)
+                    res = globalHttpCache.open(req, lambda req: self.__trackResponse(globalHttpConnectionPool.open(req, timeout=timeout, context=context)))
+                    self.__trackResponse(res)
                     return res
                 except Exception, e:
                     log.error("*** Error in parser '%s' while downloading data from %s, error: %s" % (self.parserName, url, e))
@@ -134,6 +224,11 @@ class RMParser(object):
                 self.lastKnownError = "Error: Can not open url"
         return None
 
+    def __trackResponse(self, response):
+        if self.runtimeDeadline is not None:
+            self.runtimeDeadline.track(response)
+        return response
+
     def addValue(self, key,timestamp, value, roundToHour = True):
         if timestamp == None:
             log.error("*** Parser '%s': error adding single value - ignoring None timestamp!" % self.parserName)
@@ -174,14 +269,43 @@ class RMParser(object):
                 self.result[timestamp] = RMWeatherData(timestamp)
             self.result[timestamp].setUserValue(key, value)
 
+    def addColumn(self, key, timestamps, values, roundToHour = True):
+        ### Columnar addValues(): timestamps and values are aligned lists, no per hour object is created.
+        return self.__getResultFrame().addColumn(key, timestamps, values, self.__getMinTimestamp())
+
+    def addFrame(self, timestamps, columns, roundToHour = True):
+        ### Several addColumn() sharing the same timestamps, columns is {RMWeatherDataType key: values}.
+        return self.__getResultFrame().addColumns(timestamps, columns, self.__getMinTimestamp())
+
+    def __getResultFrame(self):
+        if self.resultFrame is None:
+            self.resultFrame = RMWeatherDataFrame()
+        return self.resultFrame
+
+    def __getMinTimestamp(self):
+        if ALLOW_HISTORIC_PARSERS:
+            return None
+        return self.runtime[RMParser.RuntimeDayTimestamp]
+
     def clearValues(self):
         self.result.clear()
+        self.resultFrame = None
 
     def hasValues(self):
-        return (self.result and True) or False
+        return (self.result and True) or (self.resultFrame and True) or False
 
     def getValues(self):
-        return self.result.values()
+        ### A list of RMWeatherData or, if the parser used addColumn()/addFrame(), a RMWeatherDataFrame.
+        ### Values added with addValue() are merged into the frame and take precedence over the columns.
+        if self.resultFrame is None:
+            return self.result.values()
+
+        for value in self.result.values():
+            self.resultFrame.addRecord(value)
+        self.result.clear()
+        return self.resultFrame
 
     def dump(self):
-        log.debug("%s" % (self.result))
\ No newline at end of file
+        log.debug("%s" % (self.result))
+        if self.resultFrame is not None:
+            log.debug("%s" % (self.resultFrame.toWeatherData()))
\ No newline at end of file
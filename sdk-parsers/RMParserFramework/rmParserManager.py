@@ -5,6 +5,9 @@ import time, copy
 from pprint import pprint
 
 from RMParserFramework.rmParser import RMParser
+from RMParserFramework.rmParserScheduler import RMParserScheduler
+from RMParserFramework.rmParserManifest import RMParserManifest, RMLazyParser
+from RMParserFramework.rmMixer import RMMixer
 
 from RMDataFramework.rmForecastInfo import RMForecastInfo
 from RMDataFramework.rmParserConfig import RMParserConfig
@@ -14,6 +17,10 @@ from RMDatabaseFramework.rmParserDataTable import *
 from RMDatabaseFramework.rmForecastInfoTable import RMForecastTable
 from RMDatabaseFramework.rmUserDataTypeTable import RMUserDataTypeTable
 from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmThreadPool import RMThreadPool
+from RMUtilsFramework.rmThreadWatcher import RMThreadWatcher
+from RMUtilsFramework.rmHttpConnectionPool import globalHttpConnectionPool
+from RMUtilsFramework.rmHttpCache import globalHttpCache
 from RMUtilsFramework.rmTimeUtils import *
 
 from RMDataFramework.rmMainDataRecords import RMNotification
@@ -35,13 +42,17 @@ class RMParserManager:
         self.__maxFails = 100
         self.__minDelayBetweenFails = 120 # 2 min
         self.__maxDelayBetweenFails = 300 # 5 min
-        self.__stepDelayBetweenFails = 30 # 30 seconds
         self.__delayAfterMaxFails = 86400 # 1 day
 
-        self.__lastRunningTimestamp = None # The timestamp when parsers last attempted to run
         self.__lastUpdateTimestamp = 0 # The timestamp when parsers actually ran
-        self.__runningInterval = 60 # 1 minute
+        self.__scheduler = RMParserScheduler(self.__minDelayBetweenFails, self.__maxDelayBetweenFails, self.__maxFails, self.__delayAfterMaxFails)
+        self.__scheduleInitialized = False
+        self.__maxConcurrentParsers = 4
+        self.__parserTimeoutGrace = 15 # seconds a timed out parser gets to wind down before its worker is abandoned
 
+        self.__parserPool = RMThreadPool("Parser", self.__maxConcurrentParsers)
+
+        globalHttpCache.enable(os.path.join(globalSettings.databasePath, "http-cache"))
 
         self.parserTable = RMParserTable(globalDbManager.parserDatabase)
         self.parserDataTable = RMParserDataTable(globalDbManager.parserDatabase)
@@ -51,7 +62,7 @@ class RMParserManager:
 
         self.userDataTypeTable.buildCache()
 
-        self.mixer = None
+        self.mixer = RMMixer(self)
 
         self.__load(os.path.dirname(__file__) + '/parsers')
 
@@ -70,55 +81,59 @@ class RMParserManager:
                 if lastForecast == None:
                     lastForecast = parserConfig.runtimeLastForecastInfo
 
-        log.debug("*** All values are already mixed! No need to run the Mixer!")
+        mixerDataValues = None
+        if unmixedForecastAvailable:
+            mixerDataValues = self.__runMixer(None)
+        else:
+            log.debug("*** All values are already mixed! No need to run the Mixer!")
 
         for parserConfig in self.parsers:
             self.parserDataTable.clearHistory(parserConfig.dbID, False)
         globalDbManager.parserDatabase.commit()
         globalDbManager.parserDatabase.vacuum()
 
-        return None, None
+        self.__initSchedule(rmCurrentTimestamp())
+
+        if mixerDataValues is None:
+            return None, None
+        return lastForecast, mixerDataValues
 
     def run(self, parserId = None, forceRunParser = False, forceRunMixer = False):
         currentTimestamp = rmCurrentTimestamp()
-        forceRunParser = True
 
-        if not forceRunParser and self.__lastRunningTimestamp is not None and (currentTimestamp - self.__lastRunningTimestamp) < self.__runningInterval:
-            # We want to run the parser only each N minutes. This condition is not met, try later.
-            log.debug("Parser %r not run lastRunning timestamp %s current %s" % (parserId, self.__lastRunningTimestamp, currentTimestamp))
-            return None, None
+        if not self.__scheduleInitialized:
+            self.__initSchedule(currentTimestamp)
 
-        self.__lastRunningTimestamp = currentTimestamp
+        if forceRunParser or self.forceParsersRun or parserId is not None:
+            parserConfigs = [parserConfig for parserConfig in self.parsers if parserId is None or parserId == parserConfig.dbID]
+        else:
+            parserConfigs = self.__scheduler.popDue(currentTimestamp)
+            if not parserConfigs and not forceRunMixer:
+                return None, None
 
         newValuesAvailable = False
         newForecast = RMForecastInfo(None, currentTimestamp)
 
         log.debug("*** BEGIN Running parsers: %d (%s)" % (newForecast.timestamp, rmTimestampToDateAsString(newForecast.timestamp)))
-        for parserConfig in self.parsers:
-            if parserId is not None and parserId != parserConfig.dbID:
-                continue
-
+        runningParsers = []
+        parsersWithValues = []
+        for parserConfig in parserConfigs:
             log.debug("   * Parser: %s -> %s" % (parserConfig, parserConfig.runtimeLastForecastInfo))
             if parserConfig.enabled:
                 if parserConfig.failCounter >= self.__maxFails:
-                    if forceRunParser or parserConfig.lastFailTimestamp is None or (abs(newForecast.timestamp - parserConfig.lastFailTimestamp) >= self.__delayAfterMaxFails):
-                        parserConfig.failCounter = 0
-                        parserConfig.lastFailTimestamp = None
-                    else:
-                        if parserConfig.failCounter == self.__maxFails:
-                            log.warning("     * Parser: %s - ignored because of lack of data (failCounter=%s, lastFail=%s)!" %
-                                        (parserConfig, `parserConfig.failCounter`, rmTimestampToDateAsString(parserConfig.lastFailTimestamp)))
-                            parserConfig.failCounter += 1 # Increment this to get rid of the above message.
-                        continue
+                    # Either forced or the scheduler already waited __delayAfterMaxFails
+                    parserConfig.failCounter = 0
+                    parserConfig.lastFailTimestamp = None
                 elif parserConfig.failCounter > 0:
-                    retryDelay = min(self.__minDelayBetweenFails + (parserConfig.failCounter - 1) * self.__stepDelayBetweenFails, self.__maxDelayBetweenFails)
-                    nextRetryTimestamp = parserConfig.lastFailTimestamp + retryDelay
-                    if newForecast.timestamp < nextRetryTimestamp:
-                        log.debug("     * Ignored because retry delay %d (sec) was not reached" % retryDelay)
-                        continue
                     log.debug("     * Parser retry after previous fail")
 
-                parser = self.parsers[parserConfig]
+                try:
+                    parser = self.__resolveParser(parserConfig)
+                except Exception, e:
+                    log.error("  * Cannot import parser %s" % parserConfig.name)
+                    log.exception(e)
+                    self.__parserFailed(parserConfig, newForecast.timestamp)
+                    continue
 
                 lastUpdate = None
                 if parserConfig.runtimeLastForecastInfo:
@@ -130,56 +145,78 @@ class RMParserManager:
                 if lastUpdate is not None and lastUpdate > self.__lastUpdateTimestamp:
                     self.__lastUpdateTimestamp = lastUpdate
 
-                if not forceRunParser and not self.forceParsersRun and (lastUpdate != None and (newForecast.timestamp - lastUpdate) < parser.parserInterval):
-                    log.debug("     * Ignored because interval %d not expired for timestamp %d lastUpdate: %d" % (parser.parserInterval, newForecast.timestamp, lastUpdate))
+                if parser.isRunning:
+                    log.warning("     * Parser %s is still running from a previous cycle, skipping" % parser.parserName)
+                    self.__scheduler.schedule(parserConfig, currentTimestamp + self.__minDelayBetweenFails)
                     continue
 
                 log.debug("  * Running parser %s with interval %d" % (parser.parserName, parser.parserInterval))
                 parser.settings = globalSettings.getSettings()
                 parser.runtime[RMParser.RuntimeDayTimestamp] = rmCurrentDayTimestamp()
 
-                try:
-                    parser.lastKnownError = ''
-                    parser.isRunning = True
-                    parser.perform()
-                    parser.isRunning = False
-                except Exception, e:
-                    log.error("  * Cannot execute parser %s" % parser.parserName)
-                    log.exception(e)
-                    parser.isRunning = False
-                    if len(parser.lastKnownError) == 0:
-                        parser.lastKnownError = 'Error: Failed to run'
-
-                if not parser.hasValues():
-                    parserConfig.failCounter += 1
-                    parserConfig.lastFailTimestamp = newForecast.timestamp
-                    if len(parser.lastKnownError) == 0:
-                        parser.lastKnownError = 'Error: parser returned no values'
-                    parser.isRunning = False
-                    if parserConfig.failCounter == 1:
-                        log.warn ("  * Parser %s returned no values" % parser.parserName)
-                    continue
+                task = self.__parserPool.submit(parser.parserName, self.__performParser, (parser, ), timeout = parser.parserTimeout + self.__parserTimeoutGrace)
+                if task is not None:
+                    runningParsers.append((parserConfig, parser, task))
 
+        #---------------------------------------------------------------------------
+        # Parsers are running in parallel, wait for each one up to its own deadline and
+        # store their values from this thread (database writes are serialized on the DB thread).
+        # Waiting can take longer than the thread watcher timeout of the calling thread, keep it updated.
+        for parserConfig, parser, task in runningParsers:
+            if not task.wait(pollCallback = self.__updateThreadWatcher):
+                self.__parserPool.abandon(task)
+                log.error("  * Parser %s didn't finish in %d seconds, ignoring its values" % (parser.parserName, task.timeout))
+                parser.lastKnownError = 'Error: Timeout while running'
+                parser.timeoutCount += 1
+                self.__parserFailed(parserConfig, newForecast.timestamp)
+                continue
 
-                parserConfig.failCounter = 0
-                parserConfig.lastFailTimestamp = None
+            log.debug("  * Parser %s finished in %.2f seconds (runs: %d, timeouts: %d, average: %.2f seconds)" % \
+                      (parser.parserName, task.elapsed, parser.runCount, parser.timeoutCount, parser.totalRunElapsed / max(1, parser.runCount)))
 
-                if newForecast.id == None:
-                    self.forecastTable.addRecordEx(newForecast)
-                parserConfig.runtimeLastForecastInfo = newForecast
+            if not parser.hasValues():
+                if len(parser.lastKnownError) == 0:
+                    parser.lastKnownError = 'Error: parser returned no values'
+                if parserConfig.failCounter == 0:
+                    log.warn ("  * Parser %s returned no values" % parser.parserName)
+                self.__parserFailed(parserConfig, newForecast.timestamp)
+                continue
 
-                if not globalSettings.vibration:
-                    self.parserDataTable.removeEntriesWithParserIdAndTimestamp(parserConfig.dbID, parser.getValues())
 
-                self.parserDataTable.addRecords(newForecast.id, parserConfig.dbID, parser.getValues())
-                parser.clearValues()
+            parserConfig.failCounter = 0
+            parserConfig.lastFailTimestamp = None
+            self.__scheduler.scheduleNext(parserConfig, parser.parserInterval, newForecast.timestamp)
 
+            parsersWithValues.append((parserConfig, parser))
+
+        #---------------------------------------------------------------------------
+        # Store the values of all parsers as a single unit of work on the DB thread.
+        if parsersWithValues:
+            try:
+                globalDbManager.parserDatabase.executeBatch(self.__storeParserValues, newForecast, parsersWithValues)
                 newValuesAvailable = True
+            except Exception, e:
+                log.error("  * Cannot store the values of %d parsers" % len(parsersWithValues))
+                log.exception(e)
+                newForecast.id = None
+
+            for parserConfig, parser in parsersWithValues:
+                if newValuesAvailable:
+                    parserConfig.runtimeLastForecastInfo = newForecast
+                parser.clearValues()
+
+        if runningParsers:
+            globalHttpConnectionPool.dumpStats()
+            globalHttpCache.dumpStats()
+            globalHttpConnectionPool.clear()
 
         mixerDataValues = None
-        if newValuesAvailable:
-            globalDbManager.parserDatabase.vacuum()
+        if newValuesAvailable or forceRunMixer:
+            if newValuesAvailable:
+                globalDbManager.parserDatabase.vacuum()
 
+            # A forced run without new values mixes under the newest parser forecast
+            mixerDataValues = self.__runMixer(newForecast if newValuesAvailable else None, forceRunMixer)
             if not mixerDataValues is None:
                 for parserConfig in self.parsers:
                     if parserConfig.runtimeLastForecastInfo:
@@ -190,6 +227,83 @@ class RMParserManager:
         log.debug("*** END Running parsers: %s, %d (%s)" % (`newForecast.id`, newForecast.timestamp, rmTimestampToDateAsString(newForecast.timestamp)))
         return newForecast, mixerDataValues
 
+    def __runMixer(self, forecast, forceAll = False):
+        try:
+            return self.mixer.run(forecast, forceAll)
+        except Exception, e:
+            log.error("  * Cannot run the mixer")
+            log.exception(e)
+        return None
+
+    def stop(self):
+        self.__parserPool.stop()
+
+    def getNextRunTimestamp(self):
+        if not self.__scheduleInitialized:
+            return None
+        return self.__scheduler.nextDueTimestamp()
+
+    def __initSchedule(self, currentTimestamp):
+        self.__scheduler.clear()
+        for parserConfig in self.parsers:
+            self.__scheduleParser(parserConfig, currentTimestamp)
+        self.__scheduleInitialized = True
+
+    def __scheduleParser(self, parserConfig, currentTimestamp):
+        if not parserConfig.enabled:
+            self.__scheduler.remove(parserConfig)
+            return
+
+        parser = self.parsers[parserConfig]
+        lastUpdate = None
+        if parserConfig.runtimeLastForecastInfo and parserConfig.runtimeLastForecastInfo.timestamp <= currentTimestamp:
+            lastUpdate = parserConfig.runtimeLastForecastInfo.timestamp
+
+        if lastUpdate is None:
+            self.__scheduler.schedule(parserConfig, currentTimestamp)
+        else:
+            self.__scheduler.scheduleNext(parserConfig, parser.parserInterval, lastUpdate)
+
+    def __parserFailed(self, parserConfig, timestamp):
+        parserConfig.failCounter += 1
+        parserConfig.lastFailTimestamp = timestamp
+        retryDelay = self.__scheduler.scheduleRetry(parserConfig, parserConfig.failCounter, timestamp)
+
+        if parserConfig.failCounter == self.__maxFails:
+            log.warning("     * Parser: %s - ignored because of lack of data (failCounter=%s, lastFail=%s)!" %
+                        (parserConfig, `parserConfig.failCounter`, rmTimestampToDateAsString(parserConfig.lastFailTimestamp)))
+        else:
+            log.debug("     * Parser %s will retry in %d seconds" % (parserConfig.name, retryDelay))
+
+    def __updateThreadWatcher(self):
+        if RMThreadWatcher.instance is not None:
+            RMThreadWatcher.instance.updateThread()
+
+    def __storeParserValues(self, newForecast, parsersWithValues):
+        ### Runs on the DB thread inside a batch.
+        self.forecastTable.addRecordEx(newForecast)
+
+        for parserConfig, parser in parsersWithValues:
+            if not globalSettings.vibration:
+                self.parserDataTable.removeEntriesWithParserIdAndTimestamp(parserConfig.dbID, parser.getValues())
+
+            self.parserDataTable.addRecords(newForecast.id, parserConfig.dbID, parser.getValues())
+
+    def __performParser(self, parser):
+        ### Runs on one of the parser pool threads.
+        try:
+            parser.lastKnownError = ''
+            parser.isRunning = True
+            parser.clearValues()
+            parser.perform()
+        except Exception, e:
+            log.error("  * Cannot execute parser %s" % parser.parserName)
+            log.exception(e)
+            if len(parser.lastKnownError) == 0:
+                parser.lastKnownError = 'Error: Failed to run'
+        finally:
+            parser.isRunning = False
+
 
     def __load(self, parserDir):
         log.info("*** BEGIN Loading parsers from '%s'" % parserDir)
@@ -221,61 +335,101 @@ class RMParserManager:
                         fileEntry["path"] = modPath
 
         #---------------------------------------------------------------------------
+        # Parsers already known to the database and unchanged since the last boot are
+        # registered from the manifest, their module is imported when they first run.
         #
-        #
+        manifest = RMParserManifest(os.path.join(globalSettings.databasePath, "parsers-manifest.json"))
+        manifest.load()
+        storedParsers = self.parserTable.getParserConfigsWithParams()
+
         for fileEntry in fileMap.values():
+            if fileEntry["ext"] not in (".py", ".pyc"):
+                continue
+
+            attributes = manifest.get(fileEntry)
+            if attributes is not None:
+                stored = storedParsers.get((fileEntry["file"], attributes["parserName"]), None)
+                if stored is not None:
+                    parserConfig, params = stored
+                    parser = RMLazyParser(fileEntry, attributes)
+                    self.__registerParser(parserConfig, parser, False, params)
+                    log.debug("  * Parser %s registered from manifest for file '%s'" % (attributes["parserName"], fileEntry["path"]))
+                    continue
+
             try:
                 if fileEntry["ext"] == ".pyc" :
                     module = imp.load_compiled(fileEntry["name"], fileEntry["path"])
-                elif fileEntry["ext"] == ".py" :
-                    module = imp.load_source(fileEntry["name"], fileEntry["path"])
                 else:
-                    continue
+                    module = imp.load_source(fileEntry["name"], fileEntry["path"])
             except Exception as e:
                 log.error("  * Error loading parser %s from file '%s'" % (fileEntry["name"], fileEntry["path"]))
                 log.exception(e)
+                manifest.remove(fileEntry)
                 continue
             try:
                 log.debug("  * Parser %s successful loaded from file '%s'" % (fileEntry["name"], fileEntry["path"]))
                 parser = RMParser.parsers[-1] # Last added parser
-                enabled = parser.isEnabledForLocation(globalSettings.location.timezone, \
-                                                      globalSettings.location.latitude, \
-                                                      globalSettings.location.longitude
-                                                      )
-
-                parserConfig, isNew = self.parserTable.addParser(fileEntry["file"], parser.parserName, enabled, parser.params)
-                parser.defaultParams = parser.params.copy() # save the default parser params for an eventual params reset
-
-                if not isNew:
-                    params = self.parserTable.getParserParams(parserConfig.dbID)
-                    unusedKeyList = []
-                    if params:
-                        for key in params:
-                            bFound = False
-                            for pkey in parser.params:
-                                if key == pkey:
-                                    bFound = True
-                            if not bFound:
-                                unusedKeyList.append(key)
+                manifest.update(fileEntry, parser)
 
-                        for key in unusedKeyList:
-                            params.pop(key, None)
-
-                        parser.params.update(params)
-                        self.parserTable.updateParserParams(parserConfig.dbID, parser.params)
-
-                self.parsers[parserConfig] = parser
+                stored = storedParsers.get((fileEntry["file"], parser.parserName), None)
+                if stored is not None:
+                    parserConfig, params = stored
+                    isNew = False
+                else:
+                    enabled = parser.isEnabledForLocation(globalSettings.location.timezone, \
+                                                          globalSettings.location.latitude, \
+                                                          globalSettings.location.longitude
+                                                          )
 
-                parserConfig.userDataTypes = self.userDataTypeTable.addRecords(parser.userDataTypes)
-                self.parserUserDataTypeTable.addRecords(parserConfig.dbID, parserConfig.userDataTypes)
+                    parserConfig, isNew = self.parserTable.addParser(fileEntry["file"], parser.parserName, enabled, parser.params)
+                    params = None if isNew else self.parserTable.getParserParams(parserConfig.dbID)
 
-                log.debug(parserConfig)
+                self.__registerParser(parserConfig, parser, isNew, params)
             except Exception, e:
                 log.info("Failed to register parser from file : %s. Error: %s" % (fileEntry["name"], e))
                 RMParser.parsers.pop()
 
+        manifest.save()
         log.info("*** END Loading parsers")
 
+    def __registerParser(self, parserConfig, parser, isNew, params):
+        parser.defaultParams = parser.params.copy() # save the default parser params for an eventual params reset
+
+        if not isNew and params:
+            unusedKeyList = []
+            for key in params:
+                bFound = False
+                for pkey in parser.params:
+                    if key == pkey:
+                        bFound = True
+                if not bFound:
+                    unusedKeyList.append(key)
+
+            for key in unusedKeyList:
+                params.pop(key, None)
+
+            newParams = parser.params.copy()
+            newParams.update(params)
+            parser.params = newParams
+            if unusedKeyList or len(params) != len(parser.params):
+                self.parserTable.updateParserParams(parserConfig.dbID, parser.params)
+
+        self.parsers[parserConfig] = parser
+
+        parserConfig.userDataTypes = self.userDataTypeTable.addRecords(parser.userDataTypes)
+        if parserConfig.userDataTypes:
+            self.parserUserDataTypeTable.addRecords(parserConfig.dbID, parserConfig.userDataTypes)
+
+        log.debug(parserConfig)
+
+    def __resolveParser(self, parserConfig):
+        ### Imports a parser registered from the manifest the first time it has to run.
+        parser = self.parsers[parserConfig]
+        if isinstance(parser, RMLazyParser):
+            parser = parser.load()
+            self.parsers[parserConfig] = parser
+        return parser
+
     def findParserConfig(self, parserID):
         for parserConfig in self.parsers:
             if parserConfig.dbID == parserID:
@@ -309,6 +463,8 @@ class RMParserManager:
             parser.params = newParams
             self.parserTable.updateParserParams(parserConfig.dbID, parser.params)
             self.parserDataTable.deleteRecordsByParser(parserConfig.dbID)
+            if self.__scheduleInitialized and parserConfig.enabled:
+                self.__scheduler.schedule(parserConfig, rmCurrentTimestamp())
 
         return True
 
@@ -335,6 +491,8 @@ class RMParserManager:
 
         parserConfig.enabled = (activate == True)
         self.parserTable.enableParser(parserConfig.dbID, parserConfig.enabled)
+        if self.__scheduleInitialized:
+            self.__scheduleParser(parserConfig, rmCurrentTimestamp())
 
         return True
 
@@ -371,6 +529,7 @@ class RMParserManager:
 
             log.debug(parserConfig)
 
+            self.__scheduleInitialized = False # replaced parser configs are picked up on the next run
             return True
 
         except Exception as e:
@@ -385,6 +544,19 @@ class RMParserManager:
 
         return False
 
+    def resetMixerToDefault(self):
+        ### Mixes again all the parser values still in the database.
+        log.info("**** BEGIN Reset mixer to default")
+
+        self.mixer.resetToDefault()
+        self.forecastTable.markAllRecordsAsNotProcessed()
+
+        lastForecast = self.forecastTable.getLastForecast()
+        mixerDataValues = self.__runMixer(lastForecast, True)
+
+        log.info("**** END Reset mixer to default")
+        return lastForecast, mixerDataValues
+
     def resetToDefault(self):
         log.info("**** BEGIN Reset parsers and mixer to default")
 
@@ -409,6 +581,7 @@ class RMParserManager:
 
                 self.parserTable.addParser(parserConfig.fileName, parserConfig.name, enabled, parser.params)
 
+            self.__scheduleInitialized = False
             result = True
         except Exception, e:
             log.exception(e)
@@ -0,0 +1,185 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+import os, json, copy, imp
+import hashlib
+from threading import RLock
+
+from RMParserFramework.rmParser import RMParser
+from RMUtilsFramework.rmJson import rmJsonParseString
+from RMUtilsFramework.rmLogging import log
+
+#----------------------------------------------------------------------------------------
+# Cache of the parser class attributes, keyed by the parser file and validated with
+# its mtime, size and md5. It allows registering a parser without importing its module.
+#
+class RMParserManifest:
+    Version = 2
+
+    # Class attributes that are known without importing the parser module
+    Attributes = [
+        "parserName",
+        "parserDescription",
+        "parserForecast",
+        "parserHistorical",
+        "parserInterval",
+        "parserTimeout",
+        "parserPriority",
+        "parserEnabled",
+        "parserDebug",
+        "params",
+        "userDataTypes",
+    ]
+
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self.entries = {}
+        self.hasChanges = False
+
+    def load(self):
+        self.entries = {}
+        try:
+            if os.path.exists(self.filePath):
+                with open(self.filePath, "r") as f:
+                    data = rmJsonParseString(f.read())
+                if data and data.get("version", None) == RMParserManifest.Version:
+                    self.entries = data.get("files", {})
+        except Exception, e:
+            log.error("Cannot load parsers manifest %s, all parsers will be imported" % self.filePath)
+            log.exception(e)
+            self.entries = {}
+
+    def save(self):
+        if not self.hasChanges:
+            return
+        try:
+            with open(self.filePath + ".tmp", "w") as f:
+                json.dump({"version": RMParserManifest.Version, "files": self.entries}, f)
+            os.rename(self.filePath + ".tmp", self.filePath)
+            self.hasChanges = False
+        except Exception, e:
+            log.error("Cannot save parsers manifest %s" % self.filePath)
+            log.exception(e)
+
+    def get(self, fileEntry):
+        ### Returns the cached attributes of the parser in fileEntry or None if the file changed.
+        entry = self.entries.get(fileEntry["path"], None)
+        if entry is None:
+            return None
+
+        try:
+            stat = os.stat(fileEntry["path"])
+        except OSError:
+            return None
+
+        if entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            # Touched (copied, restored from backup) files keep their entry if the content is the same
+            if entry["size"] != stat.st_size or entry["md5"] != self.__md5(fileEntry["path"]):
+                return None
+            entry["mtime"] = stat.st_mtime
+            self.hasChanges = True
+
+        return entry["attributes"]
+
+    def update(self, fileEntry, parser):
+        attributes = {}
+        for name in RMParserManifest.Attributes:
+            attributes[name] = getattr(parser, name, None)
+
+        # Only parsers whose attributes survive a JSON round trip unchanged can be loaded lazily
+        try:
+            if rmJsonParseString(json.dumps(attributes)) != attributes:
+                self.remove(fileEntry)
+                return
+            stat = os.stat(fileEntry["path"])
+        except Exception, e:
+            self.remove(fileEntry)
+            return
+
+        self.entries[fileEntry["path"]] = {
+            "file": fileEntry["file"],
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "md5": self.__md5(fileEntry["path"]),
+            "attributes": attributes
+        }
+        self.hasChanges = True
+
+    def remove(self, fileEntry):
+        if self.entries.pop(fileEntry["path"], None) is not None:
+            self.hasChanges = True
+
+    def __md5(self, path):
+        with open(path, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+
+#----------------------------------------------------------------------------------------
+# Stands in for a registered but not yet imported parser. Manifest attributes are served
+# directly, anything else imports the module and forwards to the real parser instance.
+#
+class RMLazyParser(object):
+    __loadLock = RLock()
+
+    # Runtime attributes the manager reads before a parser ever ran
+    Defaults = {
+        "lastKnownError": "",
+        "isRunning": False,
+        "runCount": 0,
+        "timeoutCount": 0,
+        "lastRunElapsed": 0,
+        "totalRunElapsed": 0,
+    }
+
+    def __init__(self, fileEntry, attributes):
+        object.__setattr__(self, "fileEntry", fileEntry)
+        object.__setattr__(self, "parser", None)
+        object.__setattr__(self, "attributes", copy.deepcopy(attributes))
+
+    def __repr__(self):
+        return "(lazy parser=" + `self.attributes.get("parserName", None)` + ", loaded=" + `self.parser is not None` + ")"
+
+    @property
+    def isLoaded(self):
+        return self.parser is not None
+
+    def load(self):
+        with RMLazyParser.__loadLock:
+            if self.parser is not None:
+                return self.parser
+
+            log.info("  * Importing parser %s from file '%s'" % (self.attributes["parserName"], self.fileEntry["path"]))
+            if self.fileEntry["ext"] == ".pyc":
+                imp.load_compiled(self.fileEntry["name"], self.fileEntry["path"])
+            else:
+                imp.load_source(self.fileEntry["name"], self.fileEntry["path"])
+
+            parser = RMParser.parsers[-1] # Last added parser
+            if parser.parserName != self.attributes["parserName"]:
+                log.warning("  * Parser file '%s' now contains %s instead of %s" % (self.fileEntry["path"], parser.parserName, self.attributes["parserName"]))
+
+            # Runtime state set on the proxy (params, defaultParams, errors) goes to the real parser
+            for name, value in self.attributes.items():
+                if name not in RMParserManifest.Attributes or name in ("params", ):
+                    setattr(parser, name, value)
+
+            object.__setattr__(self, "parser", parser)
+            return parser
+
+    def __getattr__(self, name):
+        if self.parser is not None:
+            return getattr(self.parser, name)
+        if name in self.attributes:
+            return self.attributes[name]
+        if name in RMLazyParser.Defaults:
+            return RMLazyParser.Defaults[name]
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        if self.parser is not None:
+            setattr(self.parser, name, value)
+        else:
+            self.attributes[name] = value
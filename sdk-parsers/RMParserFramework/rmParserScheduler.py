@@ -0,0 +1,94 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+import heapq, random
+from threading import Lock
+
+#----------------------------------------------------------------------------------------
+# Keeps the next due time of every enabled parser in a heap so each wake-up only
+# looks at the parsers that are due. Stale heap entries (rescheduled or removed
+# parsers) are skipped lazily when they reach the top.
+#
+class RMParserScheduler:
+    def __init__(self, minDelayBetweenFails, maxDelayBetweenFails, maxFails, delayAfterMaxFails):
+        self.minDelayBetweenFails = minDelayBetweenFails
+        self.maxDelayBetweenFails = maxDelayBetweenFails
+        self.maxFails = maxFails
+        self.delayAfterMaxFails = delayAfterMaxFails
+
+        self.jitterRatio = 0.05 # of the parser interval
+        self.maxJitter = 300 # seconds
+
+        self.__lock = Lock()
+        self.__heap = []
+        self.__entries = {} # parserConfig -> (dueTimestamp, sequence)
+        self.__sequence = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, parserConfig):
+        return parserConfig in self.__entries
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def schedule(self, parserConfig, dueTimestamp):
+        with self.__lock:
+            self.__sequence += 1
+            self.__entries[parserConfig] = (dueTimestamp, self.__sequence)
+            heapq.heappush(self.__heap, (dueTimestamp, self.__sequence, parserConfig))
+
+    def scheduleNext(self, parserConfig, interval, timestamp):
+        ### After a successful run. Jitter spreads parsers with the same interval apart.
+        jitter = random.uniform(0, min(self.maxJitter, interval * self.jitterRatio))
+        self.schedule(parserConfig, timestamp + interval + int(jitter))
+
+    def scheduleRetry(self, parserConfig, failCounter, timestamp):
+        ### After a failed run, exponential backoff between min and max delay.
+        if failCounter >= self.maxFails:
+            delay = self.delayAfterMaxFails
+        else:
+            delay = min(self.minDelayBetweenFails * (2 ** min(max(0, failCounter - 1), 16)), self.maxDelayBetweenFails)
+            delay += random.uniform(0, delay * 0.1)
+        self.schedule(parserConfig, timestamp + int(delay))
+        return int(delay)
+
+    def remove(self, parserConfig):
+        with self.__lock:
+            self.__entries.pop(parserConfig, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__heap = []
+            self.__entries = {}
+
+    def popDue(self, timestamp):
+        ### Returns the parser configs due at timestamp and takes them out of the schedule.
+        due = []
+        with self.__lock:
+            while self.__heap and self.__heap[0][0] <= timestamp:
+                dueTimestamp, sequence, parserConfig = heapq.heappop(self.__heap)
+                if self.__entries.get(parserConfig, None) == (dueTimestamp, sequence):
+                    del self.__entries[parserConfig]
+                    due.append(parserConfig)
+        return due
+
+    def nextDueTimestamp(self):
+        with self.__lock:
+            while self.__heap:
+                dueTimestamp, sequence, parserConfig = self.__heap[0]
+                if self.__entries.get(parserConfig, None) == (dueTimestamp, sequence):
+                    return dueTimestamp
+                heapq.heappop(self.__heap)
+        return None
+
+    def getDueTimestamp(self, parserConfig):
+        entry = self.__entries.get(parserConfig, None)
+        if entry is None:
+            return None
+        return entry[0]
@@ -116,6 +116,11 @@ class RMParserThread(Thread):
     def simulateProgram(self, programId):
         self.__simulator.simulateProgram(programId)
 
+    def getNextRunTimestamp(self):
+        if self.__parserManager is None:
+            return None
+        return self.__parserManager.getNextRunTimestamp()
+
     #----------------------------------------------------------------------------------------
     #
     #
@@ -177,6 +182,8 @@ class RMParserThread(Thread):
     #
     #
     def __postRun(self):
+        if self.__parserManager:
+            self.__parserManager.stop()
 
         self.__simulator = None
         self.__parserManager = None
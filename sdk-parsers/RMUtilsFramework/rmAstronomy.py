@@ -0,0 +1,119 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+import math
+import calendar
+from datetime import datetime
+
+from RMFormulaFramework.rmRadiation import rmComputeRadiation
+
+#----------------------------------------------------------------------------------------
+# Astronomical values that only depend on the location: extraterrestrial and clear-sky
+# radiation per day of year (used by the ET formulas) and the solar transit and sunrise
+# hour angle per UTC day (used by the sunrise/sunset utilities).
+#
+# Radiation days are computed the first time they are asked for (or all at once by build()),
+# the sun table is built a whole UTC year at a time. Both use the same math as the per call
+# code so the results are identical.
+#
+class RMAstronomyTable:
+    MaxSunYears = 3 # UTC years kept in the sun table
+
+    def __init__(self, latitude, longitude = None, elevation = None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elevation = elevation
+
+        self.__radiation = [None] * 367 # day of year -> (Dr, declination, omegas, Ra, Rso)
+        self.__sunDays = {} # UTC day number -> (Jtr, w0)
+        self.__sunYears = set()
+
+    def build(self, timestamp = None):
+        ### Fills the radiation table and the sun table of the UTC year of timestamp (if the location is complete).
+        for dayOfYear in xrange(1, 367):
+            self.getRadiation(dayOfYear)
+        if timestamp is not None and self.longitude is not None and self.elevation is not None:
+            self.getSunTransit(timestamp)
+
+    def getRadiation(self, dayOfYear):
+        ### Returns (Dr, declination, sunset hour angle, Ra, Rso) for the day of year (1 - 366).
+        index = int(dayOfYear)
+        if index != dayOfYear or index < 1 or index > 366:
+            return rmComputeRadiation(dayOfYear, self.latitude, self.elevation)
+
+        entry = self.__radiation[index]
+        if entry is None:
+            entry = self.__radiation[index] = rmComputeRadiation(float(index), self.latitude, self.elevation)
+        return entry
+
+    def getExtraterrestrialRadiation(self, dayOfYear):
+        return self.getRadiation(dayOfYear)[3]
+
+    def getClearSkyRadiation(self, dayOfYear):
+        return self.getRadiation(dayOfYear)[4]
+
+    def getSunTransit(self, timestamp):
+        ### Returns (Jtr, w0) for the UTC day of timestamp: the julian day of the solar transit and the sunrise
+        ### hour angle in degrees. Same as computeSuntransitAndDayLenghtForDayTs(timestamp, lat, -lon, elevation).
+        dayNumber = int(timestamp // 86400)
+        entry = self.__sunDays.get(dayNumber, None)
+        if entry is None:
+            # From the days just built: parsers run on several threads and another build can reset the table
+            entry = self.__buildSunYear(dayNumber)[dayNumber]
+        return entry
+
+    def getSolarTransitTimestamp(self, timestamp):
+        from RMUtilsFramework.rmTimeUtils import julianDayToUTC
+        return julianDayToUTC(self.getSunTransit(timestamp)[0])
+
+    def getDayLength(self, timestamp):
+        ### Hours between sunrise and sunset.
+        return 2.0 * self.getSunTransit(timestamp)[1] / 15.0
+
+    def __buildSunYear(self, dayNumber):
+        from RMUtilsFramework.rmTimeUtils import computeSuntransitAndDayLenghtForDayTs
+
+        year = datetime.utcfromtimestamp(dayNumber * 86400).year
+        firstDay = calendar.timegm((year, 1, 1, 0, 0, 0)) // 86400
+        lastDay = calendar.timegm((year + 1, 1, 1, 0, 0, 0)) // 86400
+
+        sunDays = {}
+        for day in xrange(firstDay, lastDay):
+            sunDays[day] = computeSuntransitAndDayLenghtForDayTs(day * 86400, self.latitude, -self.longitude, self.elevation)
+
+        if len(self.__sunYears) >= RMAstronomyTable.MaxSunYears:
+            self.__sunDays = {}
+            self.__sunYears = set()
+
+        self.__sunDays.update(sunDays)
+        self.__sunYears.add(year)
+        return sunDays
+
+#----------------------------------------------------------------------------------------
+# Tables of the last used locations. A table is built once for a location, callers that
+# don't know the longitude (ET formulas) share the table of the location if there is one.
+#
+__tables = {}
+__maxTables = 4
+
+def rmGetAstronomyTable(latitude, longitude = None, elevation = None):
+    key = (latitude, longitude, elevation)
+    table = __tables.get(key, None)
+    if table is not None:
+        return table
+
+    if longitude is None:
+        for table in __tables.values():
+            if table.latitude == latitude and table.elevation == elevation:
+                return table
+
+    table = RMAstronomyTable(latitude, longitude, elevation)
+    if len(__tables) >= __maxTables:
+        __tables.clear()
+    __tables[key] = table
+    return table
+
+def rmClearAstronomyTables():
+    __tables.clear()
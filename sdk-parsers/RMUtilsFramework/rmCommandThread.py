@@ -4,7 +4,7 @@
 #          Codrin Juravle <codrin.juravle@mini-box.com>
 
 
-import os
+import os, time
 import thread
 from threading import Thread, Event
 from Queue import Queue, Empty
@@ -27,6 +27,7 @@ class RMCommand:
         self.kwargs = None
 
         self.result = None
+        self.submitTimestamp = None
 
         self.event = None
         if synch:
@@ -79,6 +80,8 @@ class RMCommandThread(Thread):
         self.waitTimeout = 3600
         self.messageQueue = Queue()
 
+        self.resetStats()
+
     #----------------------------------------------------------------------------------------
     #
     #
@@ -91,15 +94,30 @@ class RMCommandThread(Thread):
     #
     #
     def executeCommand(self, command):
-        log.debug("Schedule execute command: %s" % `command.name`)
-        log.debug(command)
+        command.submitTimestamp = time.time()
         self.messageQueue.put(command)
         if command.event:
             command.wait()
-            log.debug(command)
-            log.debug("Command finished %s" % `command.name`)
             return command.result
 
+    #----------------------------------------------------------------------------------------
+    # Counters used to measure the cost of going through the command thread: the time
+    # commands spend queued (including the thread wake-up) and the time they run.
+    #
+    def resetStats(self):
+        self.commandCount = 0
+        self.commandWaitTime = 0.0
+        self.commandRunTime = 0.0
+
+    def getStats(self):
+        return {
+            "commands": self.commandCount,
+            "waitTime": self.commandWaitTime,
+            "runTime": self.commandRunTime,
+            "averageWaitTime": self.commandWaitTime / max(1, self.commandCount),
+            "averageRunTime": self.commandRunTime / max(1, self.commandCount)
+        }
+
     #----------------------------------------------------------------------------------------
     #
     #
@@ -198,7 +216,8 @@ class RMCommandThread(Thread):
         return True
 
     def doExecuteCommand(self, command):
-        log.debug(command.name)
+        log.debug("Execute command %s" % command.name)
+        startTimestamp = time.time()
         try:
             if command.args is None and command.kwargs is None:
                 command.result = command.command()
@@ -212,4 +231,10 @@ class RMCommandThread(Thread):
             log.error(command.name)
             log.error(e)
 
+        endTimestamp = time.time()
+        self.commandCount += 1
+        self.commandRunTime += endTimestamp - startTimestamp
+        if command.submitTimestamp is not None:
+            self.commandWaitTime += startTimestamp - command.submitTimestamp
+
         command.notifyFinished()
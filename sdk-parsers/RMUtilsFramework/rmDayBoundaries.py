@@ -0,0 +1,161 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+import os
+import time
+import calendar
+from bisect import bisect_right
+
+from RMUtilsFramework.rmTimeZoneRules import RMTimeZoneTransitions, rmParseTimeZoneRule, rmGetTimeZoneTransitions
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#----------------------------------------------------------------------------------------
+# Local day boundaries for a time zone. The UTC offset changes (DST transitions) between
+# MinYear and MaxYear are computed once, a start of day is then found with a binary search
+# in the transitions instead of going through datetime/strftime("%s").
+#
+# The zone is a POSIX TZ rule or a rmTimeZoneDB zone name (see rmTimeZoneRules). Without one,
+# the transitions are read from the C library local time (TZ zone files, /etc/localtime).
+#
+class RMDayBoundaries:
+    MinYear = RMTimeZoneTransitions.FirstYear
+    MaxYear = RMTimeZoneTransitions.LastYear
+
+    def __init__(self, tzString = None):
+        self.tzString = tzString
+        self.minTimestamp = calendar.timegm((RMDayBoundaries.MinYear, 1, 1, 0, 0, 0)) + 86400
+        self.maxTimestamp = calendar.timegm((RMDayBoundaries.MaxYear + 1, 1, 1, 0, 0, 0)) - 86400
+
+        zoneTransitions = rmGetTimeZoneTransitions(tzString) if tzString else None
+        if zoneTransitions is not None:
+            self.transitions = zoneTransitions.transitions
+            self.offsets = zoneTransitions.offsets
+        else:
+            self.__buildFromLocalTime()
+
+        if numpy is not None:
+            self.__transitionsArray = numpy.array(self.transitions, dtype = numpy.int64)
+            self.__offsetsArray = numpy.array(self.offsets, dtype = numpy.int64)
+
+    def getUtcOffset(self, timestamp):
+        ### Seconds east of UTC in effect at timestamp.
+        return self.offsets[bisect_right(self.transitions, timestamp) - 1]
+
+    def getStartOfDay(self, timestamp):
+        ### UTC timestamp of the local midnight that starts the day of timestamp, None if timestamp is out
+        ### of the table range.
+        if not self.minTimestamp <= timestamp < self.maxTimestamp:
+            return None
+
+        transitions = self.transitions
+        offsets = self.offsets
+
+        timestamp = int(timestamp // 1)
+        offset = offsets[bisect_right(transitions, timestamp) - 1]
+        localTimestamp = timestamp + offset
+        localDayTimestamp = localTimestamp - localTimestamp % 86400
+        dayTimestamp = localDayTimestamp - offset
+
+        # A transition between midnight and timestamp
+        index = bisect_right(transitions, dayTimestamp) - 1
+        if offsets[index] != offset:
+            dayTimestamp = localDayTimestamp - offsets[index]
+            index = bisect_right(transitions, dayTimestamp) - 1
+
+        # Midnight repeated by a transition back, the day starts at the first one
+        if index > 0:
+            earlierTimestamp = localDayTimestamp - offsets[index - 1]
+            if earlierTimestamp < transitions[index] and earlierTimestamp < dayTimestamp:
+                dayTimestamp = earlierTimestamp
+        return dayTimestamp
+
+    def getStartOfDays(self, timestamps):
+        ### getStartOfDay() for a list of timestamps, returns a list.
+        if numpy is None or len(timestamps) < 16:
+            getStartOfDay = self.getStartOfDay
+            return [getStartOfDay(timestamp) for timestamp in timestamps]
+
+        values = numpy.floor(numpy.asarray(timestamps, dtype = numpy.float64)).astype(numpy.int64)
+        outOfRange = (values < self.minTimestamp) | (values >= self.maxTimestamp)
+
+        transitions = self.__transitionsArray
+        offsets = self.__offsetsArray
+
+        offset = offsets[numpy.searchsorted(transitions, values, "right") - 1]
+        localTimestamps = values + offset
+        localDayTimestamps = localTimestamps - localTimestamps % 86400
+        dayTimestamps = localDayTimestamps - offset
+
+        index = numpy.searchsorted(transitions, dayTimestamps, "right") - 1
+        midnightOffset = offsets[index]
+        dayTimestamps = localDayTimestamps - midnightOffset
+        index = numpy.searchsorted(transitions, dayTimestamps, "right") - 1
+
+        earlierTimestamps = localDayTimestamps - offsets[numpy.maximum(index - 1, 0)]
+        earlier = (index > 0) & (earlierTimestamps < transitions[index]) & (earlierTimestamps < dayTimestamps)
+        dayTimestamps = numpy.where(earlier, earlierTimestamps, dayTimestamps)
+
+        result = dayTimestamps.tolist()
+        if outOfRange.any():
+            for index in numpy.nonzero(outOfRange)[0].tolist():
+                result[index] = None
+        return result
+
+    def __buildFromLocalTime(self):
+        ### Samples the C library UTC offset every day and looks for the exact second where it changes.
+        localOffset = lambda timestamp: calendar.timegm(time.localtime(timestamp)) - timestamp
+
+        timestamp = self.minTimestamp - 86400
+        offset = localOffset(timestamp)
+        self.transitions = [RMTimeZoneTransitions.FirstTransition]
+        self.offsets = [offset]
+
+        while timestamp < self.maxTimestamp + 86400:
+            nextTimestamp = timestamp + 86400
+            nextOffset = localOffset(nextTimestamp)
+            if nextOffset != offset:
+                low, high = timestamp, nextTimestamp
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if localOffset(middle) == offset:
+                        low = middle
+                    else:
+                        high = middle
+                self.transitions.append(high)
+                self.offsets.append(nextOffset)
+                offset = nextOffset
+            timestamp = nextTimestamp
+
+#----------------------------------------------------------------------------------------
+# Day boundaries of the process time zone (the TZ environment variable). Rebuilt when TZ
+# changes or after rmResetDayBoundaries().
+#
+__dayBoundaries = None
+__environ = getattr(os.environ, "data", os.environ) # the plain dict behind os.environ, much faster to read
+
+def rmGetDayBoundaries():
+    global __dayBoundaries
+
+    tzString = __environ.get("TZ", None)
+    dayBoundaries = __dayBoundaries
+    if dayBoundaries is None or dayBoundaries.tzString != tzString:
+        rule = rmParseTimeZoneRule(tzString) if tzString else None
+        if rule is None or (rule.hasDst() and not rule.hasTransitionRules()):
+            # Zone names are zone files for the C library (with their history, unlike the rmTimeZoneDB rules),
+            # "EST5EDT" is also the name of a zone file which the C library prefers over the rule
+            dayBoundaries = RMDayBoundaries(None)
+            dayBoundaries.tzString = tzString
+        else:
+            dayBoundaries = RMDayBoundaries(tzString)
+        __dayBoundaries = dayBoundaries
+    return dayBoundaries
+
+def rmResetDayBoundaries():
+    global __dayBoundaries
+    __dayBoundaries = None
@@ -0,0 +1,338 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+import os, time, json
+import hashlib
+import httplib, urllib2
+from email.utils import parsedate_tz, mktime_tz
+from StringIO import StringIO
+from threading import Lock
+
+from RMUtilsFramework.rmLogging import log
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMHttpCacheEntry:
+    def __init__(self, key, url):
+        self.key = key
+        self.url = url
+        self.headers = ""
+        self.etag = None
+        self.lastModified = None
+        self.expires = 0
+        self.size = 0
+        self.lastAccess = 0
+
+    def __repr__(self):
+        return "(" + \
+                "url=" + `self.url` + \
+                ", etag=" + `self.etag` + \
+                ", lastModified=" + `self.lastModified` + \
+                ", expires=" + `self.expires` + \
+                ", size=" + `self.size` + \
+                ")"
+
+    def isFresh(self, now):
+        return self.expires > now
+
+    def toDict(self):
+        return self.__dict__.copy()
+
+    @staticmethod
+    def fromDict(data):
+        entry = RMHttpCacheEntry(data["key"], data["url"])
+        entry.__dict__.update(data)
+        return entry
+
+#----------------------------------------------------------------------------------------
+# On disk cache for parser downloads. Responses carrying validators (ETag/Last-Modified)
+# or an explicit lifetime (Cache-Control max-age/Expires) are stored. Fresh entries are
+# served without touching the network, stale ones are revalidated with a conditional GET.
+#
+class RMHttpCache:
+    def __init__(self, maxSize = 16 * 1024 * 1024, maxEntrySize = 4 * 1024 * 1024):
+        self.maxSize = maxSize
+        self.maxEntrySize = maxEntrySize
+
+        self.directory = None
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+        self.bytesSaved = 0
+
+        self.__lock = Lock()
+        self.__entries = {}
+        self.__totalSize = 0
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def enable(self, directory):
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        except Exception, e:
+            log.error("Cannot create HTTP cache directory %s" % directory)
+            log.exception(e)
+            return False
+
+        with self.__lock:
+            self.directory = directory
+            self.__loadIndex()
+        return True
+
+    def clear(self):
+        with self.__lock:
+            for key in self.__entries.keys():
+                self.__removeEntry(key)
+            self.__saveIndex()
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def open(self, request, openFunction):
+        ### Opens request through openFunction(request), answering from the cache when possible.
+        if not self.enabled or request.get_method() != "GET" or request.get_type() not in ("http", "https"):
+            return openFunction(request)
+
+        url = request.get_full_url()
+        key = self.__makeKey(request)
+        now = time.time()
+
+        with self.__lock:
+            entry = self.__entries.get(key, None)
+
+        if entry is not None:
+            if entry.isFresh(now):
+                body = self.__readBody(entry)
+                if body is not None:
+                    self.hits += 1
+                    self.bytesSaved += entry.size
+                    return self.__touch(entry, None, body)
+            if entry.etag:
+                request.add_unredirected_header("If-None-Match", entry.etag)
+            if entry.lastModified:
+                request.add_unredirected_header("If-Modified-Since", entry.lastModified)
+
+        try:
+            response = openFunction(request)
+        except urllib2.HTTPError, e:
+            if e.code == 304 and entry is not None:
+                e.close()
+                body = self.__readBody(entry)
+                if body is not None:
+                    self.revalidated += 1
+                    self.bytesSaved += entry.size
+                    return self.__touch(entry, e.info(), body)
+            raise
+
+        self.misses += 1
+        if response.code != 200:
+            return response
+
+        headers = response.info()
+        expires = self.__getExpiration(headers, now)
+        etag = headers.getheader("ETag")
+        lastModified = headers.getheader("Last-Modified")
+
+        if expires is None or (expires <= now and not etag and not lastModified):
+            if entry is not None:
+                with self.__lock:
+                    self.__removeEntry(key)
+                    self.__saveIndex()
+            return response
+
+        # Only bodies that can be checked for completeness are stored: a Content-Length to compare
+        # with or a chunked transfer (a truncated one fails to read). Others are passed through.
+        contentLength = headers.getheader("Content-Length")
+        if "chunked" in (headers.getheader("Transfer-Encoding") or "").lower():
+            contentLength = None
+        elif contentLength and contentLength.strip().isdigit():
+            contentLength = int(contentLength)
+            if contentLength > self.maxEntrySize:
+                return response
+        else:
+            return response
+
+        body = response.read()
+        response.close()
+        if contentLength is not None and len(body) != contentLength:
+            log.warning("HTTP cache: incomplete response for %s (%d of %d bytes), not stored" % (url, len(body), contentLength))
+        elif len(body) <= self.maxEntrySize:
+            entry = RMHttpCacheEntry(key, url)
+            entry.headers = "".join(headers.headers)
+            entry.etag = etag
+            entry.lastModified = lastModified
+            entry.expires = expires
+            self.__store(entry, body)
+
+        return self.__makeResponse(url, headers, body)
+
+    def getStats(self):
+        return {
+            "entries": len(self.__entries),
+            "size": self.__totalSize,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "bytesSaved": self.bytesSaved
+        }
+
+    def dumpStats(self):
+        if self.enabled:
+            log.debug("HTTP cache: %s" % self.getStats())
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def __makeKey(self, request):
+        # Parsers pass API keys/tokens in headers, so they are part of the key as well as the URL
+        headers = sorted((name.title(), value) for name, value in request.header_items() if not name.title().startswith("If-"))
+        return hashlib.sha1(request.get_full_url() + `headers`).hexdigest()
+
+    def __getExpiration(self, headers, now):
+        ### Returns the expiration timestamp or None if the response must not be stored.
+        cacheControl = {}
+        for directive in (headers.getheader("Cache-Control") or "").split(","):
+            directive = directive.strip().lower()
+            if directive:
+                name, sep, value = directive.partition("=")
+                cacheControl[name.strip()] = value.strip().strip('"')
+
+        if "no-store" in cacheControl or (headers.getheader("Vary") or "").strip() == "*":
+            return None
+
+        if "no-cache" in cacheControl:
+            return now
+
+        age = headers.getheader("Age")
+        age = int(age) if age and age.isdigit() else 0
+
+        maxAge = cacheControl.get("max-age", None)
+        if maxAge is not None:
+            try:
+                return now + int(maxAge) - age
+            except ValueError:
+                return now
+
+        expires = headers.getheader("Expires")
+        if expires:
+            parsed = parsedate_tz(expires)
+            return mktime_tz(parsed) if parsed else now
+
+        return now
+
+    def __makeResponse(self, url, headers, body):
+        response = urllib2.addinfourl(StringIO(body), headers, url, 200)
+        response.msg = "OK"
+        return response
+
+    def __touch(self, entry, newHeaders, body):
+        now = time.time()
+        headers = httplib.HTTPMessage(StringIO(entry.headers))
+        with self.__lock:
+            entry.lastAccess = now
+            if newHeaders is not None:
+                # A 304 carries the updated freshness information
+                expires = self.__getExpiration(newHeaders, now)
+                entry.expires = expires if expires is not None else now
+                entry.etag = newHeaders.getheader("ETag") or entry.etag
+                entry.lastModified = newHeaders.getheader("Last-Modified") or entry.lastModified
+                self.__saveIndex()
+
+        return self.__makeResponse(entry.url, headers, body)
+
+    def __readBody(self, entry):
+        try:
+            with open(os.path.join(self.directory, entry.key), "rb") as f:
+                return f.read()
+        except Exception, e:
+            log.debug("HTTP cache: missing body for %s" % entry.url)
+            with self.__lock:
+                self.__removeEntry(entry.key)
+        return None
+
+    def __store(self, entry, body):
+        entry.size = len(body)
+        entry.lastAccess = time.time()
+        try:
+            path = os.path.join(self.directory, entry.key)
+            with open(path + ".tmp", "wb") as f:
+                f.write(body)
+            os.rename(path + ".tmp", path)
+        except Exception, e:
+            log.error("HTTP cache: cannot store %s" % entry.url)
+            log.exception(e)
+            return
+
+        with self.__lock:
+            self.__removeEntry(entry.key, False)
+            self.__entries[entry.key] = entry
+            self.__totalSize += entry.size
+            self.__evict()
+            self.__saveIndex()
+
+    def __evict(self):
+        if self.__totalSize <= self.maxSize:
+            return
+        for entry in sorted(self.__entries.values(), key = lambda entry: entry.lastAccess):
+            if self.__totalSize <= self.maxSize:
+                break
+            self.__removeEntry(entry.key)
+            self.evicted += 1
+
+    def __removeEntry(self, key, removeFile = True):
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return
+        self.__totalSize -= entry.size
+        if removeFile:
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except OSError:
+                pass
+
+    def __loadIndex(self):
+        self.__entries = {}
+        self.__totalSize = 0
+        try:
+            path = os.path.join(self.directory, "index.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    for data in json.load(f):
+                        entry = RMHttpCacheEntry.fromDict(dict((str(name), value) for name, value in data.items()))
+                        if isinstance(entry.url, unicode):
+                            entry.url = entry.url.encode("utf-8")
+                        if isinstance(entry.headers, unicode):
+                            entry.headers = entry.headers.encode("utf-8")
+                        self.__entries[entry.key] = entry
+                        self.__totalSize += entry.size
+            self.__evict()
+        except Exception, e:
+            log.error("HTTP cache: cannot load index, starting with an empty cache")
+            log.exception(e)
+            self.__entries = {}
+            self.__totalSize = 0
+
+    def __saveIndex(self):
+        try:
+            path = os.path.join(self.directory, "index.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump([entry.toDict() for entry in self.__entries.values()], f)
+            os.rename(path + ".tmp", path)
+        except Exception, e:
+            log.error("HTTP cache: cannot save index")
+            log.exception(e)
+
+
+globalHttpCache = RMHttpCache()
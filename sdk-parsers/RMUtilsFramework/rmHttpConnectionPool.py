@@ -0,0 +1,246 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+import time
+import socket, ssl
+import httplib, urllib2
+from threading import Lock
+
+from RMUtilsFramework.rmLogging import log
+
+#----------------------------------------------------------------------------------------
+# Per host diagnostics counters.
+#
+class RMHttpHostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.connectionsOpened = 0
+        self.connectionsReused = 0
+        self.connectionsDiscarded = 0
+        self.lastLatency = 0
+        self.totalLatency = 0
+
+    def __repr__(self):
+        return "(" + \
+                "requests=" + `self.requests` + \
+                ", errors=" + `self.errors` + \
+                ", opened=" + `self.connectionsOpened` + \
+                ", reused=" + `self.connectionsReused` + \
+                ", discarded=" + `self.connectionsDiscarded` + \
+                ", lastLatency=" + ("%.3f" % self.lastLatency) + \
+                ", averageLatency=" + ("%.3f" % self.averageLatency) + \
+                ")"
+
+    @property
+    def averageLatency(self):
+        if self.requests == 0:
+            return 0
+        return self.totalLatency / self.requests
+
+    def toDict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connectionsOpened": self.connectionsOpened,
+            "connectionsReused": self.connectionsReused,
+            "connectionsDiscarded": self.connectionsDiscarded,
+            "lastLatency": self.lastLatency,
+            "averageLatency": self.averageLatency
+        }
+
+#----------------------------------------------------------------------------------------
+# HTTPResponse adapter that gives the connection back to the pool once the body was
+# completely read, or drops it if the response was closed half way.
+#
+class RMPooledResponse:
+    def __init__(self, pool, key, connection, response):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.fp = response # kept under this name so deadline handling can reach the socket
+        self.released = False
+
+    def read(self, amt = None):
+        try:
+            data = self.fp.read(amt)
+        except Exception, e:
+            self.__release(False)
+            raise
+        if self.fp.isclosed():
+            self.__release(True)
+        return data
+
+    recv = read
+
+    def close(self):
+        self.__release(self.fp.isclosed())
+        self.fp.close()
+
+    def __release(self, reusable):
+        if self.released:
+            return
+        self.released = True
+        self.pool.release(self.key, self.connection, reusable and not self.fp.will_close)
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMHttpConnectionPool:
+    def __init__(self, maxIdlePerHost = 2, idleTimeout = 15):
+        self.maxIdlePerHost = maxIdlePerHost
+        self.idleTimeout = idleTimeout # seconds, most servers drop idle keep-alive connections soon after
+
+        self.__lock = Lock()
+        self.__idle = {} # (scheme, host, verified) -> [(connection, lastUsedTimestamp), ...]
+        self.__stats = {} # scheme://host -> RMHttpHostStats
+        self.__openers = {}
+
+    def open(self, request, timeout = 60, context = None):
+        ### Opens an urllib2 request. http and https go through pooled keep-alive connections,
+        ### all other schemes (ftp, file) use the default urllib2 handlers.
+        return self.__getOpener(context).open(request, timeout = timeout)
+
+    def acquire(self, key, connectionFactory, timeout):
+        now = time.time()
+        with self.__lock:
+            connections = self.__idle.get(key, [])
+            while connections:
+                connection, lastUsed = connections.pop()
+                if now - lastUsed < self.idleTimeout and connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                    self.getStats(key).connectionsReused += 1
+                    return connection, True
+                connection.close()
+            self.getStats(key).connectionsOpened += 1
+
+        return connectionFactory(), False
+
+    def release(self, key, connection, reusable):
+        with self.__lock:
+            if reusable and connection.sock is not None:
+                connections = self.__idle.setdefault(key, [])
+                if len(connections) < self.maxIdlePerHost:
+                    connections.append((connection, time.time()))
+                    return
+            self.getStats(key).connectionsDiscarded += 1
+        connection.close()
+
+    def clear(self):
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = {}
+        for connections in idle.values():
+            for connection, lastUsed in connections:
+                connection.close()
+
+    def getStats(self, key = None):
+        if key is None:
+            return dict((host, stats.toDict()) for host, stats in self.__stats.items())
+
+        host = "%s://%s" % (key[0], key[1])
+        stats = self.__stats.get(host, None)
+        if stats is None:
+            stats = self.__stats[host] = RMHttpHostStats()
+        return stats
+
+    def recordRequest(self, key, latency, failed):
+        with self.__lock:
+            stats = self.getStats(key)
+            stats.requests += 1
+            stats.lastLatency = latency
+            stats.totalLatency += latency
+            if failed:
+                stats.errors += 1
+
+    def dumpStats(self):
+        for host, stats in self.__stats.items():
+            log.debug("HTTP pool %s: %s" % (host, stats))
+
+    def __getOpener(self, context):
+        verified = context is None
+        opener = self.__openers.get(verified, None)
+        if opener is None:
+            opener = urllib2.build_opener(RMPooledHTTPHandler(self), RMPooledHTTPSHandler(self, context))
+            self.__openers[verified] = opener
+        return opener
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMPooledHandlerMixin:
+
+    def doPooledOpen(self, scheme, connectionFactory, req, verified = True):
+        if req._tunnel_host:
+            # Proxy tunnels are kept out of the pool
+            return self.do_open(connectionFactory, req)
+
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers["Connection"] = "keep-alive"
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        key = (scheme, host, verified)
+        startTimestamp = time.time()
+
+        connection, reused = self.pool.acquire(key, lambda: connectionFactory(host, timeout = req.timeout), req.timeout)
+        try:
+            try:
+                response = self.__request(connection, req, headers)
+            except (httplib.HTTPException, socket.error), e:
+                if not reused or req.has_data():
+                    raise
+                # The server dropped the idle connection, retry once on a fresh one
+                connection.close()
+                connection, reused = self.pool.acquire(key, lambda: connectionFactory(host, timeout = req.timeout), req.timeout)
+                response = self.__request(connection, req, headers)
+        except Exception, e:
+            connection.close()
+            self.pool.recordRequest(key, time.time() - startTimestamp, True)
+            if isinstance(e, socket.error):
+                raise urllib2.URLError(e)
+            raise
+
+        self.pool.recordRequest(key, time.time() - startTimestamp, False)
+
+        pooled = RMPooledResponse(self.pool, key, connection, response)
+        fp = socket._fileobject(pooled, close = True)
+
+        resp = urllib2.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+    def __request(self, connection, req, headers):
+        connection.request(req.get_method(), req.get_selector(), req.data, headers)
+        return connection.getresponse(buffering = True)
+
+class RMPooledHTTPHandler(RMPooledHandlerMixin, urllib2.HTTPHandler):
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        return self.doPooledOpen("http", httplib.HTTPConnection, req)
+
+class RMPooledHTTPSHandler(RMPooledHandlerMixin, urllib2.HTTPSHandler):
+    def __init__(self, pool, context = None):
+        urllib2.HTTPSHandler.__init__(self, context = context)
+        self.pool = pool
+        self.context = context
+
+    def https_open(self, req):
+        factory = lambda host, timeout: httplib.HTTPSConnection(host, timeout = timeout, context = self.context)
+        return self.doPooledOpen("https", factory, req, self.context is None)
+
+
+globalHttpConnectionPool = RMHttpConnectionPool()
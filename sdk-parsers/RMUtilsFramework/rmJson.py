@@ -13,6 +13,24 @@ def rmJsonParseString(s):
     return __rmConvertJsonData(data)
 
 
+def rmJsonIterList(items, convert = None):
+    ### Yields the JSON of the list of items (convert(item) if given) piece by piece, so a generator
+    ### can be written to a stream without building the whole list or text.
+    yield "["
+    separator = ""
+    for item in items:
+        if convert is not None:
+            item = convert(item)
+        yield separator + json.dumps(item)
+        separator = ","
+    yield "]"
+
+
+def rmJsonConvertData(data):
+    ### Converts the unicode strings of json.loads() output to utf-8 str, as rmJsonParseString() does.
+    return __rmConvertJsonData(data)
+
+
 def __rmConvertJsonData(data):
     if data is None:
         return None
@@ -0,0 +1,207 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+
+import time
+from threading import Thread, Event, Lock
+from Queue import Queue
+
+from RMUtilsFramework.rmLogging import log
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMThreadPoolTask:
+
+    def __init__(self, name, command, args = None, kwargs = None, timeout = None):
+        self.name = name
+
+        self.command = command
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout # seconds, counted from the moment the task starts running
+
+        self.result = None
+        self.exception = None
+
+        self.submitTimestamp = time.time()
+        self.startTimestamp = None
+        self.endTimestamp = None
+
+        self.cancelled = False
+        self.timedOut = False
+
+        self.event = Event()
+
+    def __repr__(self):
+        return "(" + \
+                "name=" + `self.name` + \
+                ", elapsed=" + `self.elapsed` + \
+                ", timedOut=" + `self.timedOut` + \
+                ", cancelled=" + `self.cancelled` + \
+                ")"
+
+    @property
+    def finished(self):
+        return self.event.isSet()
+
+    @property
+    def elapsed(self):
+        if self.startTimestamp is None:
+            return None
+        if self.endTimestamp is None:
+            return time.time() - self.startTimestamp
+        return self.endTimestamp - self.startTimestamp
+
+    def execute(self):
+        self.startTimestamp = time.time()
+        try:
+            if self.args is None and self.kwargs is None:
+                self.result = self.command()
+            elif self.kwargs is None:
+                self.result = self.command(*self.args)
+            elif self.args is None:
+                self.result = self.command(**self.kwargs)
+            else:
+                self.result = self.command(*self.args, **self.kwargs)
+        except Exception, e:
+            log.error("Thread pool task %s failed" % `self.name`)
+            log.exception(e)
+            self.exception = e
+
+        self.endTimestamp = time.time()
+        self.event.set()
+
+    def wait(self, pollInterval = 0.5, pollCallback = None):
+        ### Blocks until the task finished or its deadline expired. Returns True if the task finished in time.
+        ### pollCallback is called every pollInterval seconds while waiting (e.g. to keep a thread watcher updated).
+        while not self.event.wait(pollInterval):
+            if pollCallback is not None:
+                pollCallback()
+
+            if self.timeout is None:
+                continue
+
+            now = time.time()
+            if self.startTimestamp is None:
+                # Still queued: give up if it didn't even get a worker in its whole time budget.
+                if now - self.submitTimestamp >= self.timeout:
+                    self.cancelled = True
+                    return self.event.isSet()
+            elif now - self.startTimestamp >= self.timeout:
+                self.timedOut = True
+                return self.event.isSet()
+
+        return True
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMThreadPoolWorker(Thread):
+
+    def __init__(self, pool, name):
+        Thread.__init__(self, name = name)
+        self.daemon = True # An abandoned (hung) task must not keep the application alive
+
+        self.pool = pool
+        self.abandoned = False
+        self.task = None
+
+    def run(self):
+        while True:
+            task = self.pool.nextTask()
+            if task is None:
+                break
+
+            if task.cancelled:
+                continue
+
+            self.task = task
+            task.execute()
+            self.task = None
+
+            if self.abandoned:
+                log.warning("Thread pool worker %s finished abandoned task %s after %.2f seconds" % (self.name, `task.name`, task.elapsed))
+                break
+
+        self.pool.workerFinished(self)
+
+#----------------------------------------------------------------------------------------
+#
+#
+#
+class RMThreadPool:
+
+    def __init__(self, name, size = 4, maxAbandoned = None):
+        self.name = name
+        self.size = max(1, size)
+        self.maxAbandoned = maxAbandoned if maxAbandoned is not None else self.size
+
+        self.__lock = Lock()
+        self.__queue = Queue()
+        self.__workers = []
+        self.__abandonedCount = 0
+        self.__workerCounter = 0
+        self.__stopped = False
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def submit(self, name, command, args = None, kwargs = None, timeout = None):
+        task = RMThreadPoolTask(name, command, args, kwargs, timeout)
+        with self.__lock:
+            if self.__stopped:
+                return None
+            self.__ensureWorkers()
+        self.__queue.put(task)
+        return task
+
+    def abandon(self, task):
+        ### A task exceeded its deadline: leave its worker behind and start a replacement.
+        with self.__lock:
+            for worker in self.__workers:
+                if worker.task is task and not worker.abandoned:
+                    worker.abandoned = True
+                    self.__abandonedCount += 1
+                    log.warning("Thread pool %s: abandoning task %s after %s seconds" % (self.name, `task.name`, `task.timeout`))
+                    break
+            self.__ensureWorkers()
+
+    def stop(self):
+        with self.__lock:
+            self.__stopped = True
+            workerCount = len(self.__workers)
+        for i in range(workerCount):
+            self.__queue.put(None)
+
+    #----------------------------------------------------------------------------------------
+    #
+    #
+    #
+    def nextTask(self):
+        return self.__queue.get(True)
+
+    def workerFinished(self, worker):
+        with self.__lock:
+            if worker in self.__workers:
+                self.__workers.remove(worker)
+            if worker.abandoned:
+                self.__abandonedCount -= 1
+
+    def __ensureWorkers(self):
+        activeCount = len([worker for worker in self.__workers if not worker.abandoned])
+        while activeCount < self.size:
+            if len(self.__workers) >= self.size + self.maxAbandoned:
+                log.error("Thread pool %s: too many abandoned workers (%d), not starting new ones" % (self.name, self.__abandonedCount))
+                break
+
+            self.__workerCounter += 1
+            worker = RMThreadPoolWorker(self, "%s-%d" % (self.name, self.__workerCounter))
+            self.__workers.append(worker)
+            worker.start()
+            activeCount += 1
@@ -10,6 +10,8 @@ import time, calendar
 import ctypes,os, fcntl, errno
 
 from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmAstronomy import rmGetAstronomyTable
+from RMUtilsFramework.rmDayBoundaries import rmGetDayBoundaries
 
 ZERO = timedelta(0)
 Y2K38_MAX_YEAR = 2037
@@ -116,7 +118,7 @@ def rmNowToYearMonthDay():
     return d.year, d.month, d.day
 
 def rmNormalizeTimestamp(timestamp):
-    return int(datetime.fromtimestamp(timestamp).strftime('%s'))
+    return int(timestamp // 1)
 
 def rmTimestampToDayOfYear(timestamp):
     if timestamp is None:
@@ -138,8 +140,19 @@ def rmCurrentMinuteTimestamp():
     return timestamp - (timestamp % 60)
 
 def rmGetStartOfDay(timestamp):
-    tuple = datetime.fromtimestamp(timestamp).timetuple()
-    return int(datetime(tuple.tm_year, tuple.tm_mon, tuple.tm_mday).strftime("%s"))
+    dayTimestamp = rmGetDayBoundaries().getStartOfDay(timestamp)
+    if dayTimestamp is None: # out of the day boundaries table
+        tuple = datetime.fromtimestamp(timestamp).timetuple()
+        return int(datetime(tuple.tm_year, tuple.tm_mon, tuple.tm_mday).strftime("%s"))
+    return dayTimestamp
+
+def rmGetStartOfDays(timestamps):
+    ### rmGetStartOfDay() for a list of timestamps.
+    dayTimestamps = rmGetDayBoundaries().getStartOfDays(timestamps)
+    for index, dayTimestamp in enumerate(dayTimestamps):
+        if dayTimestamp is None:
+            dayTimestamps[index] = rmGetStartOfDay(timestamps[index])
+    return dayTimestamps
 
 def rmGetStartOfDayUtc(timestamp):
     tuple = datetime.utcfromtimestamp(timestamp).timetuple()
@@ -203,8 +216,9 @@ def computeSuntransitAndDayLenghtForDayTs(ts, lat, lon, elevation):
     return Jtr, w0
 
 
+# The transit and hour angle of a location are computed once per day from the location astronomy table
 def rmGetSunsetTimestampForDayTimestamp(ts, lat, lon, elevation):
-    Jtr, w0 = computeSuntransitAndDayLenghtForDayTs(ts, lat, -lon, elevation)
+    Jtr, w0 = rmGetAstronomyTable(lat, lon, elevation).getSunTransit(ts)
     Jset = Jtr+w0/360
     tsJset = julianDayToUTC(Jset)
     return  tsJset
@@ -213,7 +227,7 @@ def rmGetSunriseTimestampForDayTimestamp(ts, lat, lon, elevation):
     if lat is None or lon is None:
         log.debug("Latitude or longitude is not set. Returning same timestamp")
         return ts
-    Jtr, w0 = computeSuntransitAndDayLenghtForDayTs(ts, lat, -lon, elevation)
+    Jtr, w0 = rmGetAstronomyTable(lat, lon, elevation).getSunTransit(ts)
     Jrise = Jtr-w0/360
     tsJrise = julianDayToUTC(Jrise)
     return  tsJrise
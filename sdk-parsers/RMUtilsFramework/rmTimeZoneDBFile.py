@@ -0,0 +1,263 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+#
+# Compact timezone database, generated next to this module by timezone/__export-common-timezone.py
+# from the same zones as timezone/rmTimeZoneDB.py. The file is memory mapped on the first lookup
+# and searched in place, no dict of all the zones is built.
+#
+# Layout (little endian):
+#   header      magic "RMTZ", version, flags, zone/rule/reverse counts, section offsets
+#   zones       sorted by name: name offset, name length, rule index
+#   rules       the distinct TZ strings: string offset/length, flags, standard and DST
+#               UTC offsets (seconds east of UTC), DST transition rules offset/length
+#   reverse     zones sorted by (standard offset, DST rules, name): offset, rule index, zone index
+#   strings     all names and TZ strings, utf-8
+#
+
+import os
+import re
+import mmap
+import struct
+
+HeaderFormat = "<4sHHIIIIIII"
+ZoneFormat = "<IHH"
+RuleFormat = "<IHHiiIH"
+ReverseFormat = "<iHH"
+
+Magic = b"RMTZ"
+Version = 1
+
+RuleValid = 1 # the offsets are known (the TZ string is valid)
+RuleHasDst = 2
+
+DefaultPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rmTimeZoneDB.bin")
+
+class RMTimeZoneDBFile:
+    def __init__(self, path = None):
+        self.path = path or DefaultPath
+        self.__data = None
+
+    def open(self):
+        if self.__data is not None:
+            return
+
+        with open(self.path, "rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            except (mmap.error, ValueError):
+                data = f.read()
+
+        header = struct.unpack_from(HeaderFormat, data, 0)
+        if header[0] != Magic or header[1] != Version:
+            raise ValueError("%s is not a version %d timezone database" % (self.path, Version))
+
+        self.zoneCount, self.ruleCount, self.reverseCount = header[3:6]
+        self.__zonesOffset, self.__rulesOffset, self.__reverseOffset, self.__stringsOffset = header[6:10]
+        self.__data = data
+
+    def close(self):
+        data = self.__data
+        self.__data = None
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    def __len__(self):
+        self.open()
+        return self.zoneCount
+
+    def __contains__(self, name):
+        return self.__findZone(name) is not None
+
+    def __getitem__(self, name):
+        index = self.__findZone(name)
+        if index is None:
+            raise KeyError(name)
+        return self.__getRule(self.__getZone(index)[1])[0]
+
+    def get(self, name, default = None):
+        index = self.__findZone(name)
+        if index is None:
+            return default
+        return self.__getRule(self.__getZone(index)[1])[0]
+
+    def names(self):
+        self.open()
+        for index in xrange(self.zoneCount):
+            yield self.__getZone(index)[0]
+
+    def findZones(self, utcOffset, dstRule = None):
+        ### Zone names with the standard UTC offset (seconds east of UTC) and the DST transition rules,
+        ### ex: findZones(3600, "M3.5.0,M10.5.0/3"). dstRule "" matches the zones without DST, None any zone.
+        self.open()
+
+        # First reverse entry with the offset
+        low, high = 0, self.reverseCount
+        while low < high:
+            middle = (low + high) // 2
+            if self.__getReverse(middle)[0] < utcOffset:
+                low = middle + 1
+            else:
+                high = middle
+
+        names = []
+        for index in xrange(low, self.reverseCount):
+            offset, ruleIndex, zoneIndex = self.__getReverse(index)
+            if offset != utcOffset:
+                break
+            if dstRule is None or self.__getRule(ruleIndex)[4] == dstRule:
+                names.append(self.__getZone(zoneIndex)[0])
+        return names
+
+    def getOffsets(self, name):
+        ### (standard UTC offset, DST UTC offset or None, DST rules) of a zone, None if unknown or invalid.
+        index = self.__findZone(name)
+        if index is None:
+            return None
+        rule, flags, stdOffset, dstOffset, dstRule = self.__getRule(self.__getZone(index)[1])
+        if not flags & RuleValid:
+            return None
+        return stdOffset, (dstOffset if flags & RuleHasDst else None), dstRule
+
+    def __findZone(self, name):
+        self.open()
+        if not isinstance(name, bytes):
+            name = name.encode("utf-8")
+
+        low, high = 0, self.zoneCount
+        while low < high:
+            middle = (low + high) // 2
+            middleName = self.__getZoneName(middle)
+            if middleName < name:
+                low = middle + 1
+            elif middleName > name:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def __getString(self, offset, length):
+        start = self.__stringsOffset + offset
+        return self.__data[start:start + length]
+
+    def __getZoneName(self, index):
+        nameOffset, nameLength, ruleIndex = struct.unpack_from(ZoneFormat, self.__data, self.__zonesOffset + index * ZoneSize)
+        return self.__getString(nameOffset, nameLength)
+
+    def __getZone(self, index):
+        nameOffset, nameLength, ruleIndex = struct.unpack_from(ZoneFormat, self.__data, self.__zonesOffset + index * ZoneSize)
+        return self.__getString(nameOffset, nameLength).decode("utf-8"), ruleIndex
+
+    def __getRule(self, index):
+        ### (TZ string, flags, standard offset, DST offset, DST rules)
+        stringOffset, stringLength, flags, stdOffset, dstOffset, dstRuleOffset, dstRuleLength = \
+            struct.unpack_from(RuleFormat, self.__data, self.__rulesOffset + index * RuleSize)
+        return self.__getString(stringOffset, stringLength).decode("utf-8"), flags, stdOffset, dstOffset, \
+               self.__getString(dstRuleOffset, dstRuleLength).decode("utf-8")
+
+    def __getReverse(self, index):
+        return struct.unpack_from(ReverseFormat, self.__data, self.__reverseOffset + index * ReverseSize)
+
+HeaderSize = struct.calcsize(HeaderFormat)
+ZoneSize = struct.calcsize(ZoneFormat)
+RuleSize = struct.calcsize(RuleFormat)
+ReverseSize = struct.calcsize(ReverseFormat)
+
+#----------------------------------------------------------------------------------------
+# Standard offset, DST offset and DST transition rules of a POSIX TZ string, None if the
+# string can't be read. Offsets are in seconds east of UTC.
+#
+__ruleExpression = re.compile(r"^(<[^>]+>|[A-Za-z]{3,})([+-]?\d{1,3}(?::\d{1,2}){0,2})"
+                              r"(?:(<[^>]+>|[A-Za-z]{3,})([+-]?\d{1,3}(?::\d{1,2}){0,2})?(?:,(.*))?)?$")
+
+def __parseOffset(text):
+    sign = -1 if text.startswith("-") else 1
+    parts = [int(part) for part in text.lstrip("+-").split(":")]
+    seconds = sum(part * multiplier for part, multiplier in zip(parts, (3600, 60, 1)))
+    return -sign * seconds
+
+def rmSplitTimeZoneRule(tzString):
+    match = __ruleExpression.match(tzString or "")
+    if match is None:
+        return None
+
+    stdName, stdOffset, dstName, dstOffset, dstRule = match.groups()
+    stdOffset = __parseOffset(stdOffset)
+    if dstName is None:
+        return stdOffset, None, ""
+
+    dstOffset = __parseOffset(dstOffset) if dstOffset else stdOffset + 3600
+    return stdOffset, dstOffset, dstRule or ""
+
+#----------------------------------------------------------------------------------------
+# Writes zones ({name: TZ string}) to path.
+#
+def rmWriteTimeZoneDBFile(path, zones):
+    strings = bytearray()
+    stringOffsets = {}
+
+    def addString(text):
+        text = text.encode("utf-8")
+        offset = stringOffsets.get(text, None)
+        if offset is None:
+            offset = stringOffsets[text] = len(strings)
+            strings.extend(text)
+        return offset, len(text)
+
+    names = sorted(zones.keys(), key = lambda name: name.encode("utf-8"))
+    rules = sorted(set(zones.values()))
+    ruleIndexes = dict((rule, index) for index, rule in enumerate(rules))
+
+    zoneData = bytearray()
+    for name in names:
+        offset, length = addString(name)
+        zoneData.extend(struct.pack(ZoneFormat, offset, length, ruleIndexes[zones[name]]))
+
+    ruleData = bytearray()
+    ruleOffsets = []
+    for rule in rules:
+        offset, length = addString(rule)
+        split = rmSplitTimeZoneRule(rule)
+        if split is None:
+            flags, stdOffset, dstOffset, dstRule = 0, 0, 0, ""
+        else:
+            stdOffset, dstOffset, dstRule = split
+            flags = RuleValid | (RuleHasDst if dstOffset is not None else 0)
+            if dstOffset is None:
+                dstOffset = stdOffset
+        dstRuleOffset, dstRuleLength = addString(dstRule)
+        ruleData.extend(struct.pack(RuleFormat, offset, length, flags, stdOffset, dstOffset, dstRuleOffset, dstRuleLength))
+        ruleOffsets.append((flags, stdOffset, dstRule))
+
+    reverse = []
+    for zoneIndex, name in enumerate(names):
+        ruleIndex = ruleIndexes[zones[name]]
+        flags, stdOffset, dstRule = ruleOffsets[ruleIndex]
+        if flags & RuleValid:
+            reverse.append((stdOffset, dstRule, zoneIndex, ruleIndex))
+    reverse.sort()
+
+    reverseData = bytearray()
+    for stdOffset, dstRule, zoneIndex, ruleIndex in reverse:
+        reverseData.extend(struct.pack(ReverseFormat, stdOffset, ruleIndex, zoneIndex))
+
+    zonesOffset = HeaderSize
+    rulesOffset = zonesOffset + len(zoneData)
+    reverseOffset = rulesOffset + len(ruleData)
+    stringsOffset = reverseOffset + len(reverseData)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack(HeaderFormat, Magic, Version, 0, len(names), len(rules), len(reverse),
+                            zonesOffset, rulesOffset, reverseOffset, stringsOffset))
+        f.write(zoneData)
+        f.write(ruleData)
+        f.write(reverseData)
+        f.write(strings)
+
+#----------------------------------------------------------------------------------------
+# The database shipped next to this module, opened on the first lookup. Can be used in place
+# of the rmTimeZoneDB dict: rmTimeZoneDB["Europe/Berlin"], "Europe/Berlin" in rmTimeZoneDB.
+#
+rmTimeZoneDB = RMTimeZoneDBFile()
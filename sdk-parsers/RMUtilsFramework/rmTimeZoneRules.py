@@ -0,0 +1,358 @@
+# Copyright (c) 2014 RainMachine, Green Electronics LLC
+# All rights reserved.
+# Authors: Nicu Pavel <npavel@mini-box.com>
+#          Codrin Juravle <codrin.juravle@mini-box.com>
+
+import time
+import calendar
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from RMUtilsFramework.rmLogging import log
+from RMUtilsFramework.rmTimeZoneDBFile import rmTimeZoneDB # zone names, compact database read in place
+
+#----------------------------------------------------------------------------------------
+# POSIX TZ rule as used by the TZ environment variable and rmTimeZoneDB, ex:
+#   "CET-1CEST,M3.5.0,M10.5.0/3", "NST3:30NDT,M3.2.0,M11.1.0", "<+03>-3", "EST5EDT,0/0,J365/25"
+#
+# Offsets are stored as seconds east of UTC (the opposite sign of the TZ string).
+#
+class RMTimeZoneRule:
+    def __init__(self, tzString):
+        self.tzString = tzString
+        self.stdName = None
+        self.stdOffset = 0
+        self.dstName = None
+        self.dstOffset = None
+        self.dstStart = None # (kind, values, seconds after local midnight)
+        self.dstEnd = None
+
+        self.__parse(tzString)
+
+    def hasDst(self):
+        return self.dstName is not None
+
+    def hasTransitionRules(self):
+        return self.dstStart is not None
+
+    def getTransitions(self, year):
+        ### Returns the DST transitions of year as a sorted list of (utcTimestamp, utcOffset, isDst).
+        if not self.hasDst():
+            return []
+
+        start, end = self.dstStart, self.dstEnd
+        if start is None:
+            start, end = RMTimeZoneRule.DefaultDstStart, RMTimeZoneRule.DefaultDstEnd
+
+        # The start time is given in local standard time, the end time in local daylight time
+        transitions = [(self.__getLocalTimestamp(year, start) - self.stdOffset, self.dstOffset, True),
+                       (self.__getLocalTimestamp(year, end) - self.dstOffset, self.stdOffset, False)]
+        transitions.sort(key = lambda transition: transition[0])
+        return transitions
+
+    def getTransitionsBetween(self, firstYear, lastYear):
+        ### Transitions of all the years in [firstYear, lastYear].
+        transitions = []
+        for year in xrange(firstYear, lastYear + 1):
+            transitions.extend(self.getTransitions(year))
+        return transitions
+
+    def getOffsetBefore(self, year):
+        ### The UTC offset in effect at the beginning of year (before its first transition).
+        transitions = self.getTransitions(year)
+        if not transitions or transitions[0][2]:
+            return self.stdOffset
+        return self.dstOffset
+
+    # US rules, used by glibc when the DST part has no transition rules
+    DefaultDstStart = ("M", (3, 2, 0), 7200)
+    DefaultDstEnd = ("M", (11, 1, 0), 7200)
+
+    def __getLocalTimestamp(self, year, rule):
+        kind, values, seconds = rule
+        if kind == "J": # 1 - 365, February 29 is never counted
+            day = values - 1
+            if values >= 60 and calendar.isleap(year):
+                day += 1
+            dayNumber = calendar.timegm((year, 1, 1, 0, 0, 0)) // 86400 + day
+        elif kind == "N": # 0 - 365, February 29 is counted
+            dayNumber = calendar.timegm((year, 1, 1, 0, 0, 0)) // 86400 + values
+        else: # Mm.w.d, day d (0 Sunday) of week w (5 is the last) of month m
+            month, week, weekDay = values
+            firstWeekDay = (calendar.weekday(year, month, 1) + 1) % 7
+            day = 1 + (weekDay - firstWeekDay) % 7 + (week - 1) * 7
+            monthDays = calendar.monthrange(year, month)[1]
+            while day > monthDays:
+                day -= 7
+            dayNumber = calendar.timegm((year, month, day, 0, 0, 0)) // 86400
+        return dayNumber * 86400 + seconds
+
+    #-----------------------------------------------------------------------------------------------
+    # Parsing, raises ValueError on invalid strings
+    #
+    def __parse(self, tzString):
+        if not tzString:
+            raise ValueError("Empty TZ rule")
+
+        self.__text = tzString
+        self.__position = 0
+
+        self.stdName = self.__parseName()
+        self.stdOffset = -self.__parseTime(True)
+
+        if self.__atEnd():
+            return
+
+        self.dstName = self.__parseName()
+        if not self.__atEnd() and self.__peek() != ",":
+            self.dstOffset = -self.__parseTime(True)
+        else:
+            self.dstOffset = self.stdOffset + 3600
+
+        if self.__atEnd():
+            return
+
+        self.__expect(",")
+        self.dstStart = self.__parseRule()
+        self.__expect(",")
+        self.dstEnd = self.__parseRule()
+
+        if not self.__atEnd():
+            raise ValueError("Unexpected '%s' in TZ rule %s" % (self.__text[self.__position:], tzString))
+
+    def __atEnd(self):
+        return self.__position >= len(self.__text)
+
+    def __peek(self):
+        return self.__text[self.__position]
+
+    def __expect(self, char):
+        if self.__atEnd() or self.__peek() != char:
+            raise ValueError("Expected '%s' at %d in TZ rule %s" % (char, self.__position, self.__text))
+        self.__position += 1
+
+    def __parseName(self):
+        if not self.__atEnd() and self.__peek() == "<":
+            end = self.__text.find(">", self.__position)
+            if end < 0:
+                raise ValueError("Unterminated name in TZ rule %s" % self.__text)
+            name = self.__text[self.__position + 1:end]
+            self.__position = end + 1
+        else:
+            start = self.__position
+            while not self.__atEnd() and self.__peek().isalpha():
+                self.__position += 1
+            name = self.__text[start:self.__position]
+
+        if len(name) < 3:
+            raise ValueError("Invalid zone name at %d in TZ rule %s" % (self.__position, self.__text))
+        return name
+
+    def __parseNumber(self):
+        start = self.__position
+        while not self.__atEnd() and self.__peek().isdigit():
+            self.__position += 1
+        if start == self.__position:
+            raise ValueError("Expected a number at %d in TZ rule %s" % (start, self.__text))
+        return int(self.__text[start:self.__position])
+
+    def __parseTime(self, signed):
+        ### [+|-]hh[:mm[:ss]] as seconds.
+        sign = 1
+        if signed and not self.__atEnd() and self.__peek() in "+-":
+            if self.__peek() == "-":
+                sign = -1
+            self.__position += 1
+
+        seconds = self.__parseNumber() * 3600
+        for multiplier in (60, 1):
+            if self.__atEnd() or self.__peek() != ":":
+                break
+            self.__position += 1
+            seconds += self.__parseNumber() * multiplier
+        return sign * seconds
+
+    def __parseRule(self):
+        if self.__atEnd():
+            raise ValueError("Missing transition rule in TZ rule %s" % self.__text)
+
+        if self.__peek() == "M":
+            self.__position += 1
+            month = self.__parseNumber()
+            self.__expect(".")
+            week = self.__parseNumber()
+            self.__expect(".")
+            weekDay = self.__parseNumber()
+            if not (1 <= month <= 12 and 1 <= week <= 5 and 0 <= weekDay <= 6):
+                raise ValueError("Invalid M rule in TZ rule %s" % self.__text)
+            kind, values = "M", (month, week, weekDay)
+        elif self.__peek() == "J":
+            self.__position += 1
+            kind, values = "J", self.__parseNumber()
+            if not 1 <= values <= 365:
+                raise ValueError("Invalid J rule in TZ rule %s" % self.__text)
+        else:
+            kind, values = "N", self.__parseNumber()
+            if not 0 <= values <= 365:
+                raise ValueError("Invalid day rule in TZ rule %s" % self.__text)
+
+        seconds = 7200
+        if not self.__atEnd() and self.__peek() == "/":
+            self.__position += 1
+            seconds = self.__parseTime(True) # glibc accepts -167 to 167 hours
+
+        return kind, values, seconds
+
+#----------------------------------------------------------------------------------------
+# Returns the RMTimeZoneRule of tzString or None if it isn't a valid POSIX TZ rule.
+#
+def rmParseTimeZoneRule(tzString):
+    try:
+        return RMTimeZoneRule(tzString)
+    except Exception:
+        return None
+
+#----------------------------------------------------------------------------------------
+# A RMTimeZoneRule compiled to a sorted table of the UTC offset changes between FirstYear and
+# LastYear. UTC <-> local conversions are a binary search in the table, timestamps outside
+# it use the transitions of their year, computed once and kept.
+#
+class RMTimeZoneTransitions:
+    FirstYear = 1970
+    LastYear = 2037 # Y2K38_MAX_YEAR
+    FirstTransition = -(2 ** 62) # offset in effect before the first real transition
+
+    def __init__(self, rule, firstYear = None, lastYear = None):
+        self.rule = rule
+        self.firstYear = firstYear or RMTimeZoneTransitions.FirstYear
+        self.lastYear = lastYear or RMTimeZoneTransitions.LastYear
+        self.minTimestamp = calendar.timegm((self.firstYear, 1, 1, 0, 0, 0))
+        self.maxTimestamp = calendar.timegm((self.lastYear + 1, 1, 1, 0, 0, 0))
+
+        # The neighbouring years are included so the table is exact up to its bounds
+        self.transitions = [RMTimeZoneTransitions.FirstTransition]
+        self.offsets = [rule.getOffsetBefore(self.firstYear - 1)]
+        for transitionTimestamp, offset, isDst in rule.getTransitionsBetween(self.firstYear - 1, self.lastYear + 1):
+            self.transitions.append(transitionTimestamp)
+            self.offsets.append(offset)
+
+        self.localOffsets = sorted(set(self.offsets))
+        self.__years = {} # year out of the table -> (transitions, offsets)
+
+        if numpy is not None:
+            self.__transitionsArray = numpy.array(self.transitions, dtype = numpy.int64)
+            self.__offsetsArray = numpy.array(self.offsets, dtype = numpy.int64)
+
+    def getUtcOffset(self, timestamp):
+        ### Seconds east of UTC in effect at the UTC timestamp.
+        if self.minTimestamp <= timestamp < self.maxTimestamp:
+            return self.offsets[bisect_right(self.transitions, timestamp) - 1]
+
+        transitions, offsets = self.__getYear(time.gmtime(timestamp).tm_year)
+        return offsets[bisect_right(transitions, timestamp) - 1]
+
+    def isDst(self, timestamp):
+        return self.rule.hasDst() and self.getUtcOffset(timestamp) == self.rule.dstOffset
+
+    def utcToLocal(self, timestamp):
+        ### Local time of the UTC timestamp, as seconds since the epoch (a "local timestamp").
+        return timestamp + self.getUtcOffset(timestamp)
+
+    def localToUtc(self, localTimestamp, first = True):
+        ### UTC timestamp of a local timestamp. A local time repeated by a transition back gives the first
+        ### (or last) instant, a local time skipped by a transition forward is read with the offset before it.
+        candidates = []
+        for offset in self.localOffsets:
+            timestamp = localTimestamp - offset
+            if self.getUtcOffset(timestamp) == offset:
+                candidates.append(timestamp)
+
+        if candidates:
+            return min(candidates) if first else max(candidates)
+        return localTimestamp - self.getUtcOffset(localTimestamp - self.localOffsets[-1])
+
+    #-----------------------------------------------------------------------------------------------
+    # Batch conversions, lists in and out (numpy is used when available)
+    #
+    def getUtcOffsets(self, timestamps):
+        if numpy is None or len(timestamps) < 16:
+            getUtcOffset = self.getUtcOffset
+            return [getUtcOffset(timestamp) for timestamp in timestamps]
+
+        values = numpy.asarray(timestamps)
+        offsets = self.__offsetsArray[numpy.searchsorted(self.__transitionsArray, values, "right") - 1].tolist()
+
+        outOfRange = numpy.nonzero((values < self.minTimestamp) | (values >= self.maxTimestamp))[0]
+        for index in outOfRange.tolist():
+            offsets[index] = self.getUtcOffset(timestamps[index])
+        return offsets
+
+    def utcToLocalArray(self, timestamps):
+        return [timestamp + offset for timestamp, offset in zip(timestamps, self.getUtcOffsets(timestamps))]
+
+    def localToUtcArray(self, localTimestamps, first = True):
+        if numpy is None or len(localTimestamps) < 16:
+            return [self.localToUtc(localTimestamp, first) for localTimestamp in localTimestamps]
+
+        # The earliest instant has the largest offset
+        values = numpy.asarray(localTimestamps)
+        result = numpy.zeros(len(values), dtype = values.dtype)
+        found = numpy.zeros(len(values), dtype = bool)
+        for offset in (reversed(self.localOffsets) if first else self.localOffsets):
+            timestamps = values - offset
+            valid = ~found & (numpy.asarray(self.getUtcOffsets(timestamps)) == offset)
+            result = numpy.where(valid, timestamps, result)
+            found |= valid
+
+        result = result.tolist()
+        for index in numpy.nonzero(~found)[0].tolist():
+            result[index] = self.localToUtc(localTimestamps[index], first)
+        return result
+
+    def __getYear(self, year):
+        entry = self.__years.get(year, None)
+        if entry is None:
+            transitions = [RMTimeZoneTransitions.FirstTransition]
+            offsets = [self.rule.getOffsetBefore(year - 1)]
+            for transitionTimestamp, offset, isDst in self.rule.getTransitionsBetween(year - 1, year + 1):
+                transitions.append(transitionTimestamp)
+                offsets.append(offset)
+            entry = self.__years[year] = (transitions, offsets)
+        return entry
+
+#----------------------------------------------------------------------------------------
+# Compiled transitions of a POSIX TZ rule or of a zone name ("Europe/Berlin") from the SDK
+# timezone database, None if the zone is unknown. Compiled zones are kept for the next calls.
+#
+__compiledZones = {}
+__unknownZones = set()
+
+def rmGetTimeZoneTransitions(zone):
+    transitions = __compiledZones.get(zone, None)
+    if transitions is None:
+        if zone in __unknownZones:
+            return None
+
+        rule = rmParseTimeZoneRule(zone)
+        if rule is None:
+            try:
+                tzString = rmTimeZoneDB.get(zone, None)
+            except Exception, e:
+                log.error("Cannot read timezone database %s: %s" % (rmTimeZoneDB.path, e))
+                tzString = None
+
+            rule = rmParseTimeZoneRule(tzString)
+            if rule is None:
+                if tzString is None:
+                    log.warning("Unknown timezone %s" % `zone`)
+                else:
+                    log.warning("Timezone %s has no valid TZ rule (%s)" % (`zone`, `tzString`))
+                __unknownZones.add(zone)
+                return None
+
+        transitions = __compiledZones[zone] = RMTimeZoneTransitions(rule)
+    return transitions
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 
 from RMDataFramework.rmUserSettings import globalSettings
 from RMDatabaseFramework.rmDatabaseManager import globalDbManager
+from RMDatabaseFramework.rmDatabaseUpdate import RMDatabaseUpdate
 from RMCore.rmMainManager import RMMainManager
 from RMUtilsFramework.rmCommandThread import RMCommandThread
 from RMUtilsFramework.rmLogging import log, logvolatile
@@ -59,7 +60,10 @@ globalSettings.firstRun = not os.path.isfile(os.path.join(globalSettings.databas
 ##------------------------------------------------------------------------
 ## Global Database Descriptors
 ##
-globalDbManager.initialize(globalSettings.databasePath)
+globalDbManager.initialize(globalSettings.databasePath, globalSettings.databaseStorageProfile)
+
+if not RMDatabaseUpdate.update():
+    log.error("Database upgrade to version %d failed" % RMDatabaseUpdate.getVersions()[0])
 
 ##------------------------------------------------------------------------
 
@@ -1,9 +1,14 @@
 #!/usr/bin/python
 
 import os
+import sys
 import json
 from pytz import common_timezones
 
+# The compact database ships with the SDK (RMUtilsFramework/rmTimeZoneDB.bin)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sdk-parsers"))
+from RMUtilsFramework.rmTimeZoneDBFile import rmWriteTimeZoneDBFile, DefaultPath
+
 timezone = {}
 of = open("rmTimeZoneDB.py", "w")
 of.write("# Common Timezones for use with RainMachine and OpenWRT TZ env var\n")
@@ -22,5 +27,8 @@ of.write("}\n")
 
 json.dump(timezone, open("rmTimeZoneDB.json", "w"), indent=4, sort_keys=True)
 
+# Compact copy read in place by rmTimeZoneDBFile
+rmWriteTimeZoneDBFile(DefaultPath, timezone)
+
 
 